@@ -1 +1,53 @@
-from .proc_bigWigs import *
\ No newline at end of file
+"""
+SimpleAGA: bin signal tracks (bigWigs, bedGraphs) into a genome-wide
+(bin x track) matrix and segment it with an HMM.
+
+Submodules are only imported on first use of one of their names, so
+`import SimpleAGA` (and the `simpleaga` command line, see `cli.py`)
+doesn't pay for pandas, pyBigWig or torch until they're needed.
+"""
+import importlib
+
+# name: submodule it's imported from, on first use
+_EXPORTS = {
+    "BedGraphsBinner": "proc_bedGraphs", "collect_bedGraph_paths": "proc_bedGraphs",
+    "Metrics": "metrics", "NullMetrics": "metrics", "NULL_METRICS": "metrics",
+    "GaussianHMM": "hmm", "HMMStats": "hmm", "merge_stats": "hmm",
+    "EMTrainer": "train", "chrom_groups": "train", "observed_track_weights": "train",
+    "ObservedSegments": "segments",
+    "SegmentationWriter": "writer", "value_runs": "writer", "state_colors": "writer",
+    "QuantileSketch": "summary", "TrackSummary": "summary", "summaries_frame": "summary", "save_summaries": "summary", "load_summaries": "summary",
+    "NORMALIZATIONS": "normalize", "normalize_binned": "normalize", "summarize_values": "normalize", "quantile_reference": "normalize",
+    "TrackManifest": "manifest",
+    "DEFAULT_MAX_OPEN": "handles", "BigWigPool": "handles", "validate_bigwig_headers": "handles", "read_bigwig_chroms": "handles",
+    "BinnedWindows": "dataset", "window_rows": "dataset", "windows_loader": "dataset",
+    "RunLengthTrack": "sparse", "choose_storage": "sparse", "densify_tracks": "sparse", "missing_masks": "sparse", "sum_tracks": "sparse", "save_tracks": "sparse", "load_tracks": "sparse",
+}
+# submodules all of whose public names are exported, the later ones' first
+# (as `from .module import *` of each in this order would)
+_STAR_MODULES = ("proc_bigWigs", "binned", "missing", "cache", "pyramid")
+
+def __getattr__(name: str):
+    if name.startswith("_"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    else:
+        try:
+            # a submodule, e.g. `SimpleAGA.writer`
+            value = importlib.import_module(f".{name}", __name__)
+        except ModuleNotFoundError as error:
+            if error.name != f"{__name__}.{name}":
+                raise
+            for module_name in reversed(_STAR_MODULES):
+                module = importlib.import_module(f".{module_name}", __name__)
+                if hasattr(module, name):
+                    value = getattr(module, name)
+                    break
+            else:
+                raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    globals()[name] = value
+    return value
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -1,27 +1,196 @@
 import numpy as np
-import torch
 import pandas as pd
 
-def find_nan_runs(arr: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+def find_nan_runs(arr: np.ndarray, breaks: np.ndarray = None) -> tuple[np.ndarray, ...]:
     """
     Find indices where arr is NaN, return as separate
-    starts and ends NumPy arrays, respectively
+    starts and ends (inclusive) NumPy arrays, respectively
     credit to ChatGPT
+
+    A 2D `arr` is scanned down every column in the same pass,
+    returning (columns, starts, ends), sorted by column then start.
+    Runs are split at every row index in `breaks`, e.g. the
+    chromosome starts of a genome-wide matrix.
     """
     nan_indices = np.isnan(arr)
+    if nan_indices.ndim == 1:
+        nan_indices = nan_indices[:, np.newaxis]
 
-    # Compute differences between consecutive indices
-    diff_indices = np.diff(nan_indices.astype(int))
-
-    # Find indices where differences are 1 (indicating contiguous NaN values)
-    start_indices = np.where(diff_indices == 1)[0] + 1
-    end_indices = np.where(diff_indices == -1)[0]
+    # whether each value's previous/next one is NaN too, within the same run
+    prev_nan = np.zeros_like(nan_indices)
+    prev_nan[1:] = nan_indices[:-1]
+    next_nan = np.zeros_like(nan_indices)
+    next_nan[:-1] = nan_indices[1:]
+    if breaks is not None:
+        breaks = np.asarray(breaks)
+        breaks = breaks[(breaks > 0) & (breaks < len(nan_indices))]
+        prev_nan[breaks] = False
+        next_nan[breaks - 1] = False
 
-    # Handle cases where NaN values are at the start or end of the array
-    if nan_indices[0]:
-        start_indices = np.insert(start_indices, 0, 0)
-    if nan_indices[-1]:
-        end_indices = np.append(end_indices, len(arr) - 1)
+    # transposed so indices come out column by column
+    start_cols, start_indices = np.nonzero((nan_indices & ~prev_nan).T)
+    end_indices = np.nonzero((nan_indices & ~next_nan).T)[1]
 
     # Return the starting and ending indices of NaN runs
-    return start_indices, end_indices
\ No newline at end of file
+    if arr.ndim == 1:
+        return start_indices, end_indices
+    return start_cols, start_indices, end_indices
+
+def expand_intervals(starts: np.ndarray, ends: np.ndarray, bin_edges: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Split [start, end) intervals at the bin boundaries `bin_edges`
+    (bin i is [bin_edges[i], bin_edges[i+1])), clipping them to the bins.
+    Returns, for every (interval, bin) overlap, the interval's index,
+    the bin's index and the overlap length in base pairs,
+    in interval order, so sorted by bin too if the intervals are.
+    """
+    starts = np.maximum(np.asarray(starts, dtype=np.int64), bin_edges[0])
+    ends = np.minimum(np.asarray(ends, dtype=np.int64), bin_edges[-1])
+    first_bins = np.searchsorted(bin_edges, starts, side="right") - 1
+    last_bins = np.searchsorted(bin_edges, ends - 1, side="right") - 1
+    n_spanned = np.where(ends > starts, last_bins - first_bins + 1, 0)
+
+    interval_idxs = np.repeat(np.arange(len(starts)), n_spanned)
+    # position of each overlap among its interval's overlaps
+    nth_bin = np.arange(len(interval_idxs)) - np.repeat(np.cumsum(n_spanned) - n_spanned, n_spanned)
+    bins = first_bins[interval_idxs] + nth_bin
+    overlaps = np.minimum(ends[interval_idxs], bin_edges[bins + 1]) - np.maximum(starts[interval_idxs], bin_edges[bins])
+    return interval_idxs, bins, overlaps
+
+def bin_interval_sums(starts: np.ndarray, ends: np.ndarray, values: np.ndarray, bin_edges: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Sum of value x overlap and number of covered base pairs
+    of [start, end) intervals (e.g. from `bigwig.intervals`)
+    in every bin [bin_edges[i], bin_edges[i+1])
+    """
+    n_bins = len(bin_edges) - 1
+    interval_idxs, bins, overlaps = expand_intervals(starts, ends, bin_edges)
+    sums = np.bincount(bins, weights=np.asarray(values, dtype=np.float64)[interval_idxs] * overlaps, minlength=n_bins)
+    n_covered = np.bincount(bins, weights=overlaps, minlength=n_bins).astype(np.int64)
+    return sums, n_covered
+
+def bin_interval_means(starts: np.ndarray, ends: np.ndarray, values: np.ndarray, bin_edges: np.ndarray) -> np.ndarray:
+    """
+    Coverage weighted mean of the `values` of [start, end) intervals
+    (e.g. from `bigwig.intervals`) in every bin [bin_edges[i], bin_edges[i+1]).
+    NaN where no interval covers a bin, as `bigwig.stats` gives.
+    """
+    sums, n_covered = bin_interval_sums(starts, ends, values, bin_edges)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n_covered > 0, sums / n_covered, np.nan)
+
+def bin_interval_runs(starts: np.ndarray, ends: np.ndarray, values: np.ndarray, bin_edges: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    `bin_interval_means` of non-overlapping, sorted [start, end) intervals
+    as runs of bins of equal mean: run starts (bin), lengths and values,
+    bins no interval covers, or with a NaN-valued interval (NaN means, as
+    `bin_interval_means` gives), left out, without the per bin array.
+    The bins an interval covers whole all take its value, so only the
+    (at most 2) bins each interval partly covers are averaged, and the
+    work is in the number of intervals, not bins.
+    """
+    n_bins = len(bin_edges) - 1
+    starts = np.maximum(np.asarray(starts, dtype=np.int64), bin_edges[0])
+    ends = np.minimum(np.asarray(ends, dtype=np.int64), bin_edges[-1])
+    values = np.asarray(values, dtype=np.float64)
+    keep = ends > starts
+    starts, ends, values = starts[keep], ends[keep], values[keep]
+
+    # [full_firsts, full_ends) bins each interval covers whole
+    full_firsts = np.searchsorted(bin_edges, starts, side="left")
+    full_ends = np.maximum(np.searchsorted(bin_edges, ends, side="right") - 1, full_firsts)
+    # bins of the interval's first and last base pair, if only partly covered
+    first_bins = np.searchsorted(bin_edges, starts, side="right") - 1
+    last_bins = np.searchsorted(bin_edges, ends - 1, side="right") - 1
+    first_partial = first_bins < full_firsts
+    last_partial = (last_bins >= full_ends) & ~(first_partial & (last_bins == first_bins))
+    partial_bins = np.concatenate((first_bins[first_partial], last_bins[last_partial]))
+    overlaps = np.concatenate((
+        np.minimum(ends, bin_edges[np.minimum(first_bins + 1, n_bins)])[first_partial] - starts[first_partial],
+        ends[last_partial] - bin_edges[last_bins[last_partial]],
+    ))
+    overlap_vals = np.concatenate((values[first_partial], values[last_partial]))
+    # no other interval overlaps a bin one covers whole, so partial bins only get partial overlaps
+    partial_bins, partial_idxs = np.unique(partial_bins, return_inverse=True)
+    partial_means = (
+        np.bincount(partial_idxs, weights=overlap_vals * overlaps, minlength=len(partial_bins))
+        / np.bincount(partial_idxs, weights=overlaps, minlength=len(partial_bins))
+    )
+
+    full = full_ends > full_firsts
+    run_starts = np.concatenate((full_firsts[full], partial_bins))
+    run_lengths = np.concatenate((full_ends[full] - full_firsts[full], np.ones(len(partial_bins), dtype=np.int64)))
+    run_values = np.concatenate((values[full], partial_means))
+    # NaN runs would count as observed, and never merge (NaN != NaN)
+    observed = ~np.isnan(run_values)
+    run_starts, run_lengths, run_values = run_starts[observed], run_lengths[observed], run_values[observed]
+    order = np.argsort(run_starts, kind="stable")
+    run_starts, run_lengths, run_values = run_starts[order], run_lengths[order], run_values[order]
+    return merge_runs(run_starts, run_lengths, run_values)
+
+def merge_runs(starts: np.ndarray, lengths: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Merge sorted, non-overlapping runs into the next when they touch and have the same value
+    """
+    if len(starts) == 0:
+        return starts.astype(np.int64), lengths.astype(np.int64), values
+    new_run = np.ones(len(starts), dtype=bool)
+    new_run[1:] = (starts[:-1] + lengths[:-1] != starts[1:]) | (values[:-1] != values[1:])
+    firsts = np.flatnonzero(new_run)
+    return starts[firsts].astype(np.int64), np.add.reduceat(lengths, firsts).astype(np.int64), values[firsts]
+
+# per bin statistics `bin_interval_stats` can compute
+BIN_STATS = ("mean", "sum", "max", "min", "covered", "sumsq", "std")
+
+def bin_interval_stats(starts: np.ndarray, ends: np.ndarray, values: np.ndarray, bin_edges: np.ndarray, stats: list[str]) -> dict[str, np.ndarray]:
+    """
+    Several statistics of [start, end) intervals' `values` in every bin
+    [bin_edges[i], bin_edges[i+1]), from one split of the intervals at the
+    bin boundaries, base pair weighted like `bigwig.stats`:
+        - mean, std: of the covered base pairs' values
+        - sum, sumsq: of the covered base pairs' values (squared)
+        - max, min: of the values of the intervals overlapping the bin
+        - covered: number of base pairs with a value
+    Every statistic but covered is NaN in bins with no intervals.
+    """
+    unknown = set(stats) - set(BIN_STATS)
+    if unknown:
+        raise ValueError(f"Unknown bin statistics {unknown}, must be of {BIN_STATS}")
+    n_bins = len(bin_edges) - 1
+    values = np.asarray(values, dtype=np.float64)
+    interval_idxs, bins, overlaps = expand_intervals(starts, ends, bin_edges)
+    overlap_vals = values[interval_idxs]
+
+    n_covered = np.bincount(bins, weights=overlaps, minlength=n_bins).astype(np.int64)
+    is_covered = n_covered > 0
+    binned_stats = {}
+    if "covered" in stats:
+        binned_stats["covered"] = n_covered
+    if set(stats) & {"mean", "sum", "std"}:
+        sums = np.bincount(bins, weights=overlap_vals * overlaps, minlength=n_bins)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(is_covered, sums / n_covered, np.nan)
+        if "sum" in stats:
+            binned_stats["sum"] = np.where(is_covered, sums, np.nan)
+        if "mean" in stats:
+            binned_stats["mean"] = means
+    if set(stats) & {"sumsq", "std"}:
+        sumsqs = np.bincount(bins, weights=overlap_vals * overlap_vals * overlaps, minlength=n_bins)
+        if "sumsq" in stats:
+            binned_stats["sumsq"] = np.where(is_covered, sumsqs, np.nan)
+        if "std" in stats:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                variances = np.where(is_covered, sumsqs / n_covered - means * means, np.nan)
+            binned_stats["std"] = np.sqrt(np.maximum(variances, 0, where=~np.isnan(variances), out=variances))
+    if set(stats) & {"max", "min"}:
+        # reduce each bin's run of overlaps, bins sorted first if the intervals weren't
+        if len(bins) and (np.diff(bins) < 0).any():
+            order = np.argsort(bins, kind="stable")
+            bins, overlap_vals = bins[order], overlap_vals[order]
+        run_starts = np.flatnonzero(np.diff(bins, prepend=-1))
+        for stat, reduce_fn in (("max", np.maximum), ("min", np.minimum)):
+            if stat in stats:
+                binned_stats[stat] = np.full(n_bins, np.nan)
+                if len(run_starts):
+                    binned_stats[stat][bins[run_starts]] = reduce_fn.reduceat(overlap_vals, run_starts)
+    return binned_stats
@@ -0,0 +1,291 @@
+import numpy as np
+import pandas as pd
+import warnings
+import io
+import argparse
+from math import ceil
+from typing import Union
+from pathlib import Path
+from .missing import MissingIndex
+from .summary import TrackSummary, load_summaries, summaries_frame
+
+# files making up a saved binned output directory
+VALUES_FILE = "values.npy"
+CHROMS_FILE = "chroms.csv"
+TRACKS_FILE = "tracks.csv"
+MISSING_FILE = "missing.npz"
+SUMMARY_FILE = "summary.json"
+
+def chrom_offsets(chrom_sizes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add `row_start`, `row_end` columns to a chromosome sizes table
+    (with an `n_bins` column), giving each chromosome's [start, end)
+    rows in the genome-wide binned matrix, chromosomes in table order
+    """
+    n_bins = chrom_sizes["n_bins"].astype(np.int64).to_numpy()
+    row_ends = np.cumsum(n_bins)
+    chrom_sizes["n_bins"] = n_bins
+    chrom_sizes["row_start"] = row_ends - n_bins
+    chrom_sizes["row_end"] = row_ends
+    return chrom_sizes
+
+def chrom_table(chrom_sizes: Union[dict[str, int], pd.DataFrame], bin_size: int) -> pd.DataFrame:
+    """
+    Chromosomes table of name, size, n_bins under `bin_size` and
+    row_start, row_end in the genome-wide matrix, from either a
+    {chrom[str]: size[int]} dictionary or a DataFrame with at least
+    name and size columns (which gets the other columns added)
+    """
+    if isinstance(chrom_sizes, dict):
+        chroms = pd.DataFrame({
+            "name": chrom_sizes.keys(),
+            "size": chrom_sizes.values(),
+            "n_bins": [ceil(size / bin_size) for size in chrom_sizes.values()],
+        })
+    elif isinstance(chrom_sizes, pd.DataFrame):
+        req_cols = set(["name", "size"])
+        if req_cols.issubset(chrom_sizes.columns):
+            chroms = chrom_sizes
+            if "n_bins" not in chrom_sizes.columns:
+                chroms["n_bins"] = np.ceil(chroms["size"] / bin_size)
+        else:
+            raise ValueError(f"`chrom_sizes` given is a pandas DataFrame. It must include columns {req_cols}, but currently does not: {chrom_sizes.columns}")
+    else:
+        raise TypeError(f"`chrom_sizes` given is a {type(chrom_sizes)}, not a <str : int> dictionary nor pandas DataFrame")
+    # each chromosome's rows in the genome-wide matrix
+    return chrom_offsets(chroms)
+
+def pybigwig_bin_edges(chr_size: int, n_bins: int) -> np.ndarray:
+    """
+    Base pair boundaries of the `n_bins` bins `bigwig.stats(chrom, nBins=n_bins)`
+    splits a `chr_size` long chromosome into: bin i is [edges[i], edges[i+1]).
+    The bins differ in length by at most 1 bp, with the shorter ones first.
+    """
+    return (np.arange(n_bins + 1, dtype=np.int64) * chr_size) // n_bins
+
+def left_bin_edges(chr_size: int, bin_size: int) -> np.ndarray:
+    """
+    Base pair boundaries of `bin_size` bins laid from the start of a
+    `chr_size` long chromosome, only the last one shorter if they don't
+    divide evenly: bin i is [edges[i], edges[i+1])
+    """
+    return np.minimum(np.arange(ceil(chr_size / bin_size) + 1, dtype=np.int64) * bin_size, chr_size)
+
+def genome_bin_edges(chroms: pd.DataFrame, bin_edges_fn=pybigwig_bin_edges) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Bin boundaries of all chromosomes, in order, in genome-wide
+    coordinates: chromosomes laid end to end, so chromosome i starts at
+    base pair offsets[i]. Bin (matrix row) j is [edges[j], edges[j+1]).
+    `bin_edges_fn(chr_size, n_bins)` gives one chromosome's bins.
+    """
+    sizes = chroms["size"].to_numpy(dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+    edges = [
+        offset + bin_edges_fn(int(size), int(n_bins))[:-1]
+        for offset, size, n_bins in zip(offsets, sizes, chroms["n_bins"])
+    ]
+    edges.append([int(sizes.sum())])
+    return np.concatenate(edges).astype(np.int64), offsets
+
+def alloc_binned(n_bins: int, n_tracks: int, dtype=np.float64, path: Path = None) -> np.ndarray:
+    """
+    Allocate the (genome bin x track) matrix, NaN filled.
+    Column-major, so each track is one contiguous run of memory (and file).
+    If `path` is given, the matrix is a memory-mapped `.npy` file there.
+    """
+    shape = (int(n_bins), int(n_tracks))
+    if path is None:
+        values = np.empty(shape, dtype=dtype, order="F")
+    else:
+        values = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape, fortran_order=True)
+    values.fill(np.nan)
+    return values
+
+class BinnedTracks:
+    """
+    Genome-wide binned signal of several tracks, as saved by `BigWigsBinner.save`:
+        - `values`: (genome bin x track) matrix, usually memory-mapped
+        - `chroms`: table of name, size, n_bins, row_start, row_end per chromosome
+        - `tracks`: table of name, path per track, one row per `values` column
+        - `missing`: `MissingIndex` of the missing bins runs, if saved
+        - `summaries`: `TrackSummary` per track, if saved
+    binned in `bin_size` bins, left-aligned ones (see `left_bin_edges`) if `left_aligned`.
+    """
+    def __init__(self, values: np.ndarray, chroms: pd.DataFrame, tracks: pd.DataFrame, bin_size: int, missing: MissingIndex = None, summaries: list[TrackSummary] = None, left_aligned=False):
+        self.values = values
+        self.chroms = chroms
+        self.tracks = tracks
+        self.bin_size = bin_size
+        self.missing = missing
+        self.summaries = summaries
+        self.left_aligned = left_aligned
+
+    @classmethod
+    def load(cls, binned_dir: Path, mmap_mode: str = "r") -> "BinnedTracks":
+        """
+        Open a saved binned output directory, memory-mapping the matrix
+        with `mmap_mode` (`None` reads it all into memory)
+        """
+        binned_dir = Path(binned_dir)
+        values = np.load(binned_dir / VALUES_FILE, mmap_mode=mmap_mode)
+        chroms = pd.read_csv(binned_dir / CHROMS_FILE, dtype={"name": str})
+        tracks = pd.read_csv(binned_dir / TRACKS_FILE, dtype={"name": str, "path": str})
+        bin_size = int(chroms["bin_size"].iat[0]) if len(chroms.index) else 0
+        # saved by older versions without it, when bins were always pyBigWig's
+        left_aligned = bool(chroms["left_aligned"].iat[0]) if "left_aligned" in chroms.columns and len(chroms.index) else False
+        missing = MissingIndex.load(binned_dir / MISSING_FILE) if (binned_dir / MISSING_FILE).exists() else None
+        summaries = load_summaries(binned_dir / SUMMARY_FILE) if (binned_dir / SUMMARY_FILE).exists() else None
+        return cls(values, chroms.drop(columns=["bin_size", "left_aligned"], errors="ignore"), tracks, bin_size, missing, summaries, left_aligned)
+
+    def chrom_rows(self, chrom: str) -> tuple[int, int]:
+        """
+        [start, end) rows of `chrom` in `values`
+        """
+        row = self.chroms.loc[self.chroms["name"] == chrom]
+        if row.empty:
+            raise KeyError(f"{chrom} is not in the binned chromosomes")
+        return int(row["row_start"].iat[0]), int(row["row_end"].iat[0])
+
+    def chrom_values(self, chrom: str) -> np.ndarray:
+        """
+        (bin x track) view of `chrom`'s rows of `values`, no copy
+        """
+        row_start, row_end = self.chrom_rows(chrom)
+        return self.values[row_start:row_end]
+
+    def as_tensor(self):
+        """
+        Zero-copy torch view of `values`. A read-only memory map stays
+        read-only underneath, so the tensor must not be written to.
+        """
+        import torch
+        with warnings.catch_warnings():
+            # torch warns on read-only arrays, which memory maps opened with "r" are
+            warnings.filterwarnings("ignore", message=".*not writable.*")
+            return torch.from_numpy(self.values)
+
+def save_binned(binned_dir: Path, values: np.ndarray, chroms: pd.DataFrame, tracks: pd.DataFrame, bin_size: int, left_aligned=False) -> None:
+    """
+    Write a binned output directory: the matrix as `.npy`,
+    plus the chromosome offsets and tracks tables as CSVs.
+    If `values` is already memory-mapped to the target file, just flush it.
+    """
+    binned_dir = Path(binned_dir)
+    binned_dir.mkdir(parents=True, exist_ok=True)
+    values_path = binned_dir / VALUES_FILE
+    if isinstance(values, np.memmap) and values.filename is not None and Path(values.filename).resolve() == values_path.resolve():
+        values.flush()
+    else:
+        out = np.lib.format.open_memmap(values_path, mode="w+", dtype=values.dtype, shape=values.shape, fortran_order=True)
+        out[:] = values
+        out.flush()
+        del out
+
+    chroms_out = chroms[["name", "size", "n_bins", "row_start", "row_end"]].copy()
+    chroms_out["bin_size"] = bin_size
+    chroms_out["left_aligned"] = left_aligned
+    chroms_out.to_csv(binned_dir / CHROMS_FILE, index=False)
+    tracks.to_csv(binned_dir / TRACKS_FILE, index=False)
+
+def load_binned(binned_dir: Path, mmap_mode: str = "r") -> BinnedTracks:
+    return BinnedTracks.load(binned_dir, mmap_mode)
+
+def _read_npy_header(f) -> tuple[tuple[int, ...], tuple[int, int], np.dtype, int]:
+    """
+    Shape, format version, dtype and data offset of the column-major
+    `.npy` open as `f`, checked to be column-major (or a single column
+    or row, the same either way)
+    """
+    f.seek(0)
+    version = np.lib.format.read_magic(f)
+    read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+    shape, fortran_order, dtype = read_header(f)
+    if len(shape) != 2 or not (fortran_order or min(shape) <= 1):
+        raise ValueError(f"{getattr(f, 'name', f)} is not a column-major (genome bin x track) matrix")
+    return shape, version, dtype, f.tell()
+
+def _write_npy_shape(f, version: tuple[int, int], dtype: np.dtype, shape: tuple[int, int], offset: int) -> None:
+    """
+    Overwrite the header of the column-major `.npy` open as `f` with a new
+    `shape`, in place: NumPy pads headers with room for the last axis (the
+    columns of a column-major matrix) to grow, so the data never moves
+    """
+    header = io.BytesIO()
+    write_header = np.lib.format.write_array_header_1_0 if version == (1, 0) else np.lib.format.write_array_header_2_0
+    write_header(header, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": True, "shape": tuple(int(n) for n in shape)})
+    if len(header.getvalue()) != offset:
+        raise ValueError(f"New header of {getattr(f, 'name', f)} doesn't fit in the old one, the matrix has to be rewritten")
+    f.seek(0)
+    f.write(header.getvalue())
+
+def append_binned_columns(values_path: Path, new_values: np.ndarray, chunk_bins: int = 1_000_000) -> tuple[int, int]:
+    """
+    Add the columns of (genome bin x track) `new_values` to the right of
+    the column-major `.npy` matrix at `values_path`, in place: as each
+    column is one contiguous run of the file, they are just written at its
+    end, `chunk_bins` bins at a time, then the header updated last, so
+    the matrix is unchanged if interrupted. Returns the new shape.
+    """
+    with open(values_path, "r+b") as f:
+        (n_rows, n_cols), version, dtype, offset = _read_npy_header(f)
+        if new_values.shape[0] != n_rows:
+            raise ValueError(f"{new_values.shape[0]} bins to append to {values_path}, of {n_rows}")
+        f.seek(offset + n_rows * n_cols * dtype.itemsize)
+        f.truncate()
+        for col in range(new_values.shape[1]):
+            for start in range(0, n_rows, chunk_bins):
+                f.write(np.ascontiguousarray(new_values[start:start + chunk_bins, col], dtype=dtype).tobytes())
+        f.flush()
+        new_shape = (n_rows, n_cols + new_values.shape[1])
+        _write_npy_shape(f, version, dtype, new_shape, offset)
+    return new_shape
+
+def drop_binned_columns(values_path: Path, cols: list[int], chunk_bins: int = 1_000_000) -> tuple[int, int]:
+    """
+    Remove columns `cols` of the column-major `.npy` matrix at
+    `values_path`, in place: every later column is moved left over them,
+    `chunk_bins` bins at a time, and the file truncated. Returns the new shape.
+    """
+    with open(values_path, "r+b") as f:
+        (n_rows, n_cols), version, dtype, offset = _read_npy_header(f)
+    dropped = set(cols)
+    keep = [col for col in range(n_cols) if col not in dropped]
+    values = np.memmap(values_path, dtype=dtype, mode="r+", offset=offset, shape=(n_rows, n_cols), order="F")
+    for new_col, old_col in enumerate(keep):
+        if new_col != old_col:
+            for start in range(0, n_rows, chunk_bins):
+                values[start:start + chunk_bins, new_col] = values[start:start + chunk_bins, old_col]
+    values.flush()
+    del values
+
+    new_shape = (n_rows, len(keep))
+    with open(values_path, "r+b") as f:
+        _write_npy_shape(f, version, dtype, new_shape, offset)
+        f.truncate(offset + n_rows * len(keep) * dtype.itemsize)
+    return new_shape
+
+DESCRIPTION = "Describes a binned (genome bin x track) output directory: its matrix, bins, chromosomes and tracks, with their missing fractions and summary statistics if saved."
+
+def add_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("binned_dir", type=Path, help="Binned output directory, as saved by the bigWig or bedGraph binners.")
+    parser.add_argument("--chroms", action="store_true", help="Also list every chromosome's size, number of bins and rows.")
+    return parser
+
+def init_argparser(parser: argparse.ArgumentParser) -> argparse.Namespace:
+    return add_arguments(parser).parse_args()
+
+def main(args: argparse.Namespace) -> None:
+    binned = BinnedTracks.load(args.binned_dir)
+    print(f"{args.binned_dir}: {binned.values.shape[0]} bins x {binned.values.shape[1]} tracks of {binned.values.dtype}, {binned.values.nbytes / 1e9:.3g} GB")
+    print(f"{binned.bin_size} bp bins, {'left-aligned' if binned.left_aligned else 'as pyBigWig'}, over {len(binned.chroms.index)} chromosomes")
+    if args.chroms:
+        print(binned.chroms.to_string(index=False))
+    tracks = binned.tracks.copy()
+    if binned.missing is not None:
+        tracks["missing"] = binned.missing.missing_fraction()
+    if binned.summaries is not None:
+        tracks = pd.concat([tracks, summaries_frame(binned.summaries).drop(columns="name")], axis=1)
+    print(tracks.to_string(index=False))
+
+if __name__ == "__main__":
+    main(init_argparser(argparse.ArgumentParser(description=DESCRIPTION)))
@@ -0,0 +1,109 @@
+import numpy as np
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+def file_fingerprint(path: Path) -> str:
+    """
+    Cheap identity of a file's contents: absolute path, size and modification time
+    """
+    stat = os.stat(path)
+    return f"{Path(path).absolute()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+class BinnedCache:
+    """
+    On-disk cache of binned chromosomes, one `.npy` per (track, chromosome),
+    keyed by the track file's fingerprint, bin size, statistic, value type
+    and the chromosome's name and size. So changing a file, or any of the
+    binning settings, misses and rebins only what changed.
+
+    Holds at most `max_bytes` (unlimited if `None`), evicting the least
+    recently used entries first. Recency is each file's modification time,
+    touched on every hit, so several processes can share a cache directory.
+    """
+    def __init__(self, cache_dir: Path, max_bytes: int = None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total_bytes = sum(entry.stat().st_size for entry in self.cache_dir.glob("*.npy"))
+
+    def key(self, track_path: Path, bin_size: int, stat: str, dtype, chr_name: str, chr_size: int) -> str:
+        key_str = "|".join([file_fingerprint(track_path), str(bin_size), stat, np.dtype(dtype).str, str(chr_name), str(chr_size)])
+        return hashlib.sha1(key_str.encode()).hexdigest()
+
+    def entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npy"
+
+    def get(self, key: str) -> np.ndarray:
+        """
+        The cached binned values under `key`, or `None` on a miss
+        """
+        entry_path = self.entry_path(key)
+        try:
+            binneds = np.load(entry_path)
+            os.utime(entry_path)
+        except (FileNotFoundError, ValueError, EOFError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return binneds
+
+    def put(self, key: str, binneds: np.ndarray) -> None:
+        entry_path = self.entry_path(key)
+        # write then rename, so readers never see a partial entry
+        tmp_path = self.cache_dir / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as tmp_file:
+            np.save(tmp_file, np.ascontiguousarray(binneds))
+        n_bytes = tmp_path.stat().st_size
+
+        with self._lock:
+            # an entry put again (e.g. by another thread binning the same chromosome) replaces the old one's bytes
+            try:
+                old_bytes = entry_path.stat().st_size
+            except FileNotFoundError:
+                old_bytes = 0
+            os.replace(tmp_path, entry_path)
+            self._total_bytes += n_bytes - old_bytes
+            if self.max_bytes is not None and self._total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self) -> None:
+        """
+        Delete least recently used entries until within `max_bytes`
+        """
+        entries = []
+        for entry_path in self.cache_dir.glob("*.npy"):
+            try:
+                entry_stat = entry_path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((entry_stat.st_mtime_ns, entry_stat.st_size, entry_path))
+        entries.sort()
+
+        total_bytes = sum(n_bytes for _, n_bytes, _ in entries)
+        for _, n_bytes, entry_path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            entry_path.unlink(missing_ok=True)
+            total_bytes -= n_bytes
+        self._total_bytes = total_bytes
+
+    def report(self) -> dict:
+        """
+        Hits and misses so far, and the current size of the cache
+        """
+        n_lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / n_lookups if n_lookups else 0.0,
+            "entries": len(list(self.cache_dir.glob("*.npy"))),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
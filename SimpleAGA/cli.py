@@ -0,0 +1,42 @@
+import argparse
+import importlib
+import sys
+
+# command: (module implementing it, one line help), the module only imported when its command runs
+COMMANDS = {
+    "bin": ("proc_bigWigs", "Bin bigWigs into a (genome bin x track) matrix."),
+    "bin-bedgraphs": ("proc_bedGraphs", "Bin bedGraphs into a (genome bin x track) matrix."),
+    "inspect": ("binned", "Describe a binned output directory."),
+    "tracks": ("manifest", "List, append, replace or drop tracks of a binned output directory."),
+    "normalize": ("normalize", "Normalize the tracks of a binned output directory in place."),
+    "train": ("train", "Train a Gaussian HMM on a binned output directory."),
+    "segment": ("writer", "Decode a binned output directory with a trained HMM into a segmentation."),
+}
+
+def command_module(command: str):
+    return importlib.import_module(f"{__package__}.{COMMANDS[command][0]}")
+
+def build_parser(command: str = None) -> argparse.ArgumentParser:
+    """
+    Parser of every command, only `command`'s with its arguments, so
+    only its module (and its dependencies) get imported
+    """
+    parser = argparse.ArgumentParser(prog="simpleaga", description="Bins signal tracks into a genome-wide (bin x track) matrix and segments it with an HMM.")
+    commands = parser.add_subparsers(dest="simpleaga_command", metavar="COMMAND", required=True)
+    for name, (_, help) in COMMANDS.items():
+        command_parser = commands.add_parser(name, help=help, description=help)
+        if name == command:
+            module = command_module(name)
+            command_parser.description = module.DESCRIPTION
+            module.add_arguments(command_parser)
+    return parser
+
+def main(argv: list[str] = None) -> None:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # the first positional argument, if any, is the command
+    command = next((arg for arg in argv if not arg.startswith("-")), None)
+    args = build_parser(command if command in COMMANDS else None).parse_args(argv)
+    command_module(args.simpleaga_command).main(args)
+
+if __name__ == "__main__":
+    main()
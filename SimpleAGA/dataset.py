@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import torch
+from pathlib import Path
+from .binned import VALUES_FILE, BinnedTracks
+
+def window_rows(chroms: pd.DataFrame, window_bins: int, stride_bins: int, pad_last=False) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Windows of `window_bins` bins every `stride_bins` bins along each
+    chromosome of `chroms` (with n_bins, row_start columns), none crossing
+    into the next one: their first rows in the genome-wide matrix, their
+    chromosomes (indices into `chroms`) and how many of their bins are
+    within the chromosome. If `pad_last`, every chromosome's bins past its
+    last full window, or all of a chromosome shorter than a window, get
+    one more window running past its end; otherwise those bins are left out.
+    """
+    starts, chr_idxs, lengths = [], [], []
+    for chr_idx, (n_bins, row_start) in enumerate(chroms[["n_bins", "row_start"]].itertuples(index=False, name=None)):
+        chr_starts = np.arange(0, max(int(n_bins) - window_bins + 1, 0), stride_bins, dtype=np.int64)
+        covered_end = chr_starts[-1] + window_bins if len(chr_starts) else 0
+        next_start = chr_starts[-1] + stride_bins if len(chr_starts) else 0
+        if pad_last and covered_end < n_bins and next_start < n_bins:
+            chr_starts = np.append(chr_starts, next_start)
+        starts.append(int(row_start) + chr_starts)
+        chr_idxs.append(np.full(len(chr_starts), chr_idx, dtype=np.int64))
+        lengths.append(np.minimum(int(n_bins) - chr_starts, window_bins))
+    if not starts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(starts), np.concatenate(chr_idxs), np.concatenate(lengths).astype(np.int64)
+
+class BinnedWindows(torch.utils.data.Dataset):
+    """
+    Fixed length genomic windows of a saved binned output directory (see
+    `BinnedTracks`), for a torch `DataLoader`: window i is a dict of
+        - "values": (window x track) float tensor, missing bins set to `fill`
+        - "missing": (window x track) bool tensor, True where missing
+        - "row": first row of the window in the genome-wide matrix
+    Windows are laid out as `window_rows`, `window_bins` long every
+    `stride_bins` (default `window_bins`, no overlap) bins, only over
+    `tracks` (names, default all).
+    The matrix is memory-mapped on first read, in every process reading it
+    on its own, so DataLoader workers only read (and page in) the windows
+    they serve instead of each getting a copy of the genome.
+    """
+    def __init__(self, binned_dir: Path, window_bins: int, stride_bins: int = None, tracks: list[str] = None, pad_last=False, fill: float = 0.0, dtype=torch.float32):
+        if window_bins < 1 or (stride_bins is not None and stride_bins < 1):
+            raise ValueError(f"Windows of {window_bins} bins every {stride_bins} bins are empty or never move")
+        self.binned_dir = Path(binned_dir)
+        self.window_bins = window_bins
+        self.stride_bins = window_bins if stride_bins is None else stride_bins
+        self.fill = fill
+        self.dtype = dtype
+
+        binned = BinnedTracks.load(self.binned_dir)
+        self.chroms = binned.chroms
+        self.bin_size = binned.bin_size
+        track_names = list(binned.tracks["name"])
+        if tracks is None:
+            self.track_names = track_names
+            self.cols = None
+        else:
+            unknown = [name for name in tracks if name not in track_names]
+            if unknown:
+                raise KeyError(f"{unknown} are not tracks of {self.binned_dir}")
+            self.track_names = list(tracks)
+            self.cols = np.array([track_names.index(name) for name in tracks], dtype=np.int64)
+        del binned
+
+        self.row_starts, self.chr_idxs, self.lengths = window_rows(self.chroms, self.window_bins, self.stride_bins, pad_last)
+        self._values = None
+
+    def __len__(self) -> int:
+        return len(self.row_starts)
+
+    def __getstate__(self) -> dict:
+        # sent to DataLoader workers without the memory map, which each reopens
+        state = self.__dict__.copy()
+        state["_values"] = None
+        return state
+
+    @property
+    def values(self) -> np.ndarray:
+        """
+        The (genome bin x track) matrix, memory-mapped read-only on first use
+        """
+        if self._values is None:
+            self._values = np.load(self.binned_dir / VALUES_FILE, mmap_mode="r")
+        return self._values
+
+    @property
+    def n_tracks(self) -> int:
+        return len(self.track_names)
+
+    def __getitem__(self, idx: int) -> dict:
+        row_start, length = int(self.row_starts[idx]), int(self.lengths[idx])
+        window = np.full((self.window_bins, self.n_tracks), np.nan, dtype=np.float64 if self.dtype == torch.float64 else np.float32)
+        rows = self.values[row_start:row_start + length]
+        window[:length] = rows if self.cols is None else rows[:, self.cols]
+        missing = np.isnan(window)
+        window[missing] = self.fill
+        return {
+            "values": torch.from_numpy(window).to(self.dtype),
+            "missing": torch.from_numpy(missing),
+            "row": row_start,
+        }
+
+    def windows_frame(self) -> pd.DataFrame:
+        """
+        Table of chrom, start, end (bins within the chromosome, the end cut at
+        the chromosome's) and row_start in the genome-wide matrix per window
+        """
+        chr_row_starts = self.chroms["row_start"].to_numpy()[self.chr_idxs]
+        return pd.DataFrame({
+            "chrom": self.chroms["name"].to_numpy()[self.chr_idxs],
+            "start": self.row_starts - chr_row_starts,
+            "end": self.row_starts - chr_row_starts + self.lengths,
+            "row_start": self.row_starts,
+        })
+
+def windows_loader(dataset: BinnedWindows, batch_size: int = 64, shuffle=False, num_workers: int = 0, prefetch_factor: int = 2, pin_memory=False, seed: int = None) -> torch.utils.data.DataLoader:
+    """
+    DataLoader batching `dataset`'s windows into (batch x window x track)
+    "values" and "missing" tensors and a "row" tensor, read by
+    `num_workers` worker processes (0 reads in the main one), each keeping
+    `prefetch_factor` batches ahead and staying up between epochs.
+    `seed` fixes the shuffling order.
+    """
+    generator = None if seed is None else torch.Generator().manual_seed(seed)
+    worker_kwargs = {"prefetch_factor": prefetch_factor, "persistent_workers": True} if num_workers > 0 else {}
+    return torch.utils.data.DataLoader(
+        dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers,
+        pin_memory=pin_memory, generator=generator, **worker_kwargs
+    )
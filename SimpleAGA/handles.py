@@ -0,0 +1,157 @@
+import pyBigWig
+import pandas as pd
+import collections
+import contextlib
+import threading
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator
+from .metrics import Metrics, NULL_METRICS
+
+# open pyBigWig handles per `BigWigPool`, well under the usual 1024 file descriptors per process
+DEFAULT_MAX_OPEN = 256
+
+class BigWigPool:
+    """
+    pyBigWig handles, by path, opened lazily the first time one is leased
+    (see `lease`) and at most `max_open` open at once: opening another
+    closes the least recently used handle not leased at the time, or
+    waits for one to be released. A lease is exclusive, as a pyBigWig
+    handle can't be read from several threads at once.
+    Opens are timed in `metrics`, and every file's size counted once.
+    Close all handles with `close`, or use the pool as a context manager.
+    """
+    def __init__(self, max_open: int = DEFAULT_MAX_OPEN, metrics: Metrics = NULL_METRICS):
+        if max_open < 1:
+            raise ValueError(f"A pool of at most {max_open} open bigWigs can't open any")
+        self.max_open = max_open
+        self.metrics = metrics
+        # open handles, least recently used first
+        self.handles = collections.OrderedDict()
+        self.leased = set()
+        self.n_opened = 0
+        self.seen = set()
+        self.cond = threading.Condition()
+
+    def __enter__(self) -> "BigWigPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """
+        Number of open handles
+        """
+        return len(self.handles)
+
+    def _acquire(self, path: str):
+        """
+        Lease `path`'s handle, as `lease` does, without releasing it
+        """
+        with self.cond:
+            while True:
+                if path in self.leased:
+                    self.cond.wait()
+                    continue
+                if path in self.handles:
+                    self.handles.move_to_end(path)
+                    self.leased.add(path)
+                    return self.handles[path]
+                if len(self.handles) < self.max_open:
+                    break
+                idle = next((open_path for open_path in self.handles if open_path not in self.leased), None)
+                if idle is None:
+                    self.cond.wait()
+                    continue
+                self.handles.pop(idle).close()
+            # reserve the slot, so other threads don't go over `max_open` while this one opens
+            self.leased.add(path)
+            self.handles[path] = None
+
+        track = Path(path).stem
+        try:
+            with self.metrics.time("open", track):
+                bigwig = pyBigWig.open(path)
+            if bigwig is None:
+                raise OSError(f"pyBigWig couldn't open {path}")
+        except BaseException:
+            with self.cond:
+                self.handles.pop(path, None)
+                self.leased.discard(path)
+                self.cond.notify_all()
+            raise
+        with self.cond:
+            self.handles[path] = bigwig
+            self.n_opened += 1
+            if path not in self.seen:
+                self.seen.add(path)
+                self.metrics.count("file_size_bytes", os.path.getsize(path), track)
+        return bigwig
+
+    def _release(self, path: str) -> None:
+        with self.cond:
+            self.leased.discard(path)
+            self.cond.notify_all()
+
+    @contextlib.contextmanager
+    def lease(self, path) -> Iterator:
+        """
+        Use `path`'s pyBigWig handle, opening it if it isn't open:
+            with pool.lease(path) as bigwig:
+                bigwig.intervals(...)
+        """
+        path = str(path)
+        bigwig = self._acquire(path)
+        try:
+            yield bigwig
+        finally:
+            self._release(path)
+
+    def close(self) -> None:
+        """
+        Close every open handle, leased ones too,
+        so only close a pool no one is using
+        """
+        with self.cond:
+            for bigwig in self.handles.values():
+                if bigwig is not None:
+                    bigwig.close()
+            self.handles.clear()
+            self.leased.clear()
+            self.cond.notify_all()
+
+def read_bigwig_chroms(path) -> dict[str, int]:
+    """
+    {chrom[str]: size[int]} of a bigWig, from its header only
+    """
+    bigwig = pyBigWig.open(str(path))
+    if bigwig is None:
+        raise OSError(f"pyBigWig couldn't open {path}")
+    try:
+        return bigwig.chroms()
+    finally:
+        bigwig.close()
+
+def validate_bigwig_headers(paths: list[Path], chrom_sizes: pd.DataFrame, n_threads: int = 16) -> None:
+    """
+    Check every bigWig has each chromosome of `chrom_sizes` (name, size
+    columns) with the same size, i.e. is of the same assembly, reading
+    only their headers, `n_threads` files at a time, each closed right
+    after. Raises a ValueError listing every mismatched file.
+    """
+    expected = dict(zip(chrom_sizes["name"].astype(str), chrom_sizes["size"].astype(int)))
+    with ThreadPoolExecutor(max_workers=max(1, min(n_threads, len(paths)))) as thr_pool:
+        headers = list(thr_pool.map(read_bigwig_chroms, paths))
+
+    problems = []
+    for path, chroms in zip(paths, headers):
+        missing = [chrom for chrom in expected if chrom not in chroms]
+        resized = [f"{chrom} ({chroms[chrom]} bp, not {size})" for chrom, size in expected.items() if chrom in chroms and chroms[chrom] != size]
+        if missing or resized:
+            problems.append(f"{path}: " + "; ".join(
+                ([f"missing {', '.join(missing)}"] if missing else []) + ([f"sizes of {', '.join(resized)}"] if resized else [])
+            ))
+    if problems:
+        raise ValueError(f"{len(problems)} of {len(paths)} bigWigs don't match the chromosome sizes, maybe of another assembly:\n" + "\n".join(problems))
@@ -0,0 +1,341 @@
+import numpy as np
+from pathlib import Path
+from typing import NamedTuple, Callable
+
+LOG_2PI = np.log(2 * np.pi)
+
+class HMMStats(NamedTuple):
+    """
+    Expected sufficient statistics of a `GaussianHMM` over some sequences,
+    summed over all their bins (see `GaussianHMM.e_step`).
+    Statistics of different sequences add up, see `merge_stats`.
+    """
+    # (state,) posteriors of the sequences' first bins
+    start: np.ndarray
+    # (state x state) expected number of transitions
+    trans: np.ndarray
+    # (state x track) posterior weight of the observed bins,
+    # and posterior weighted sums of their values and squared values
+    weight: np.ndarray
+    value_sum: np.ndarray
+    value_sumsq: np.ndarray
+    log_likelihood: float
+
+def merge_stats(stats: list[HMMStats]) -> HMMStats:
+    """
+    Sum the statistics of several `e_step`s, e.g. of different chromosomes
+    """
+    return HMMStats(*(sum(field) for field in zip(*stats)))
+
+class GaussianHMM:
+    """
+    Hidden Markov model of (bin x track) binned signal, with one Gaussian
+    emission per (state, track), tracks independent given the state.
+    Works on the binned matrix as is: a track missing (NaN) in a bin just
+    has no emission term there, so the bin is still in the chain and only
+    its observed tracks inform its state (in a bin missing every track, the
+    state follows the transitions alone).
+    `track_weights` raise each track's emission probability to a power,
+    e.g. its observed fraction relative to the most observed track's.
+
+    Inference runs on batches of sequences (e.g. chromosomes, any length)
+    in lockstep, `chunk_bins` bins at a time: the forward pass only keeps
+    its probabilities at the chunk boundaries, and the backward pass
+    recomputes each chunk's from there. So memory is set by `chunk_bins`,
+    not the sequences' lengths, and sequences can be memory maps.
+    """
+    def __init__(self, start_probs: np.ndarray, trans_probs: np.ndarray, means: np.ndarray, variances: np.ndarray, track_weights: np.ndarray = None, var_floor: float = 1e-4):
+        self.start_probs = np.asarray(start_probs, dtype=np.float64)
+        self.trans_probs = np.asarray(trans_probs, dtype=np.float64)
+        self.means = np.asarray(means, dtype=np.float64)
+        self.variances = np.maximum(np.asarray(variances, dtype=np.float64), var_floor)
+        self.track_weights = np.ones(self.means.shape[1]) if track_weights is None else np.asarray(track_weights, dtype=np.float64)
+        self.var_floor = var_floor
+
+    @property
+    def n_states(self) -> int:
+        return self.means.shape[0]
+
+    @property
+    def n_tracks(self) -> int:
+        return self.means.shape[1]
+
+    @classmethod
+    def from_data(cls, values: np.ndarray, n_states: int, stay_prob: float = 0.9, max_sample: int = 1_000_000, seed: int = None, **kwargs) -> "GaussianHMM":
+        """
+        Initial model for (bin x track) `values`: state k's means are every
+        track's (k + 0.5) / `n_states` quantile, plus a little noise, variances
+        the tracks' variances, and every state stays with `stay_prob`,
+        otherwise moving to any other state alike. Estimated from at most
+        `max_sample` evenly spaced bins.
+        """
+        rng = np.random.default_rng(seed)
+        step = max(1, len(values) // max_sample)
+        sample = np.asarray(values[::step], dtype=np.float64)
+        quantiles = (np.arange(n_states) + 0.5) / n_states
+        means = np.nan_to_num(np.nanquantile(sample, quantiles, axis=0))
+        track_vars = np.nan_to_num(np.nanvar(sample, axis=0), nan=1.0)
+        means = means + rng.normal(scale=0.01, size=means.shape) * np.sqrt(track_vars)
+
+        trans_probs = np.full((n_states, n_states), (1 - stay_prob) / max(1, n_states - 1))
+        np.fill_diagonal(trans_probs, stay_prob if n_states > 1 else 1.0)
+        return cls(np.full(n_states, 1 / n_states), trans_probs, means, np.tile(track_vars, (n_states, 1)), **kwargs)
+
+    def emission_log_probs(self, values: np.ndarray) -> np.ndarray:
+        """
+        (bin x state) log probability of each bin's observed tracks of
+        (bin x track) `values`, leaving out its missing (NaN) ones.
+        Expanding the Gaussians' squares makes it three matrix products.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        observed = ~np.isnan(values)
+        obs_values = np.where(observed, values, 0.0)
+        # w_d / var_kd, so the sums over tracks are weighted
+        inv_vars = self.track_weights / self.variances
+        return -0.5 * (
+            observed.astype(np.float64) @ (self.track_weights * (LOG_2PI + np.log(self.variances)) + inv_vars * self.means**2).T
+            + obs_values**2 @ inv_vars.T
+            - 2 * obs_values @ (inv_vars * self.means).T
+        )
+
+    @staticmethod
+    def _sort_batch(seqs: list[np.ndarray]) -> tuple[list[np.ndarray], np.ndarray, np.ndarray]:
+        """
+        Non-empty sequences longest first, so those still running at any
+        step are a prefix of the batch, with their lengths and indices in `seqs`
+        """
+        lengths = np.array([len(seq) for seq in seqs], dtype=np.int64)
+        order = np.argsort(-lengths, kind="stable")
+        order = order[lengths[order] > 0]
+        return [seqs[idx] for idx in order], lengths[order], order
+
+    def _chunk_emissions(self, seqs: list[np.ndarray], lengths: np.ndarray, t0: int, t1: int) -> tuple[np.ndarray, np.ndarray, list[np.ndarray]]:
+        """
+        Steps [t0, t1) of a sorted batch: number of sequences running at each
+        step, (step x sequence x state) emission log probabilities (0 past a
+        sequence's end) and every running sequence's values
+        """
+        n_active = (lengths[np.newaxis, :] > np.arange(t0, t1)[:, np.newaxis]).sum(axis=1)
+        log_b = np.zeros((t1 - t0, len(seqs), self.n_states))
+        chunk_values = []
+        for seq_idx in range(n_active[0]):
+            seq_values = np.asarray(seqs[seq_idx][t0:min(t1, lengths[seq_idx])], dtype=np.float64)
+            log_b[:len(seq_values), seq_idx] = self.emission_log_probs(seq_values)
+            chunk_values.append(seq_values)
+        return n_active, log_b, chunk_values
+
+    def _forward_chunk(self, log_b: np.ndarray, n_active: np.ndarray, alpha: np.ndarray, t0: int) -> tuple[np.ndarray, ...]:
+        """
+        Scaled forward recursion over one chunk starting at step `t0`, from
+        the normalized forward probabilities `alpha` at step t0 - 1 (updated
+        in place). Returns the chunk's (step x sequence x state) normalized
+        forward probabilities and emissions scaled to a maximum of 1 per step,
+        the (step x sequence) normalizers, and each sequence's log likelihood
+        """
+        offsets = log_b.max(axis=2)
+        emits = np.exp(log_b - offsets[:, :, np.newaxis])
+        alphas = np.zeros_like(log_b)
+        norms = np.ones(log_b.shape[:2])
+        for step, n in enumerate(n_active):
+            if t0 + step == 0:
+                step_alpha = self.start_probs * emits[step, :n]
+            else:
+                step_alpha = (alpha[:n] @ self.trans_probs) * emits[step, :n]
+            norms[step, :n] = np.add.reduce(step_alpha, axis=1)
+            alpha[:n] = step_alpha / norms[step, :n, np.newaxis]
+            alphas[step, :n] = alpha[:n]
+        # past a sequence's end, offsets are 0 and normalizers 1
+        return alphas, emits, norms, (np.log(norms) + offsets).sum(axis=0)
+
+    def e_step(self, seqs: list[np.ndarray], chunk_bins: int = 10_000, posterior_fn: Callable[[int, int, np.ndarray], None] = None) -> HMMStats:
+        """
+        Forward-backward over a batch of (bin x track) sequences, summing the
+        expected sufficient statistics of all of them. If given,
+        `posterior_fn(seq_idx, start, posteriors)` gets every chunk of
+        (bin x state) posteriors, from bin `start` of `seqs[seq_idx]` on,
+        chunks in reverse order.
+        """
+        n_states = self.n_states
+        stats = HMMStats(
+            np.zeros(n_states), np.zeros((n_states, n_states)),
+            np.zeros((n_states, self.n_tracks)), np.zeros((n_states, self.n_tracks)), np.zeros((n_states, self.n_tracks)), 0.0,
+        )
+        seqs, lengths, order = self._sort_batch(seqs)
+        if len(seqs) == 0:
+            return stats
+        chunk_starts = list(range(0, int(lengths[0]), chunk_bins))
+
+        # forward pass, only keeping the forward probabilities before each chunk
+        checkpoints = []
+        log_likelihood = 0.0
+        alpha = np.zeros((len(seqs), n_states))
+        for t0 in chunk_starts:
+            checkpoints.append(alpha.copy())
+            n_active, log_b, _ = self._chunk_emissions(seqs, lengths, t0, min(t0 + chunk_bins, int(lengths[0])))
+            log_likelihood += self._forward_chunk(log_b, n_active, alpha, t0)[3].sum()
+
+        # backward pass, chunk by chunk from the end, redoing each one's forward pass from its checkpoint
+        start, trans, weight, value_sum, value_sumsq, _ = stats
+        # scaled emission x backward probability / normalizer of the step after the current one
+        next_emit_beta = np.zeros((len(seqs), n_states))
+        for t0, alpha_prev in zip(reversed(chunk_starts), reversed(checkpoints)):
+            t1 = min(t0 + chunk_bins, int(lengths[0]))
+            n_active, log_b, chunk_values = self._chunk_emissions(seqs, lengths, t0, t1)
+            alphas, emits, norms, _ = self._forward_chunk(log_b, n_active, alpha_prev.copy(), t0)
+
+            betas = np.zeros_like(alphas)
+            n_nexts = np.append(n_active[1:], (lengths > t1).sum())
+            for step in range(t1 - t0 - 1, -1, -1):
+                n, n_next = n_active[step], n_nexts[step]
+                betas[step, :n_next] = next_emit_beta[:n_next] @ self.trans_probs.T
+                # last bins of sequences
+                betas[step, n_next:n] = 1.0
+                next_emit_beta[:n] = emits[step, :n] * betas[step, :n] / norms[step, :n, np.newaxis]
+
+            posteriors = alphas * betas
+            if t0 == 0:
+                start += posteriors[0].sum(axis=0)
+            # transitions into every step of the chunk, from the step before
+            emit_betas = emits * betas / norms[:, :, np.newaxis]
+            prev_alphas = np.concatenate((alpha_prev[np.newaxis], alphas[:-1]))
+            trans += (prev_alphas.reshape(-1, n_states).T @ emit_betas.reshape(-1, n_states)) * self.trans_probs
+
+            for seq_idx, seq_values in enumerate(chunk_values):
+                seq_posteriors = posteriors[:len(seq_values), seq_idx]
+                observed = ~np.isnan(seq_values)
+                obs_values = np.where(observed, seq_values, 0.0)
+                weight += seq_posteriors.T @ observed
+                value_sum += seq_posteriors.T @ obs_values
+                value_sumsq += seq_posteriors.T @ obs_values**2
+                if posterior_fn is not None:
+                    posterior_fn(int(order[seq_idx]), t0, seq_posteriors)
+        return HMMStats(start, trans, weight, value_sum, value_sumsq, log_likelihood)
+
+    def log_likelihood(self, seqs: list[np.ndarray], chunk_bins: int = 10_000) -> float:
+        """
+        Total log likelihood of a batch of sequences, forward pass only
+        """
+        seqs, lengths, _ = self._sort_batch(seqs)
+        if len(seqs) == 0:
+            return 0.0
+        log_likelihood = 0.0
+        alpha = np.zeros((len(seqs), self.n_states))
+        for t0 in range(0, int(lengths[0]), chunk_bins):
+            n_active, log_b, _ = self._chunk_emissions(seqs, lengths, t0, min(t0 + chunk_bins, int(lengths[0])))
+            log_likelihood += self._forward_chunk(log_b, n_active, alpha, t0)[3].sum()
+        return float(log_likelihood)
+
+    def posteriors(self, values: np.ndarray, chunk_bins: int = 10_000) -> np.ndarray:
+        """
+        (bin x state) posterior probabilities of one sequence's states
+        """
+        posteriors = np.empty((len(values), self.n_states))
+        def fill(seq_idx: int, start: int, chunk_posteriors: np.ndarray) -> None:
+            posteriors[start:start + len(chunk_posteriors)] = chunk_posteriors
+        self.e_step([values], chunk_bins, fill)
+        return posteriors
+
+    def _viterbi_chunk(self, log_b: np.ndarray, n_active: np.ndarray, delta: np.ndarray, t0: int) -> np.ndarray:
+        """
+        Max-product (log space) forward recursion over one chunk starting at
+        step `t0`, from the best paths' log probabilities `delta` at step
+        t0 - 1 (updated in place). Returns each step's best previous state
+        per (step, sequence, state).
+        """
+        log_start = np.log(self.start_probs)
+        log_trans = np.log(self.trans_probs)
+        back_ptrs = np.zeros(log_b.shape, dtype=np.min_scalar_type(self.n_states))
+        for step, n in enumerate(n_active):
+            if t0 + step == 0:
+                delta[:n] = log_start + log_b[step, :n]
+                continue
+            scores = delta[:n, :, np.newaxis] + log_trans
+            back_ptrs[step, :n] = scores.argmax(axis=1)
+            delta[:n] = scores.max(axis=1) + log_b[step, :n]
+        return back_ptrs
+
+    def viterbi(self, seqs: list[np.ndarray], chunk_bins: int = 10_000) -> tuple[list[np.ndarray], np.ndarray]:
+        """
+        Most likely state path of each of a batch of sequences,
+        and its log probability, in the same chunked fixed memory as `e_step`
+        """
+        sorted_seqs, lengths, order = self._sort_batch(seqs)
+        paths = [np.zeros(len(seq), dtype=np.min_scalar_type(self.n_states)) for seq in seqs]
+        log_probs = np.zeros(len(seqs))
+        if len(sorted_seqs) == 0:
+            return paths, log_probs
+        chunk_starts = list(range(0, int(lengths[0]), chunk_bins))
+
+        checkpoints = []
+        delta = np.zeros((len(sorted_seqs), self.n_states))
+        for t0 in chunk_starts:
+            checkpoints.append(delta.copy())
+            n_active, log_b, _ = self._chunk_emissions(sorted_seqs, lengths, t0, min(t0 + chunk_bins, int(lengths[0])))
+            self._viterbi_chunk(log_b, n_active, delta, t0)
+        # sequences stop updating `delta` at their last bin
+        log_probs[order] = delta.max(axis=1)
+
+        # trace back chunk by chunk from the end, from every sequence's best last state
+        states = delta.argmax(axis=1)
+        for t0, delta_prev in zip(reversed(chunk_starts), reversed(checkpoints)):
+            t1 = min(t0 + chunk_bins, int(lengths[0]))
+            n_active, log_b, _ = self._chunk_emissions(sorted_seqs, lengths, t0, t1)
+            back_ptrs = self._viterbi_chunk(log_b, n_active, delta_prev.copy(), t0)
+            chunk_paths = np.zeros((t1 - t0, len(sorted_seqs)), dtype=paths[0].dtype)
+            for step in range(t1 - t0 - 1, -1, -1):
+                n = n_active[step]
+                chunk_paths[step, :n] = states[:n]
+                states[:n] = back_ptrs[step, np.arange(n), states[:n]]
+            for seq_idx in range(n_active[0]):
+                seq_end = min(t1, int(lengths[seq_idx]))
+                paths[order[seq_idx]][t0:seq_end] = chunk_paths[:seq_end - t0, seq_idx]
+        return paths, log_probs
+
+    def m_step(self, stats: HMMStats, pseudocount: float = 1e-6) -> "GaussianHMM":
+        """
+        Update the parameters in place to maximize the expected log
+        likelihood under `stats`. A (state, track) without any observed
+        bins keeps its mean and variance.
+        """
+        self.start_probs = (stats.start + pseudocount) / (stats.start + pseudocount).sum()
+        trans = stats.trans + pseudocount
+        self.trans_probs = trans / trans.sum(axis=1, keepdims=True)
+
+        seen = stats.weight > 0
+        safe_weight = np.where(seen, stats.weight, 1.0)
+        means = np.where(seen, stats.value_sum / safe_weight, self.means)
+        variances = np.where(seen, stats.value_sumsq / safe_weight - means**2, self.variances)
+        self.means = means
+        self.variances = np.maximum(variances, self.var_floor)
+        return self
+
+    def fit(self, seqs: list[np.ndarray], n_iters: int = 20, tol: float = 1e-4, chunk_bins: int = 10_000) -> list[float]:
+        """
+        Baum-Welch on a batch of sequences until the log likelihood improves
+        by less than `tol` per bin, or `n_iters` iterations.
+        Returns every iteration's log likelihood.
+        """
+        n_bins = sum(len(seq) for seq in seqs)
+        log_likelihoods = []
+        for iter_idx in range(n_iters):
+            stats = self.e_step(seqs, chunk_bins)
+            self.m_step(stats)
+            log_likelihoods.append(float(stats.log_likelihood))
+            print(f"EM iteration {iter_idx}: log likelihood {stats.log_likelihood:.6g}", flush=True)
+            if len(log_likelihoods) > 1 and log_likelihoods[-1] - log_likelihoods[-2] < tol * n_bins:
+                break
+        return log_likelihoods
+
+    def save(self, path: Path) -> None:
+        np.savez(
+            path, start_probs=self.start_probs, trans_probs=self.trans_probs, means=self.means,
+            variances=self.variances, track_weights=self.track_weights, var_floor=self.var_floor,
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "GaussianHMM":
+        with np.load(path) as saved:
+            return cls(
+                saved["start_probs"], saved["trans_probs"], saved["means"], saved["variances"],
+                saved["track_weights"], float(saved["var_floor"]),
+            )
@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+import argparse
+import os
+from pathlib import Path
+from .binned import VALUES_FILE, TRACKS_FILE, MISSING_FILE, SUMMARY_FILE, BinnedTracks, append_binned_columns, drop_binned_columns
+from .missing import MissingIndex
+from .summary import TrackSummary, save_summaries, summaries_frame
+
+BIGWIG_SUFFIXES = (".bw", ".bigwig")
+BEDGRAPH_SUFFIXES = (".bg", ".bedgraph")
+
+class TrackManifest:
+    def __init__(self, binned_dir: Path, processes=False, n_workers: int = None, chunk_bins: int = 1_000_000):
+        """
+        The named tracks of a saved binned output directory (see
+        `BinnedTracks`), its `tracks.csv` of name, path per matrix column,
+        to add, replace or drop tracks of in place: only the tracks
+        changed are binned, the same way as the rest (bin size, bins
+        layout, dtype), and the matrix columns, missing runs index and
+        summaries are edited to match without rebinning the others.
+        `processes` and `n_workers` are as `BigWigsBinner`'s, `n_workers`
+        also capping the bedGraphs binned at once.
+        """
+        self.binned_dir = Path(binned_dir)
+        self.processes = processes
+        self.n_workers = n_workers
+        self.chunk_bins = chunk_bins
+
+        binned = BinnedTracks.load(self.binned_dir)
+        self.chroms = binned.chroms
+        self.tracks = binned.tracks
+        self.bin_size = binned.bin_size
+        self.left_aligned = binned.left_aligned
+        self.dtype = binned.values.dtype
+        self.n_bins = binned.values.shape[0]
+        self.missing = binned.missing
+        self.summaries = binned.summaries
+        del binned
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.tracks["name"])
+
+    def track_idx(self, name: str) -> int:
+        try:
+            return self.names.index(name)
+        except ValueError:
+            raise KeyError(f"{name} is not a track of {self.binned_dir}")
+
+    def bin_tracks(self, paths: list[Path]) -> tuple[np.ndarray, MissingIndex, list[TrackSummary]]:
+        """
+        Bin bigWigs and/or bedGraphs `paths` like the tracks already binned,
+        into a (genome bin x track) matrix, with its missing runs and summaries
+        """
+        # only imported to bin, so listing or dropping tracks doesn't load pyBigWig
+        from .proc_bigWigs import BigWigsBinner
+        from .proc_bedGraphs import BedGraphsBinner
+
+        paths = [Path(path) for path in paths]
+        chrom_sizes = self.chroms[["name", "size"]].copy()
+        values = np.empty((self.n_bins, len(paths)), dtype=self.dtype, order="F")
+        summaries = [None] * len(paths)
+
+        bw_idxs = [idx for idx, path in enumerate(paths) if path.suffix.lower() in BIGWIG_SUFFIXES]
+        bg_idxs = [idx for idx, path in enumerate(paths) if path.suffix.lower() in BEDGRAPH_SUFFIXES]
+        unknown = [str(path) for idx, path in enumerate(paths) if idx not in bw_idxs and idx not in bg_idxs]
+        if unknown:
+            raise ValueError(f"Can't tell whether {unknown} are bigWigs ({BIGWIG_SUFFIXES}) or bedGraphs ({BEDGRAPH_SUFFIXES})")
+        if bw_idxs:
+            with BigWigsBinner([paths[idx] for idx in bw_idxs], chrom_sizes.copy(), self.bin_size, processes=self.processes, n_workers=self.n_workers, dtype=self.dtype, left_aligned=self.left_aligned) as bw_binner:
+                bw_binner.load_bin_all_bws()
+                values[:, bw_idxs] = bw_binner.binned_mat
+                for bw_idx, summary in zip(bw_idxs, bw_binner.track_summaries):
+                    summaries[bw_idx] = summary
+        if bg_idxs:
+            bg_binner = BedGraphsBinner([paths[idx] for idx in bg_idxs], chrom_sizes.copy(), self.bin_size, n_workers=self.n_workers, dtype=self.dtype, left_aligned=self.left_aligned)
+            bg_binner.load_bin_all_bgs()
+            values[:, bg_idxs] = bg_binner.binned_mat
+            for bg_idx, summary in zip(bg_idxs, bg_binner.track_summaries):
+                summaries[bg_idx] = summary
+
+        return values, MissingIndex.from_matrix(values, self.chroms), summaries
+
+    def save_metadata(self) -> None:
+        """
+        Save the tracks table, missing runs index and summaries, each
+        written to a temporary file first, so none is ever partial
+        """
+        def replace(file_name: str, save_fn) -> None:
+            tmp_path = self.binned_dir / f".{file_name}.tmp"
+            save_fn(tmp_path)
+            os.replace(tmp_path, self.binned_dir / file_name)
+
+        replace(TRACKS_FILE, lambda path: self.tracks.to_csv(path, index=False))
+        if self.missing is not None:
+            def save_missing(path: Path) -> None:
+                with open(path, "wb") as f:
+                    self.missing.save(f)
+            replace(MISSING_FILE, save_missing)
+        if self.summaries is not None:
+            replace(SUMMARY_FILE, lambda path: save_summaries(path, self.summaries))
+
+    def append(self, names: list[str], paths: list[Path]) -> None:
+        """
+        Bin tracks `paths` and add them, named `names`, as new last columns
+        """
+        if len(names) != len(paths):
+            raise ValueError(f"{len(names)} names for {len(paths)} tracks")
+        taken = [name for name in names if name in self.names] + [name for idx, name in enumerate(names) if name in names[:idx]]
+        if taken:
+            raise ValueError(f"Tracks {taken} are already in {self.binned_dir}, or given twice")
+        values, missing, summaries = self.bin_tracks(paths)
+
+        append_binned_columns(self.binned_dir / VALUES_FILE, values, self.chunk_bins)
+        self.tracks = pd.concat([self.tracks, pd.DataFrame({"name": names, "path": [str(path) for path in paths]})], ignore_index=True)
+        if self.missing is not None:
+            self.missing = self.missing.append_tracks(missing)
+        if self.summaries is not None:
+            self.summaries = self.summaries + summaries
+        self.save_metadata()
+        print(f"Appended {names} to {self.binned_dir}, now {len(self.tracks.index)} tracks", flush=True)
+
+    def replace(self, name: str, path: Path) -> None:
+        """
+        Rebin track `name` from `path`, overwriting its column
+        """
+        col = self.track_idx(name)
+        values, missing, summaries = self.bin_tracks([path])
+
+        binned_values = np.load(self.binned_dir / VALUES_FILE, mmap_mode="r+")
+        for start in range(0, self.n_bins, self.chunk_bins):
+            binned_values[start:start + self.chunk_bins, col] = values[start:start + self.chunk_bins, 0]
+        binned_values.flush()
+        del binned_values
+        self.tracks.loc[col, "path"] = str(path)
+        if self.missing is not None:
+            self.missing = self.missing.replace_track(col, missing)
+        if self.summaries is not None:
+            self.summaries[col] = summaries[0]
+        self.save_metadata()
+        print(f"Replaced {name} of {self.binned_dir} with {path}", flush=True)
+
+    def drop(self, names: list[str]) -> None:
+        """
+        Remove tracks `names`, the later columns moved left over them
+        """
+        cols = [self.track_idx(name) for name in names]
+        drop_binned_columns(self.binned_dir / VALUES_FILE, cols, self.chunk_bins)
+        self.tracks = self.tracks.drop(index=cols).reset_index(drop=True)
+        if self.missing is not None:
+            self.missing = self.missing.drop_tracks(cols)
+        if self.summaries is not None:
+            self.summaries = [summary for col, summary in enumerate(self.summaries) if col not in cols]
+        self.save_metadata()
+        print(f"Dropped {names} from {self.binned_dir}, now {len(self.tracks.index)} tracks", flush=True)
+
+DESCRIPTION = "Lists, appends, replaces or drops named tracks of a binned (genome bin x track) output directory in place, binning only the tracks changed."
+
+def add_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("binned_dir", type=Path, help="Binned output directory, as saved by the bigWig or bedGraph binners. Edited in place.")
+    parser.add_argument("--processes", action="store_true", help="Bin bigWigs on a process pool, one task per (bigWig, chromosome), instead of one thread per bigWig.")
+    parser.add_argument("--n-workers", type=int, help="Number of worker processes for `--processes`. Defaults to the number of CPUs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Show the tracks, with their summary statistics if saved.")
+    append_parser = commands.add_parser("append", help="Bin tracks and add them as new columns.")
+    append_parser.add_argument("--track", nargs=2, action="append", required=True, metavar=("TRACK_NAME", "TRACK_FILE"), help="Name and bigWig or bedGraph file of a track to add. Repeat for more tracks.")
+    replace_parser = commands.add_parser("replace", help="Rebin tracks from new files, in place of their columns.")
+    replace_parser.add_argument("--track", nargs=2, action="append", required=True, metavar=("TRACK_NAME", "TRACK_FILE"), help="Name of a track and its new bigWig or bedGraph file. Repeat for more tracks.")
+    drop_parser = commands.add_parser("drop", help="Remove tracks.")
+    drop_parser.add_argument("names", nargs="+", help="Names of the tracks to remove.")
+    return parser
+
+def init_argparser(parser: argparse.ArgumentParser) -> argparse.Namespace:
+    return add_arguments(parser).parse_args()
+
+def main(args: argparse.Namespace) -> None:
+    manifest = TrackManifest(args.binned_dir, processes=args.processes, n_workers=args.n_workers)
+    if args.command == "list":
+        if manifest.summaries is not None:
+            print(pd.concat([manifest.tracks, summaries_frame(manifest.summaries).drop(columns="name")], axis=1).to_string())
+        else:
+            print(manifest.tracks.to_string())
+    elif args.command == "append":
+        manifest.append([name for name, _ in args.track], [Path(path) for _, path in args.track])
+    elif args.command == "replace":
+        for name, path in args.track:
+            manifest.replace(name, Path(path))
+    elif args.command == "drop":
+        manifest.drop(args.names)
+
+if __name__ == "__main__":
+    main(init_argparser(argparse.ArgumentParser(description=DESCRIPTION)))
@@ -0,0 +1,272 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+def current_rss_mb() -> float:
+    """
+    Resident memory of this process now, in MB (0 where `/proc` isn't available)
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+def peak_rss_mb() -> tuple[float, float]:
+    """
+    Peak resident memory, in MB, of this process and of its largest finished child
+    """
+    # kB on Linux, bytes on macOS
+    unit = 2**20 if sys.platform == "darwin" else 2**10
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit,
+    )
+
+# end of `Metrics.timed_iter`'s iterable
+_END = object()
+
+class Metrics:
+    """
+    Opt-in instrumentation of a binning run. Records:
+        - timed phases (e.g. open, stats, nan_scan, write), each with the
+            track and chromosome it was for and the worker that ran it
+        - counters, e.g. intervals, bins and sizes of the files opened, per track
+        - memory: resident memory at `mark`ed points, and peaks
+        - progress over `start`'s number of tasks, printed as a
+            live progress and ETA line every `progress_interval` seconds
+    `report` summarizes it all and `save` writes it as JSON. Binners take a
+    `Metrics` or default to `NULL_METRICS`, which records nothing.
+    """
+    enabled = True
+
+    def __init__(self, progress=True, progress_interval: float = 1.0):
+        self.progress = progress
+        self.progress_interval = progress_interval
+        # one dict per timed phase: phase, track, chrom, worker, start (s since `t0`), seconds
+        self.records = []
+        # (counter, track) -> total
+        self.counters = {}
+        # name -> (s since `t0`, resident MB)
+        self.marks = {}
+        self.label = None
+        self.n_tasks = 0
+        self.n_done = 0
+        self.n_workers = 1
+        # records' times are from when this was made, progress and ETA from `start`
+        self.t0 = time.perf_counter()
+        self.t_start = self.t0
+        self.t_end = None
+        self._last_progress = 0.0
+        self._lock = threading.Lock()
+
+    def start(self, label: str, n_tasks: int, n_workers: int = 1) -> None:
+        """
+        Start timing a run of `n_tasks` tasks on `n_workers` workers
+        """
+        self.label = label
+        self.n_tasks = n_tasks
+        self.n_done = 0
+        self.n_workers = max(1, n_workers)
+        self.t_start = time.perf_counter()
+        self.t_end = None
+        self.mark("start")
+
+    def finish(self) -> None:
+        self.t_end = time.perf_counter()
+        self.mark("finish")
+        if self.progress:
+            self.print_progress(final=True)
+
+    @contextmanager
+    def time(self, phase: str, track=None, chrom=None):
+        """
+        Context timing `phase` (of `track`'s `chrom`, if given)
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            record = {
+                "phase": phase, "track": track, "chrom": chrom,
+                "worker": f"{os.getpid()}:{threading.current_thread().name}",
+                "start": start - self.t0, "seconds": seconds,
+            }
+            with self._lock:
+                self.records.append(record)
+
+    def timed_iter(self, iterable, phase: str, track=None, chrom=None):
+        """
+        Iterate over `iterable`, timing getting each item as `phase`,
+        e.g. reading chunks of a file
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.time(phase, track, chrom):
+                item = next(iterator, _END)
+            if item is _END:
+                return
+            yield item
+
+    def count(self, counter: str, n: int = 1, track=None) -> None:
+        with self._lock:
+            key = (counter, track)
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def mark(self, name: str) -> None:
+        """
+        Note the time and resident memory at a point of the run
+        """
+        with self._lock:
+            self.marks[name] = (time.perf_counter() - self.t0, current_rss_mb())
+
+    def task_done(self, n: int = 1) -> None:
+        with self._lock:
+            self.n_done += n
+        if self.progress and time.perf_counter() - self._last_progress >= self.progress_interval:
+            self.print_progress()
+
+    def print_progress(self, final=False) -> None:
+        self._last_progress = time.perf_counter()
+        elapsed = self._last_progress - self.t_start
+        eta = elapsed / self.n_done * (self.n_tasks - self.n_done) if self.n_done else float("nan")
+        pct = 100 * self.n_done / self.n_tasks if self.n_tasks else 100.0
+        line = f"{self.label}: {self.n_done}/{self.n_tasks} tasks ({pct:.1f}%), {elapsed:.1f} s elapsed, ETA {eta:.1f} s, RSS {current_rss_mb():.0f} MB"
+        # rewrite the line in place on a terminal, one line per update otherwise
+        if sys.stderr.isatty():
+            print(f"\r{line}", end="\n" if final else "", file=sys.stderr, flush=True)
+        else:
+            print(line, file=sys.stderr, flush=True)
+
+    def merge(self, records: list[dict], counters: dict) -> None:
+        """
+        Add the records and counters of another `Metrics`, e.g. a worker
+        process's (see `worker_state`), times made relative to this one's start
+        """
+        with self._lock:
+            for record in records:
+                record = dict(record, start=record["start"] - self.t0)
+                self.records.append(record)
+            for key, n in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + n
+
+    def worker_state(self) -> tuple[list[dict], dict]:
+        """
+        Records and counters to send back to a parent's `merge`,
+        times as absolute `time.perf_counter` values
+        """
+        return [dict(record, start=record["start"] + self.t0) for record in self.records], self.counters
+
+    def report(self, top: int = 10) -> dict:
+        """
+        Summary of the run: wall time; total, mean and max seconds per
+        phase; seconds per track and per chromosome; the `top` slowest
+        records; counters; worker utilization (busy time of each worker,
+        over the wall time); and memory
+        """
+        wall = (self.t_end if self.t_end is not None else time.perf_counter()) - self.t0
+        with self._lock:
+            records = list(self.records)
+            counters = dict(self.counters)
+
+        phases, by_track, by_chrom = {}, {}, {}
+        for record in records:
+            phase = phases.setdefault(record["phase"], {"n": 0, "total_s": 0.0, "max_s": 0.0})
+            phase["n"] += 1
+            phase["total_s"] += record["seconds"]
+            phase["max_s"] = max(phase["max_s"], record["seconds"])
+            if record["phase"] == "task":
+                continue
+            if record["track"] is not None:
+                by_track[str(record["track"])] = by_track.get(str(record["track"]), 0.0) + record["seconds"]
+            if record["chrom"] is not None:
+                by_chrom[str(record["chrom"])] = by_chrom.get(str(record["chrom"]), 0.0) + record["seconds"]
+        for phase in phases.values():
+            phase["mean_s"] = phase["total_s"] / phase["n"]
+
+        # a task's phases are nested in its "task" record, so only count those as busy time, if there are any
+        busy = {}
+        for record in [record for record in records if record["phase"] == "task"] or records:
+            busy[record["worker"]] = busy.get(record["worker"], 0.0) + record["seconds"]
+
+        totals = {}
+        per_track = {}
+        for (counter, track), n in counters.items():
+            totals[counter] = totals.get(counter, 0) + n
+            if track is not None:
+                per_track.setdefault(str(track), {})[counter] = n
+
+        peak_self, peak_children = peak_rss_mb()
+        return {
+            "label": self.label,
+            "wall_s": wall,
+            "tasks": {"done": self.n_done, "total": self.n_tasks},
+            "phases": phases,
+            "track_s": by_track,
+            "chrom_s": by_chrom,
+            "slowest": sorted(records, key=lambda record: record["seconds"], reverse=True)[:top],
+            "counters": totals,
+            "track_counters": per_track,
+            "throughput": {f"{counter}_per_s": n / wall for counter, n in totals.items()} if wall > 0 else {},
+            "workers": {
+                "n_workers": self.n_workers,
+                "busy_s": busy,
+                # fraction of the workers' time spent on tasks
+                "utilization": sum(busy.values()) / (wall * self.n_workers) if wall > 0 else 0.0,
+            },
+            "memory": {
+                "marks": {name: {"t_s": t, "rss_mb": rss} for name, (t, rss) in self.marks.items()},
+                "peak_rss_mb": peak_self,
+                "peak_child_rss_mb": peak_children,
+            },
+        }
+
+    def save(self, path: Path) -> None:
+        """
+        Write `report` and every record as JSON
+        """
+        with open(path, "w") as f:
+            json.dump(dict(self.report(), records=self.records), f, indent=2, default=str)
+
+class NullMetrics(Metrics):
+    """
+    `Metrics` that records nothing, for when instrumentation is off:
+    every method returns straight away
+    """
+    enabled = False
+
+    def __init__(self):
+        super().__init__(progress=False)
+        self._null_context = nullcontext()
+
+    def start(self, label: str, n_tasks: int, n_workers: int = 1) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+    def time(self, phase: str, track=None, chrom=None):
+        return self._null_context
+
+    def timed_iter(self, iterable, phase: str, track=None, chrom=None):
+        return iterable
+
+    def count(self, counter: str, n: int = 1, track=None) -> None:
+        pass
+
+    def mark(self, name: str) -> None:
+        pass
+
+    def task_done(self, n: int = 1) -> None:
+        pass
+
+    def merge(self, records: list[dict], counters: dict) -> None:
+        pass
+
+NULL_METRICS = NullMetrics()
@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from ._util import find_nan_runs
+
+class MissingIndex:
+    """
+    Runs of missing (NaN) bins of every track, as columnar int32 arrays:
+        - `track`: column of the track in the binned matrix
+        - `chrom`: index of the chromosome in `chrom_names`
+        - `start`, `end`: first and last (inclusive) missing bins of the run,
+            counted from the start of the chromosome
+    sorted by track, then chromosome, then start.
+    """
+    def __init__(self, track: np.ndarray, chrom: np.ndarray, start: np.ndarray, end: np.ndarray, chrom_names: list[str], chrom_n_bins: np.ndarray, n_tracks: int):
+        self.track = np.asarray(track, dtype=np.int32)
+        self.chrom = np.asarray(chrom, dtype=np.int32)
+        self.start = np.asarray(start, dtype=np.int32)
+        self.end = np.asarray(end, dtype=np.int32)
+        self.chrom_names = [str(name) for name in chrom_names]
+        self.chrom_n_bins = np.asarray(chrom_n_bins, dtype=np.int64)
+        self.n_tracks = int(n_tracks)
+
+    @classmethod
+    def from_matrix(cls, values: np.ndarray, chroms: pd.DataFrame, block_tracks: int = 8) -> "MissingIndex":
+        """
+        Find the missing runs of a (genome bin x track) matrix, with
+        chromosome rows given by `chroms`' row_start, row_end columns.
+        Scans `block_tracks` columns at a time to bound the memory used.
+        """
+        row_starts = chroms["row_start"].to_numpy(dtype=np.int64)
+        tracks, starts, ends = [], [], []
+        for col_start in range(0, values.shape[1], block_tracks):
+            cols, block_starts, block_ends = find_nan_runs(values[:, col_start:col_start + block_tracks], breaks=row_starts)
+            tracks.append(cols + col_start)
+            starts.append(block_starts)
+            ends.append(block_ends)
+
+        starts = np.concatenate(starts) if starts else np.empty(0, dtype=np.int64)
+        ends = np.concatenate(ends) if ends else np.empty(0, dtype=np.int64)
+        # genome-wide rows -> chromosome and bins within it
+        chrom_idxs = np.searchsorted(row_starts, starts, side="right") - 1
+        return cls(
+            np.concatenate(tracks) if tracks else np.empty(0, dtype=np.int64),
+            chrom_idxs,
+            starts - row_starts[chrom_idxs],
+            ends - row_starts[chrom_idxs],
+            list(chroms["name"]),
+            chroms["n_bins"].to_numpy(),
+            values.shape[1],
+        )
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def chrom_idx(self, chrom: str) -> int:
+        try:
+            return self.chrom_names.index(chrom)
+        except ValueError:
+            raise KeyError(f"{chrom} is not in the indexed chromosomes")
+
+    def missing_union(self, chrom: str, tracks: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Sorted, disjoint [start, end] (inclusive) bin ranges of `chrom`
+        missing in any of `tracks` (default all)
+        """
+        in_chrom = self.chrom == self.chrom_idx(chrom)
+        if tracks is not None:
+            in_chrom &= np.isin(self.track, tracks)
+        order = np.argsort(self.start[in_chrom], kind="stable")
+        starts = self.start[in_chrom][order].astype(np.int64)
+        ends = self.end[in_chrom][order].astype(np.int64)
+        if len(starts) == 0:
+            return starts, ends
+
+        # a run starts a new merged range if it begins after every earlier run ended
+        reach = np.maximum.accumulate(ends)
+        new_range = np.ones(len(starts), dtype=bool)
+        new_range[1:] = starts[1:] > reach[:-1] + 1
+        range_idxs = np.flatnonzero(new_range)
+        return starts[range_idxs], np.maximum.reduceat(ends, range_idxs)
+
+    def is_observed(self, chrom: str, starts, ends, tracks: np.ndarray = None):
+        """
+        Whether each bin range [start, end] (inclusive) of `chrom`
+        is fully observed, i.e. no bin missing in any of `tracks`
+        (default all). Vectorized over arrays of `starts`, `ends`.
+        """
+        miss_starts, miss_ends = self.missing_union(chrom, tracks)
+        starts = np.asarray(starts)
+        ends = np.asarray(ends)
+        if len(miss_starts) == 0:
+            observed = np.ones(np.broadcast(starts, ends).shape, dtype=bool)
+            return bool(observed) if observed.ndim == 0 else observed
+        # the only missing range that can overlap is the last one starting at or before `end`
+        last_idxs = np.searchsorted(miss_starts, ends, side="right") - 1
+        observed = (last_idxs < 0) | (miss_ends[np.maximum(last_idxs, 0)] < starts)
+        return bool(observed) if observed.ndim == 0 else observed
+
+    def missing_mask(self, chrom: str, start: int = 0, end: int = None) -> np.ndarray:
+        """
+        (bin x track) boolean mask of missing bins of `chrom`,
+        bins [start, end) (end exclusive, default the chromosome end)
+        """
+        chr_idx = self.chrom_idx(chrom)
+        if end is None:
+            end = int(self.chrom_n_bins[chr_idx])
+        # +1/-1 at the edges of every run, cumulated down each track
+        edges = np.zeros((end - start + 1, self.n_tracks), dtype=np.int32)
+        in_rng = (self.chrom == chr_idx) & (self.end >= start) & (self.start < end)
+        run_tracks = self.track[in_rng]
+        np.add.at(edges, (np.maximum(self.start[in_rng], start) - start, run_tracks), 1)
+        np.add.at(edges, (np.minimum(self.end[in_rng] + 1, end) - start, run_tracks), -1)
+        return np.cumsum(edges[:-1], axis=0) > 0
+
+    def missing_counts(self) -> np.ndarray:
+        """
+        Number of tracks missing in every bin, genome-wide (chromosomes
+        laid end to end in index order, as the binned matrix's rows)
+        """
+        n_rows = int(self.chrom_n_bins.sum())
+        row_starts = np.concatenate(([0], np.cumsum(self.chrom_n_bins)[:-1])).astype(np.int64)
+        run_starts = row_starts[self.chrom] + self.start
+        # +1 at the first bin of every run, -1 after its last, cumulated
+        edges = np.bincount(run_starts, minlength=n_rows + 1) - np.bincount(run_starts + (self.end - self.start) + 1, minlength=n_rows + 1)
+        return np.cumsum(edges[:-1])
+
+    def missing_fraction(self) -> np.ndarray:
+        """
+        Fraction of all bins missing, per track
+        """
+        n_missing = np.bincount(self.track, weights=self.end.astype(np.int64) - self.start + 1, minlength=self.n_tracks)
+        return n_missing / max(1, int(self.chrom_n_bins.sum()))
+
+    def _with_runs(self, track: np.ndarray, chrom: np.ndarray, start: np.ndarray, end: np.ndarray, n_tracks: int) -> "MissingIndex":
+        """
+        Index of the same chromosomes with these runs, sorted as always
+        """
+        order = np.lexsort((start, chrom, track))
+        return MissingIndex(track[order], chrom[order], start[order], end[order], self.chrom_names, self.chrom_n_bins, n_tracks)
+
+    def append_tracks(self, other: "MissingIndex") -> "MissingIndex":
+        """
+        Index with `other`'s tracks (of the same chromosomes) added after these
+        """
+        if other.chrom_names != self.chrom_names:
+            raise ValueError("Can only append the missing runs of tracks binned over the same chromosomes")
+        return self._with_runs(
+            np.concatenate((self.track, other.track + self.n_tracks)), np.concatenate((self.chrom, other.chrom)),
+            np.concatenate((self.start, other.start)), np.concatenate((self.end, other.end)), self.n_tracks + other.n_tracks,
+        )
+
+    def replace_track(self, track: int, other: "MissingIndex") -> "MissingIndex":
+        """
+        Index with track `track`'s runs replaced by those of the only track of `other`
+        """
+        if other.chrom_names != self.chrom_names or other.n_tracks != 1:
+            raise ValueError("Can only replace a track's missing runs with those of one track binned over the same chromosomes")
+        kept = self.track != track
+        return self._with_runs(
+            np.concatenate((self.track[kept], np.full(len(other), track, dtype=np.int32))), np.concatenate((self.chrom[kept], other.chrom)),
+            np.concatenate((self.start[kept], other.start)), np.concatenate((self.end[kept], other.end)), self.n_tracks,
+        )
+
+    def drop_tracks(self, tracks: list[int]) -> "MissingIndex":
+        """
+        Index without tracks `tracks`, the later ones renumbered to close the gaps
+        """
+        dropped = np.zeros(self.n_tracks, dtype=bool)
+        dropped[list(tracks)] = True
+        kept = ~dropped[self.track]
+        # every track moves left by the number of dropped ones before it
+        new_tracks = (np.arange(self.n_tracks) - np.cumsum(dropped)).astype(np.int32)
+        return MissingIndex(new_tracks[self.track[kept]], self.chrom[kept], self.start[kept], self.end[kept], self.chrom_names, self.chrom_n_bins, self.n_tracks - int(dropped.sum()))
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Table of the runs, one per row, with chromosome names
+        """
+        return pd.DataFrame({
+            "bigwig": self.track,
+            "chrom": np.array(self.chrom_names, dtype=object)[self.chrom] if len(self.chrom_names) else np.empty(0, dtype=object),
+            "start": self.start,
+            "end": self.end,
+        })
+
+    def save(self, path: Path) -> None:
+        np.savez(
+            path, track=self.track, chrom=self.chrom, start=self.start, end=self.end,
+            chrom_names=np.array(self.chrom_names, dtype=str), chrom_n_bins=self.chrom_n_bins, n_tracks=self.n_tracks,
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "MissingIndex":
+        with np.load(path) as saved:
+            return cls(
+                saved["track"], saved["chrom"], saved["start"], saved["end"],
+                list(saved["chrom_names"]), saved["chrom_n_bins"], int(saved["n_tracks"]),
+            )
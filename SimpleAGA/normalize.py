@@ -0,0 +1,107 @@
+import numpy as np
+import argparse
+from pathlib import Path
+from .binned import SUMMARY_FILE, BinnedTracks
+from .summary import TrackSummary, save_summaries, summaries_frame
+
+NORMALIZATIONS = ("asinh", "zscore", "quantile")
+
+def summarize_values(values: np.ndarray, chunk_bins: int = 1_000_000) -> list[TrackSummary]:
+    """
+    `TrackSummary` of every column of a (genome bin x track) matrix,
+    `chunk_bins` rows of one column at a time, for matrices binned
+    without them
+    """
+    summaries = [TrackSummary() for _ in range(values.shape[1])]
+    for col, summary in enumerate(summaries):
+        for start in range(0, values.shape[0], chunk_bins):
+            summary.update(values[start:start + chunk_bins, col])
+    return summaries
+
+def quantile_reference(summaries: list[TrackSummary], n_levels: int = 1001) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Quantiles of each track at `n_levels` evenly spaced levels,
+    (track x level), and the reference distribution to normalize
+    them all to: their mean at every level
+    """
+    levels = np.linspace(0, 1, n_levels)
+    track_quantiles = np.stack([summary.quantile(levels) for summary in summaries]) if summaries else np.empty((0, n_levels))
+    return track_quantiles, track_quantiles.mean(axis=0)
+
+def normalize_binned(values: np.ndarray, summaries: list[TrackSummary], method: str, tracks: list[int] = None, chunk_bins: int = 1_000_000, force=False) -> list[TrackSummary]:
+    """
+    Normalize columns `tracks` (default all) of a (genome bin x track)
+    matrix in place, `chunk_bins` rows of one column at a time, so a
+    memory-mapped matrix (opened writable) is never all in memory:
+        - "asinh": inverse hyperbolic sine, log-like but defined at 0
+        - "zscore": minus the mean, over the standard deviation
+        - "quantile": each track mapped onto the mean quantile function of
+            `tracks` (e.g. replicates), through its own, as interpolated
+            from the tracks' quantile sketches
+    using every track's `summaries` (as accumulated while binning, see
+    `TrackSummary`) instead of a pass over the matrix to compute them.
+    Missing (NaN) bins stay missing.
+    Returns the summaries of the normalized matrix, accumulated in the same
+    pass, with `method` recorded in their `normalizations`. Tracks whose
+    summaries show they're already normalized are refused, unless `force`.
+    """
+    if method not in NORMALIZATIONS:
+        raise ValueError(f"Unknown normalization {method}, must be one of {NORMALIZATIONS}")
+    if tracks is None:
+        tracks = list(range(values.shape[1]))
+    normalized = {col: summaries[col].normalizations for col in tracks if summaries[col].normalizations}
+    if normalized and not force:
+        raise ValueError(f"Tracks {list(normalized)} are already normalized ({normalized}), force to normalize them again")
+    if method == "quantile":
+        track_quantiles, reference = quantile_reference([summaries[col] for col in tracks])
+
+    new_summaries = list(summaries)
+    for track_idx, col in enumerate(tracks):
+        summary = summaries[col]
+        new_summary = TrackSummary(summary.sketch.max_points)
+        new_summary.normalizations = summary.normalizations + [method]
+        for start in range(0, values.shape[0], chunk_bins):
+            chunk = values[start:start + chunk_bins, col]
+            if method == "asinh":
+                np.arcsinh(chunk, out=chunk)
+            elif method == "zscore":
+                chunk -= summary.mean
+                chunk /= summary.std if summary.std > 0 else 1.0
+            elif method == "quantile" and summary.count:
+                observed = ~np.isnan(chunk)
+                chunk[observed] = np.interp(chunk[observed], track_quantiles[track_idx], reference)
+            new_summary.update(chunk)
+        new_summaries[col] = new_summary
+    if isinstance(values, np.memmap):
+        values.flush()
+    return new_summaries
+
+DESCRIPTION = "Normalizes the tracks of a binned (genome bin x track) matrix in place, chunk by chunk, from the summary statistics gathered while binning."
+
+def add_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("binned_dir", type=Path, help="Binned output directory, as saved by the bigWig or bedGraph binners. Normalized in place.")
+    parser.add_argument("method", choices=NORMALIZATIONS, help="Normalization to apply.")
+    parser.add_argument("--tracks", nargs="+", help="Names of the tracks to normalize, e.g. replicates to quantile normalize together. Defaults to all tracks.")
+    parser.add_argument("--chunk-bins", type=int, default=1_000_000, help="Bins of each track held in memory at once.")
+    parser.add_argument("--force", action="store_true", help="Normalize tracks again even if `binned_dir`'s summaries show they already are.")
+    return parser
+
+def init_argparser(parser: argparse.ArgumentParser) -> argparse.Namespace:
+    return add_arguments(parser).parse_args()
+
+def main(args: argparse.Namespace) -> None:
+    binned = BinnedTracks.load(args.binned_dir, mmap_mode="r+")
+    summaries = binned.summaries
+    if summaries is None:
+        print(f"No summaries in {args.binned_dir}, computing them", flush=True)
+        summaries = summarize_values(binned.values, args.chunk_bins)
+    track_names = list(binned.tracks["name"])
+    tracks = None if args.tracks is None else [track_names.index(name) for name in args.tracks]
+
+    summaries = normalize_binned(binned.values, summaries, args.method, tracks, args.chunk_bins, args.force)
+    save_summaries(args.binned_dir / SUMMARY_FILE, summaries)
+    print(f"Normalized {args.tracks or 'all tracks'} with {args.method}:")
+    print(summaries_frame(summaries, track_names))
+
+if __name__ == "__main__":
+    main(init_argparser(argparse.ArgumentParser(description=DESCRIPTION)))
@@ -1,19 +1,36 @@
 import numpy as np
 import pandas as pd
-from pyBedGraph import BedGraph
 import multiprocessing as mp, functools
 import threading
+import os
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import itertools
 from math import ceil
+from typing import Union
 from pathlib import Path
 import argparse
+from ._util import expand_intervals
+from .binned import VALUES_FILE, MISSING_FILE, SUMMARY_FILE, chrom_table, genome_bin_edges, left_bin_edges, alloc_binned, save_binned
+from .missing import MissingIndex
+from .metrics import Metrics, NULL_METRICS
+from .summary import TrackSummary, save_summaries
 
-def init_argparser(parser: argparse.ArgumentParser):
-    parser.add_argument("data_dir", type=Path, help="Directory containing all bigWigs to be parsed, including within subdirectories.")
+DESCRIPTION = "Bins bedGraph files into one (genome bin x bedGraph) matrix, saved like the bigWig binner's output."
+
+def add_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("data_dir", type=Path, help="Directory containing all bedGraphs to be parsed, including within subdirectories.")
     parser.add_argument("bin_size", type=int, help="Size of bins to downsample the signal tracks to in base pairs. Also called resolution.")
+    parser.add_argument("--chrom-sizes", type=Path, help="Path to `.sizes` file to use. If not specified, will use `hg38.chrom.sizes` in `data_dir` directory")
+    parser.add_argument("--n-workers", type=int, help="Number of bedGraphs binned at once, each in its own thread. Defaults to the number of CPUs.")
+    parser.add_argument("--float32", action="store_true", help="Store binned values as 32-bit instead of 64-bit floats.")
+    parser.add_argument("--left-aligned", action="store_true", help="Lay bins from the start of every chromosome, only the last one shorter, instead of pyBigWig's bins.")
+    parser.add_argument("--out-dir", type=Path, help="Directory to write the binned output to. If not specified, will use `binned` in `data_dir` directory")
+    parser.add_argument("--metrics", type=Path, help="Record timings, counts and memory of the run, showing a live progress line, and write them as JSON to this file.")
     return parser
 
+def init_argparser(parser: argparse.ArgumentParser) -> argparse.Namespace:
+    return add_arguments(parser).parse_args()
+
 def collect_bedGraph_paths(bgs_root: Path):
     """
     Return a list of paths of all bedGraphs in `bgs_root` directory
@@ -34,58 +51,181 @@ def parse_chromosome_sizes(chrom_sizes_file: Path):
             chrom_sizes[chrom] = int(size)
     return chrom_sizes
 
-def load_bedgraph(bedgraph_file: Path, chrom_name: str, chrom_sizes_path: Path, bin_size: int) -> BedGraph:
-    """
-    Load bedgraph into memory
-    """
-    chrom_names = [chrom_name]
-    bedgraph = BedGraph(chrom_sizes_path, bedgraph_file, chrom_names)
-    print("Loading", bedgraph_file, "for", chrom_name)
-    bedgraph.load_chrom_bins(chrom_names, bin_size)
-    print("Loaded", bedgraph_file, "for", chrom_name)
-    return bedgraph
-
-def load_bedgraphs(bedgraph_paths: list[Path], chrom_sizes: dict, chrom_sizes_path: Path, bin_size: int, parallel: bool) -> list[BedGraph]:
-    """
-    Load all bedgraphs into memory
-    """
-    # Every signal track covers all chromosomes, load all in parallel
-    if parallel:
-        n_threads = len(chrom_sizes) * len(bedgraph_paths)
-    else:
-        n_threads = 1
-    print(f"Loading {len(chrom_sizes)} chromosomes for each of {len(bedgraph_paths)} bedgraphs in {n_threads} threads")
-
-    bedgraphs = []
-    with ThreadPoolExecutor(max_workers=n_threads) as thr_pool:
-        # TODO: probably getting a deadlock right now, bedgraph file can only be accessed by one thread at a time?
-        #   => just load each chrom of bedgraph sequentially
-        for chrom_name in chrom_sizes.keys():
-            for bedgraph_path in bedgraph_paths:
-                bedgraphs.append(thr_pool.submit(load_bedgraph, bedgraph_path, chrom_name, chrom_sizes_path, bin_size))
-    
-    return bedgraphs
-
-def bin_bedgraphs(bedgraphs: list[BedGraph], chrom_sizes: dict, parallel: bool):
+def count_header_lines(bedgraph_path: Path) -> int:
     """
-    Bin all bedgraphs into bins of size bin_size simultaneously
+    Number of leading "track"/"browser"/comment lines of a bedGraph
     """
-    pass
-    # First get all binned values into one list with all bedgraphs(tracks)
-    # Now that loaded, CPU-bound
-    # binned_vals_lists = []
+    n_header = 0
+    with open(bedgraph_path, "r") as f:
+        for line in f:
+            if not line.startswith(("track", "browser", "#")) and line.strip():
+                break
+            n_header += 1
+    return n_header
 
-if __name__ == "__main__":
-    DATA_DIR = Path().resolve().parent.parent / "data"
-    print(DATA_DIR.absolute())
-    SIZES_FILE_PATH = DATA_DIR / "hg38.chrom.sizes"
-    BIN_SIZE = 1000
+class BedGraphsBinner:
+    def __init__(self, bedgraph_paths: list[Path], chrom_sizes: Union[dict[str, int], pd.DataFrame], bin_size: int, parallel=True, n_workers: int = None, dtype=np.float64, out_dir: Path = None, chunk_lines: int = 1_000_000, left_aligned=False, metrics: Metrics = None):
+        """
+        Bins bedGraphs into the same (genome bin x bedGraph) matrix, bins
+        (left-aligned or not), missing index and saved output as
+        `BigWigsBinner`, in one streaming pass per file, `chunk_lines` lines
+        at a time, so a file is never all in memory, only its per bin sums.
+        `parallel` bins `n_workers` (default one per CPU) files at once, in
+        threads, so at most that many files' sums are in memory.
+        `metrics` records timings, counts, memory and progress (see `Metrics`).
+        """
+        self.bin_size = bin_size
+        self.parallel = parallel
+        self.n_workers = n_workers
+        self.dtype = np.dtype(dtype)
+        self.out_dir = out_dir
+        self.chunk_lines = chunk_lines
+        self.left_aligned = left_aligned
+        self.bedgraph_paths = list(bedgraph_paths)
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+
+        self.chrom_sizes = chrom_table(chrom_sizes, bin_size)
+        # all chromosomes' bins end to end, to bin a chunk of every chromosome at once
+        if left_aligned:
+            self.genome_edges, self.chrom_bp_offsets = genome_bin_edges(self.chrom_sizes, lambda chr_size, n_bins: left_bin_edges(chr_size, bin_size))
+        else:
+            self.genome_edges, self.chrom_bp_offsets = genome_bin_edges(self.chrom_sizes)
+
+        self.missing_index = None
+        self.binned_mat = None
+        self.track_summaries = []
+
+    @property
+    def missing_bins(self) -> pd.DataFrame:
+        """
+        Table of the missing bins runs: bigwig (i.e. bedGraph), chrom, start, end (inclusive)
+        """
+        if self.missing_index is None:
+            return pd.DataFrame({"bigwig": [], "chrom": [], "start": [], "end": []})
+        return self.missing_index.to_frame()
+
+    def bin_sums_bg(self, bedgraph_path: Path) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Stream through a bedGraph, scattering every chunk of intervals
+        into all chromosomes' bins: returns, per genome bin, the sum of
+        value x overlap and the number of base pairs covered.
+        A bedGraph without intervals (empty, or only header lines)
+        covers nothing, so all its bins are missing.
+        """
+        n_rows = len(self.genome_edges) - 1
+        sums = np.zeros(n_rows, dtype=np.float64)
+        n_covered = np.zeros(n_rows, dtype=np.int64)
+        chrom_names = pd.Index(self.chrom_sizes["name"].astype(str))
+        chrom_lens = self.chrom_sizes["size"].to_numpy(dtype=np.int64)
+        track = Path(bedgraph_path).stem
 
-    bg_paths = collect_bedGraph_paths(DATA_DIR)
+        try:
+            chunks = pd.read_csv(
+                bedgraph_path, sep=r"\s+", header=None, usecols=[0, 1, 2, 3],
+                names=["chrom", "start", "end", "value"],
+                dtype={"chrom": str, "start": np.int64, "end": np.int64, "value": np.float64},
+                skiprows=count_header_lines(bedgraph_path), chunksize=self.chunk_lines,
+            )
+        except pd.errors.EmptyDataError:
+            print(f"No intervals in {bedgraph_path}, all its bins are missing", flush=True)
+            return sums, n_covered
+        for chunk in self.metrics.timed_iter(chunks, "read", track):
+            self.metrics.count("intervals", len(chunk.index), track)
+            chr_idxs = chrom_names.get_indexer(chunk["chrom"])
+            # skip chromosomes not binned
+            in_chroms = chr_idxs >= 0
+            chr_idxs = chr_idxs[in_chroms]
+            offsets = self.chrom_bp_offsets[chr_idxs]
+            starts = chunk["start"].to_numpy()[in_chroms] + offsets
+            ends = np.minimum(chunk["end"].to_numpy()[in_chroms], chrom_lens[chr_idxs]) + offsets
+            values = chunk["value"].to_numpy()[in_chroms]
+
+            with self.metrics.time("stats", track):
+                interval_idxs, bins, overlaps = expand_intervals(starts, ends, self.genome_edges)
+                if len(bins) == 0:
+                    continue
+                # only touch the rows this chunk covers
+                lo, hi = bins.min(), bins.max() + 1
+                sums[lo:hi] += np.bincount(bins - lo, weights=values[interval_idxs] * overlaps, minlength=hi - lo)
+                n_covered[lo:hi] += np.bincount(bins - lo, weights=overlaps, minlength=hi - lo).astype(np.int64)
+        return sums, n_covered
+
+    def load_bin_bg(self, bg_idx: int, bedgraph_path: Path) -> np.ndarray:
+        """
+        Bin one bedGraph into the `bg_idx`th column of `binned_mat`
+        """
+        track = Path(bedgraph_path).stem
+        with self.metrics.time("task", track):
+            self.metrics.count("file_size_bytes", os.path.getsize(bedgraph_path), track)
+            sums, n_covered = self.bin_sums_bg(bedgraph_path)
+            with self.metrics.time("write", track), np.errstate(invalid="ignore", divide="ignore"):
+                self.binned_mat[:, bg_idx] = np.where(n_covered > 0, sums / n_covered, np.nan)
+            with self.metrics.time("summary", track):
+                self.track_summaries[bg_idx].update(self.binned_mat[:, bg_idx])
+            self.metrics.count("bins", len(n_covered), track)
+        self.metrics.task_done()
+        return self.binned_mat[:, bg_idx]
+
+    def load_bin_all_bgs(self) -> np.ndarray:
+        n_bgs = len(self.bedgraph_paths)
+        n_threads = min(n_bgs, self.n_workers or os.cpu_count()) if self.parallel else 1
+        print(f"Binning {n_bgs} bedGraphs in {n_threads} threads", flush=True)
+        self.metrics.start("Binning bedGraphs", n_bgs, n_threads)
+
+        values_path = None
+        if self.out_dir is not None:
+            Path(self.out_dir).mkdir(parents=True, exist_ok=True)
+            values_path = Path(self.out_dir) / VALUES_FILE
+        self.binned_mat = alloc_binned(len(self.genome_edges) - 1, n_bgs, self.dtype, values_path)
+        self.track_summaries = [TrackSummary() for _ in range(n_bgs)]
+        self.metrics.mark("allocated")
+
+        with ThreadPoolExecutor(max_workers=max(1, n_threads)) as thr_pool:
+            for _ in thr_pool.map(self.load_bin_bg, range(n_bgs), self.bedgraph_paths):
+                pass
+        self.metrics.mark("binned")
+
+        # record missing bins ranges, all tracks in one pass
+        with self.metrics.time("nan_scan"):
+            self.missing_index = MissingIndex.from_matrix(self.binned_mat, self.chrom_sizes)
+        self.metrics.finish()
+        print(f"Done binning bedGraphs into {self.binned_mat.shape} matrix", flush=True)
+        return self.binned_mat
+
+    def save(self, out_dir: Path) -> None:
+        """
+        Save as `BigWigsBinner.save` does, summaries included
+        """
+        tracks = pd.DataFrame({
+            "name": [Path(path).stem for path in self.bedgraph_paths],
+            "path": [str(path) for path in self.bedgraph_paths],
+        })
+        save_binned(out_dir, self.binned_mat, self.chrom_sizes, tracks, self.bin_size, self.left_aligned)
+        self.missing_index.save(Path(out_dir) / MISSING_FILE)
+        save_summaries(Path(out_dir) / SUMMARY_FILE, self.track_summaries)
+
+def main(args: argparse.Namespace) -> None:
+    if args.chrom_sizes is None:
+        args.chrom_sizes = args.data_dir / "hg38.chrom.sizes"
+    if args.out_dir is None:
+        args.out_dir = args.data_dir / "binned"
+
+    bg_paths = collect_bedGraph_paths(args.data_dir)
     print(f"Found {len(bg_paths)} bedGraphs")
-    chrom_sizes = parse_chromosome_sizes(SIZES_FILE_PATH)
+    chrom_sizes = parse_chromosome_sizes(args.chrom_sizes)
     print("Parsed chromosome sizes:\n", chrom_sizes)
-    chrom_sizes = dict(itertools.islice(chrom_sizes.items(), 5))
 
-    bedgraph_objs = load_bedgraphs(bg_paths, chrom_sizes, SIZES_FILE_PATH, 1000, parallel=True)
-    print(f"Loaded {len(bedgraph_objs)} bedgraphs")
\ No newline at end of file
+    metrics = Metrics() if args.metrics is not None else None
+    bg_binner = BedGraphsBinner(bg_paths, chrom_sizes, args.bin_size, n_workers=args.n_workers, dtype=np.float32 if args.float32 else np.float64, out_dir=args.out_dir, left_aligned=args.left_aligned, metrics=metrics)
+    bg_binner.load_bin_all_bgs()
+    if metrics is not None:
+        metrics.save(args.metrics)
+        print(f"Saved run metrics to {args.metrics}")
+    print("Missing bins:")
+    print(bg_binner.missing_bins)
+
+    bg_binner.save(args.out_dir)
+    print(f"Saved binned values, chromosome ranges and missing bins to {args.out_dir}")
+
+if __name__ == "__main__":
+    main(init_argparser(argparse.ArgumentParser(description=DESCRIPTION)))
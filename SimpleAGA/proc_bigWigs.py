@@ -1,136 +1,371 @@
-import numpy as np, torch
+import numpy as np
 from math import ceil
 import pandas as pd
-from pyBedGraph import BedGraph
 import pyBigWig
 import multiprocessing as mp, functools
 import multiprocessing.pool
+from multiprocessing import shared_memory
 import threading
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import itertools
+import collections
 import sys
-from typing import Union
+from typing import Union, NamedTuple, Iterator
 from pathlib import Path
-import pickle
 import argparse
-from ._util import find_nan_runs
+from ._util import find_nan_runs, bin_interval_means, bin_interval_sums, bin_interval_stats, bin_interval_runs, BIN_STATS
+from .binned import VALUES_FILE, MISSING_FILE, SUMMARY_FILE, chrom_table, pybigwig_bin_edges, left_bin_edges, alloc_binned, save_binned
+from .missing import MissingIndex
+from .cache import BinnedCache
+from .pyramid import BinPyramid
+from .metrics import Metrics, NULL_METRICS
+from .summary import TrackSummary, save_summaries, summaries_frame
+from .handles import DEFAULT_MAX_OPEN, BigWigPool, validate_bigwig_headers
+from .sparse import RunLengthTrack, choose_storage, save_tracks
 
-def parse_chromosome_sizes(chrom_sizes_file: Path) -> dict[str, int]:
+def parse_chromosome_sizes(chrom_sizes_file: Path, chroms: list[str] = None) -> dict[str, int]:
     """
-    Parse chromosome sizes file into a dictionary: {chrom[str]: size[int]}
+    Parse chromosome sizes file into a dictionary: {chrom[str]: size[int]},
+    only of `chroms` if given, in the file's order
     """
     chrom_sizes = {}
     with open(chrom_sizes_file, 'r') as f:
-        # for testing
-        for line in itertools.islice(f, 5, 7):
-            chrom, size = line.strip().split()
+        for line in f:
+            if not line.strip():
+                continue
+            chrom, size = line.split()[:2]
             chrom_sizes[chrom] = int(size)
-        # for line in f:
-        #     chrom, size = line.strip().split()
-        #     chrom_sizes[chrom] = int(size)
+    if chroms is not None:
+        unknown = set(chroms) - chrom_sizes.keys()
+        if unknown:
+            raise ValueError(f"{sorted(unknown)} not in {chrom_sizes_file}")
+        chrom_sizes = {chrom: size for chrom, size in chrom_sizes.items() if chrom in chroms}
     return chrom_sizes
 
+BIGWIG_SUFFIXES = (".bw", ".bigwig")
+
 def collect_bigWig_paths(bgs_root: Path) -> list[Path]:
     """
-    Return a list of paths of all bigWigs in `bgs_root` directory
+    Return a sorted list of paths of all bigWigs (`.bw` or `.bigWig`
+    files, any case) in `bgs_root` directory and its subdirectories
     """
     if not bgs_root.is_dir():
         raise ValueError(f"{bgs_root} is not a directory")
-    # TEMPORARY for testing
-    return list(bgs_root.rglob("*.bigWig"))
+    return sorted(path for path in bgs_root.rglob("*") if path.is_file() and path.suffix.lower() in BIGWIG_SUFFIXES)
 
-# TODO: argparse -> genomedata-style {--track <track_name> <track_file>}_i, i = 1 to n
+def named_bigWig_paths(inputs: list[Path], tracks: list[tuple[str, str]] = ()) -> tuple[list[str], list[Path]]:
+    """
+    Track names and paths of the bigWigs of `inputs`, files or directories
+    to collect them from (see `collect_bigWig_paths`), named by their file
+    names' stems, followed by `tracks`' (name, path) pairs
+    """
+    paths = []
+    for path in inputs:
+        paths.extend(collect_bigWig_paths(path) if path.is_dir() else [path])
+    names = [path.stem for path in paths] + [name for name, _ in tracks]
+    paths += [Path(path) for _, path in tracks]
+    duplicates = sorted(name for name, count in collections.Counter(names).items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Tracks named more than once: {duplicates}")
+    return names, paths
 
-def open_bigwigs(bigwig_paths: list[Path], parallel: bool) -> list:
-    if parallel:
-        n_threads = len(bigwig_paths)
+def fetch_intervals(bigwig, chr_name: str, start: int = None, end: int = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Starts, ends and values arrays of `bigwig`'s intervals
+    on `chr_name` (within [start, end) if given)
+    """
+    if start is None:
+        intervals = bigwig.intervals(chr_name)
     else:
-        n_threads = 1
-    print(f"Opening {len(bigwig_paths)} bigwigs in {n_threads} threads", flush=True)
-
-    bw_paths_strs = [str(path.absolute()) for path in bigwig_paths]
-    bw_objs = None
-    with ThreadPoolExecutor(max_workers=n_threads) as thr_pool:
-        bw_objs = thr_pool.map(pyBigWig.open, bw_paths_strs)
-    # for bw_path_str in bw_paths_strs:
-    #     bw_obj = pyBigWig.open(bw_path_str)
-    #     if bw_objs is None:
-    #         bw_objs = [bw_obj]
-    #     else:
-    #         bw_objs.append(bw_obj)
-    return bw_objs
-
-def close_bigwigs(bigwig_objs: list) -> None:
-    for bw in bigwig_objs:
-        bw.close()
+        intervals = bigwig.intervals(chr_name, int(start), int(end))
+    intervals = np.array(intervals or (), dtype=np.float64).reshape(-1, 3)
+    return intervals[:, 0].astype(np.int64), intervals[:, 1].astype(np.int64), intervals[:, 2]
+
+# most base pairs of a chromosome whose intervals are fetched at once: pyBigWig
+# returns them as Python tuples (~250 B each), so whole chromosomes of
+# dense tracks would take GBs per thread
+FETCH_WINDOW_BP = 10_000_000
+
+def edge_windows(bin_edges: np.ndarray, window_bp: int = FETCH_WINDOW_BP) -> list[tuple[int, int]]:
+    """
+    Split the bins [bin_edges[i], bin_edges[i+1]) into consecutive [lo, hi)
+    runs of bins spanning about `window_bp` base pairs each (at least one
+    bin), whose intervals can be fetched and binned on their own
+    """
+    n_bins = len(bin_edges) - 1
+    if n_bins < 1:
+        return []
+    targets = bin_edges[0] + np.arange(window_bp, bin_edges[-1] - bin_edges[0], window_bp, dtype=np.int64)
+    # each window starts at the bin containing its target base pair
+    bounds = np.unique(np.concatenate(([0], np.searchsorted(bin_edges, targets, side="right") - 1, [n_bins])))
+    return [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+def fetch_windows(bigwig, chr_name: str, bin_edges: np.ndarray, window_bp: int = FETCH_WINDOW_BP, metrics: Metrics = NULL_METRICS, track: str = None) -> Iterator[tuple[int, int, tuple[np.ndarray, np.ndarray, np.ndarray]]]:
+    """
+    Bins [lo, hi) of every `edge_windows` window of `bin_edges`, in order,
+    with `bigwig`'s intervals overlapping them (see `fetch_intervals`),
+    so only one window's intervals are ever in memory.
+    Reading is timed in `metrics`, as `track`'s.
+    """
+    for lo, hi in edge_windows(bin_edges, window_bp):
+        with metrics.time("read", track, chr_name):
+            intervals = fetch_intervals(bigwig, chr_name, bin_edges[lo], bin_edges[hi])
+        metrics.count("intervals", len(intervals[0]), track)
+        yield lo, hi, intervals
+
+def bin_region(bigwig, chr_name: str, bin_edges: np.ndarray, metrics: Metrics = NULL_METRICS, track: str = None, window_bp: int = FETCH_WINDOW_BP) -> np.ndarray:
+    """
+    Mean signal value of `bigwig` in each bin [bin_edges[i], bin_edges[i+1])
+    of `chr_name`, from its intervals there, read `window_bp` at a time (see
+    `fetch_windows`). All the mean binning (whole chromosomes or blocks of
+    them) goes through here, so bins are the same however they're read.
+    Reading and binning are timed in `metrics`, as `track`'s.
+    """
+    # exact means from the intervals rather than `bigwig.stats`, which may
+    # answer from zoom levels and is several times slower than reading them
+    binneds = np.empty(len(bin_edges) - 1, dtype=np.float64)
+    for lo, hi, intervals in fetch_windows(bigwig, chr_name, bin_edges, window_bp, metrics, track):
+        with metrics.time("stats", track, chr_name):
+            binneds[lo:hi] = bin_interval_means(*intervals, bin_edges[lo:hi + 1])
+    return binneds
+
+def bin_chrom(bigwig, chr_name: str, chr_size: int, chr_bins: int, bin_size: int, left_aligned=False, metrics: Metrics = NULL_METRICS, track: str = None, window_bp: int = FETCH_WINDOW_BP) -> np.ndarray:
+    """
+    Mean signal value in each bin of one chromosome of `bigwig` (see
+    `bin_region`). Either `bigwig.stats`' layout of `chr_bins` bins
+    (see `pybigwig_bin_edges`), or, if `left_aligned`, `bin_size` bins
+    from the start of the chromosome (see `left_bin_edges`).
+    """
+    bin_edges = left_bin_edges(chr_size, bin_size) if left_aligned else pybigwig_bin_edges(chr_size, chr_bins)
+    return bin_region(bigwig, chr_name, bin_edges, metrics, track, window_bp)
+
+def bin_tasks(chrom_sizes: pd.DataFrame, n_bigwigs: int) -> list[tuple[int, int]]:
+    """
+    List every (bigWig index, chromosome index) pair to bin,
+    largest chromosomes first so the long tasks start early
+    and the small ones fill in the gaps at the end
+    """
+    chr_order = np.argsort(-chrom_sizes["size"].to_numpy(), kind="stable")
+    return [(bw_idx, int(chr_idx)) for chr_idx in chr_order for bw_idx in range(n_bigwigs)]
+
+# pyBigWig handles opened by a process pool worker, reused across its tasks
+_worker_pool = None
+
+def _bin_chrom_worker(bw_path: str, bw_idx: int, chr_name: str, chr_size: int, chr_bins: int, bin_size: int, left_aligned: bool, row_start: int, out_ref: str, out_shape: tuple[int, int], out_dtype: str, collect_metrics=False, max_open: int = DEFAULT_MAX_OPEN, window_bp: int = FETCH_WINDOW_BP) -> tuple[tuple[list[dict], dict], TrackSummary]:
+    """
+    Process pool task: bin one chromosome of one bigWig straight into
+    the shared (genome bin x bigWig) output `out_ref`, either the path of
+    a memory-mapped `.npy` or the name of a shared memory block.
+    The worker keeps at most `max_open` bigWigs open (see `BigWigPool`).
+    Returns the chromosome's `TrackSummary`, for the parent to merge
+    into the bigWig's, and, if `collect_metrics`, the task's timings
+    and counts for the parent's `Metrics.merge`.
+    """
+    global _worker_pool
+    metrics = Metrics(progress=False) if collect_metrics else NULL_METRICS
+    track = Path(bw_path).stem
+    with metrics.time("task", track, chr_name):
+        if _worker_pool is None or _worker_pool.max_open != max_open:
+            _worker_pool = BigWigPool(max_open)
+        _worker_pool.metrics = metrics
+        with _worker_pool.lease(bw_path) as bigwig:
+            binneds = bin_chrom(bigwig, chr_name, chr_size, chr_bins, bin_size, left_aligned, metrics, track, window_bp)
+
+        with metrics.time("write", track, chr_name):
+            if out_ref.endswith(".npy"):
+                out = np.load(out_ref, mmap_mode="r+")
+                out[row_start:row_start + chr_bins, bw_idx] = binneds
+                out.flush()
+                del out
+            else:
+                shm = shared_memory.SharedMemory(name=out_ref)
+                try:
+                    out = np.ndarray(out_shape, dtype=out_dtype, buffer=shm.buf, order="F")
+                    out[row_start:row_start + chr_bins, bw_idx] = binneds
+                    del out
+                finally:
+                    shm.close()
+        with metrics.time("summary", track, chr_name):
+            summary = TrackSummary().update(binneds)
+        metrics.count("bins", chr_bins, track)
+    return metrics.worker_state() if collect_metrics else None, summary
+
+class BinnedBlock(NamedTuple):
+    """
+    `block_bins` consecutive bins of one chromosome, for all bigWigs
+    """
+    chrom: str
+    # [start, end) bins within the chromosome
+    start: int
+    end: int
+    # row of the first bin in the genome-wide matrix
+    row_start: int
+    # base pair boundaries of the bins, bin i is [bp_edges[i], bp_edges[i+1])
+    bp_edges: np.ndarray
+    # (bin x bigWig) binned values, NaN where missing
+    values: np.ndarray
+    # (bin x bigWig) whether missing
+    missing: np.ndarray
 
 class BigWigsBinner:
-    def __init__(self, bigwig_paths: list[Path], chrom_sizes: Union[dict[str, int], pd.DataFrame], bin_size: int, parallel=True):
+    def __init__(self, bigwig_paths: list[Path], chrom_sizes: Union[dict[str, int], pd.DataFrame], bin_size: int, parallel=True, processes=False, n_workers: int = None, dtype=np.float64, out_dir: Path = None, cache: BinnedCache = None, left_aligned=False, metrics: Metrics = None, max_open: int = DEFAULT_MAX_OPEN, validate=True, window_bp: int = FETCH_WINDOW_BP, track_names: list[str] = None):
+        """
+        `processes` bins with a pool of `n_workers` processes
+        (default one per CPU), one task per (bigWig, chromosome),
+        instead of one thread per bigWig.
+        Binned values go into one (genome bin x bigWig) matrix of `dtype`,
+        memory-mapped into `out_dir` (see `save`) if given.
+        Chromosomes already binned the same way in `cache` are reused
+        from there instead of rebinned.
+        By default bins are laid out as `bigwig.stats`', which spread the
+        remainder of a chromosome that `bin_size` doesn't divide over its
+        first bins (see `pybigwig_bin_edges`), though always binned from
+        the intervals (see `bin_chrom`). `left_aligned` instead lays `bin_size`
+        bins from the start, only the last one shorter (see `left_bin_edges`).
+        `metrics` records timings, counts, memory and progress of opening
+        and binning (see `Metrics`), nothing if not given.
+        bigWigs are opened when first binned, at most `max_open` at once
+        (per process, see `BigWigPool`), and closed by `close`, or on
+        leaving a `with` block of the binner. If `validate`, all their
+        headers are first checked against `chrom_sizes` (see
+        `validate_bigwig_headers`), so files of another assembly fail early.
+        Intervals are read at most `window_bp` of a chromosome at a time
+        (see `fetch_windows`), whatever is being binned.
+        Tracks are saved as `track_names`, by default the bigWigs' file
+        names' stems.
+        """
         self.bin_size = bin_size
         self.parallel = parallel
+        self.processes = processes
+        self.n_workers = n_workers
+        self.dtype = np.dtype(dtype)
+        self.out_dir = out_dir
+        self.cache = cache
+        self.left_aligned = left_aligned
+        self.metrics = metrics if metrics is not None else NULL_METRICS
 
         # NOTE: currently only support all bigWigs same assembly => same chrom sizes
-        if isinstance(chrom_sizes, dict):
-            self.chrom_sizes = pd.DataFrame({
-                "name": chrom_sizes.keys(),
-                "size": chrom_sizes.values(),
-                "n_bins": [ceil(size / bin_size) for size in chrom_sizes.values()],
-            })
-        elif isinstance(chrom_sizes, pd.DataFrame):
-            req_cols = set(["name", "size"])
-            if req_cols.issubset(chrom_sizes.columns):
-                self.chrom_sizes = chrom_sizes
-                if "n_bins" not in chrom_sizes.columns:
-                    self.chrom_sizes["n_bins"] = np.ceil(self.chrom_sizes["size"] / bin_size)
-            else:
-                raise ValueError(f"`chrom_sizes` given is a pandas DataFrame. It must include columns {req_cols}, but currently does not: {chrom_sizes.columns}")
-        else:
-            raise TypeError(f"`chrom_sizes` given is a {type(chrom_sizes)}, not a <str : int> dictionary nor pandas DataFrame")
+        self.chrom_sizes = chrom_table(chrom_sizes, bin_size)
 
-        self.bigwigs_tbl = pd.DataFrame({
-            "path": bigwig_paths,
-            "bw_obj": open_bigwigs(bigwig_paths, parallel),
-        })
+        if track_names is None:
+            track_names = [Path(path).stem for path in bigwig_paths]
+        elif len(track_names) != len(bigwig_paths):
+            raise ValueError(f"{len(track_names)} track names for {len(bigwig_paths)} bigWigs")
+        self.bigwigs_tbl = pd.DataFrame({"name": list(track_names), "path": bigwig_paths})
+        self.bw_path_strs = [str(Path(path).absolute()) for path in bigwig_paths]
+        self.max_open = max_open
+        self.window_bp = window_bp
+        self.handles = BigWigPool(max_open, self.metrics)
+        if validate and len(self.bw_path_strs):
+            print(f"Checking {len(self.bw_path_strs)} bigWigs' headers", flush=True)
+            with self.metrics.time("validate"):
+                validate_bigwig_headers(self.bw_path_strs, self.chrom_sizes, n_threads=min(max_open, 32) if parallel else 1)
 
-        # keep track of missing signal value ranges
-        # each index corresponds to a row
-        self.missing_bins = {
-            "bigwig": [],
-            "chrom": [],
-            "start": [],
-            "end": []
-        }
+        # keep track of missing signal value ranges,
+        # indexed from the whole matrix once binned
+        self.missing_index = None
+        # and every bigWig's summary statistics, accumulated while binning
+        self.track_summaries = [TrackSummary() for _ in range(len(self.bigwigs_tbl.index))]
 
-        # store everything in a 2D list of numpy arrays,
+        # (genome bin x bigWig) matrix, allocated when binning starts
+        self.binned_mat = None
+        # and views of it as a 2D list of numpy arrays,
         # where each row is a bigWig and each column is a chromosome,
         # one array per chromosome
         self.binned_vals = [[] for _ in range(len(self.bigwigs_tbl.index))]
 
-    def __del__(self):
-        close_bigwigs(self.bigwigs_tbl["bw_obj"])
-        del self.chrom_sizes
-        del self.bigwigs_tbl
+    @property
+    def missing_bins(self) -> pd.DataFrame:
+        """
+        Table of the missing bins runs: bigwig, chrom, start, end (inclusive)
+        """
+        if self.missing_index is None:
+            return pd.DataFrame({"bigwig": [], "chrom": [], "start": [], "end": []})
+        return self.missing_index.to_frame()
+
+    def __enter__(self) -> "BigWigsBinner":
+        return self
 
-    def load_bin_bw(self, bw_idx: int, bigwig) -> list[np.ndarray]:
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Close all open bigWigs. Binning again reopens them.
+        """
+        self.handles.close()
+
+    def alloc_binned_mat(self) -> np.ndarray:
+        """
+        Allocate the (genome bin x bigWig) matrix,
+        memory-mapped in `out_dir` if there is one
+        """
+        values_path = None
+        if self.out_dir is not None:
+            Path(self.out_dir).mkdir(parents=True, exist_ok=True)
+            values_path = Path(self.out_dir) / VALUES_FILE
+        n_bins = int(self.chrom_sizes["row_end"].iat[-1]) if len(self.chrom_sizes.index) else 0
+        self.binned_mat = alloc_binned(n_bins, len(self.bigwigs_tbl.index), self.dtype, values_path)
+        return self.binned_mat
+
+    def binned_mat_views(self) -> list[list[np.ndarray]]:
+        """
+        Per bigWig, per chromosome views of `binned_mat`, no copies
+        """
+        return [
+            [self.binned_mat[row_start:row_end, bw_idx] for row_start, row_end in zip(self.chrom_sizes["row_start"], self.chrom_sizes["row_end"])]
+            for bw_idx in range(len(self.bigwigs_tbl.index))
+        ]
+
+    def bin_edges(self, chr_idx: int) -> np.ndarray:
+        """
+        Base pair boundaries of the `chr_idx`th chromosome's bins:
+        bin i is [edges[i], edges[i+1])
+        """
+        chr_size, chr_bins = self.chrom_sizes[["size", "n_bins"]].iloc[chr_idx]
+        if self.left_aligned:
+            return left_bin_edges(int(chr_size), self.bin_size)
+        return pybigwig_bin_edges(int(chr_size), int(chr_bins))
+
+    def cache_key(self, bw_idx: int, chr_idx: int) -> str:
+        chr_name, chr_size = self.chrom_sizes[["name", "size"]].iloc[chr_idx]
+        stat = "mean:left" if self.left_aligned else "mean:intervals"
+        return self.cache.key(self.bigwigs_tbl["path"].iat[bw_idx], self.bin_size, stat, self.dtype, str(chr_name), int(chr_size))
+
+    def load_bin_bw(self, bw_idx: int) -> list[np.ndarray]:
         """
         "Loads" and bins all the signal values into the
-        `bw_idx`th row of the `binned_vals` 2D list
+        `bw_idx`th column of `binned_mat`, returned as
+        the `bw_idx`th row of the `binned_vals` 2D list
         """
-        for chr_name, chr_len, chr_bins in self.chrom_sizes.itertuples(index=False, name=None):
+        track = Path(self.bigwigs_tbl["path"].iat[bw_idx]).stem
+        for chr_idx, (chr_name, chr_size, chr_bins, row_start, row_end) in enumerate(self.chrom_sizes[["name", "size", "n_bins", "row_start", "row_end"]].itertuples(index=False, name=None)):
             # print(f"Loading {chr_name} of {bw_idx}th bigWig", flush=True)
+            chr_name = str(chr_name)
+            with self.metrics.time("task", track, chr_name):
+                cached = None
+                if self.cache is not None:
+                    cache_key = self.cache_key(bw_idx, chr_idx)
+                    with self.metrics.time("cache_get", track, chr_name):
+                        cached = self.cache.get(cache_key)
 
-            # TODO: check bigwig.stats docs, what if don't divide evenly?
-            #   "remainder" bin averaged proportional to its actual (shorter) length?
-            binneds = bigwig.stats(str(chr_name), nBins=int(chr_bins), type="mean", numpy=True)
-            self.binned_vals[bw_idx].append(binneds)
-        
-            # record missing bins ranges
-            missing_starts, missing_ends = find_nan_runs(binneds)
-            # all in this chrom, and so also this bigWig
-            self.missing_bins["bigwig"] += [bw_idx] * len(missing_starts)
-            self.missing_bins["chrom"] += [chr_name] * len(missing_starts)
-            self.missing_bins["start"] += list(missing_starts)
-            self.missing_bins["end"] += list(missing_ends)
+                if cached is not None:
+                    self.metrics.count("cache_hits", 1, track)
+                    with self.metrics.time("write", track, chr_name):
+                        self.binned_mat[row_start:row_end, bw_idx] = cached
+                else:
+                    with self.handles.lease(self.bw_path_strs[bw_idx]) as bigwig:
+                        binneds = bin_chrom(bigwig, chr_name, int(chr_size), int(chr_bins), self.bin_size, self.left_aligned, self.metrics, track, self.window_bp)
+                    with self.metrics.time("write", track, chr_name):
+                        self.binned_mat[row_start:row_end, bw_idx] = binneds
+                        if self.cache is not None:
+                            self.cache.put(cache_key, self.binned_mat[row_start:row_end, bw_idx])
+                with self.metrics.time("summary", track, chr_name):
+                    self.track_summaries[bw_idx].update(self.binned_mat[row_start:row_end, bw_idx])
+                self.binned_vals[bw_idx].append(self.binned_mat[row_start:row_end, bw_idx])
+                self.metrics.count("bins", int(chr_bins), track)
+            self.metrics.task_done()
             
             # print(f"Now in `binned_vals[{bw_idx}]`, type = {type(self.binned_vals[bw_idx][-1])}, sum = {np.nansum(self.binned_vals[bw_idx][-1])}", flush=True)
             # print(f"Now {self.binned_vals[bw_idx][-1]} in `binned_vals[{bw_idx}]`", flush=True)
@@ -139,71 +374,358 @@ class BigWigsBinner:
         return self.binned_vals[bw_idx]
     
     def load_bin_all_bws(self) -> list[list[np.ndarray]]:
+        if self.processes:
+            return self.load_bin_all_bws_procs()
+
         if self.parallel:
-            n_threads = len(self.bigwigs_tbl.index)
+            n_threads = max(1, min(len(self.bigwigs_tbl.index), self.max_open))
         else:
             n_threads = 1
         print(f"Loading {n_threads} bigWigs' signal values into NumPy arrays in {n_threads} threads", flush=True)
+        self.metrics.start("Binning bigWigs", len(self.bigwigs_tbl.index) * len(self.chrom_sizes.index), n_threads)
+        self.alloc_binned_mat()
+        self.metrics.mark("allocated")
+        self.binned_vals = [[] for _ in range(len(self.bigwigs_tbl.index))]
+        self.track_summaries = [TrackSummary() for _ in range(len(self.bigwigs_tbl.index))]
 
         # TESTING: sequential version \/ ==========
-        # for (bw_idx, bw_obj) in enumerate(self.bigwigs_tbl["bw_obj"]):
-        #     self.load_bin_bw(bw_obj, bw_idx)
+        # for bw_idx in range(len(self.bigwigs_tbl.index)):
+        #     self.load_bin_bw(bw_idx)
         # =========================================
 
         with mp.pool.ThreadPool(processes=n_threads) as thr_pool:
-            self.binned_vals = thr_pool.starmap(self.load_bin_bw, list(self.bigwigs_tbl["bw_obj"].to_dict().items()))
+            self.binned_vals = thr_pool.map(self.load_bin_bw, range(len(self.bigwigs_tbl.index)))
             # futures = []
-            # for (bw_idx, bw_obj) in enumerate(self.bigwigs_tbl["bw_obj"]):
+            # for bw_idx in range(len(self.bigwigs_tbl.index)):
             #     print(f"Submitting {bw_idx}th bigWig to thread pool...")
-            #     futures.append(thr_pool.submit(self.load_bin_bw, bw_obj, bw_idx))
+            #     futures.append(thr_pool.submit(self.load_bin_bw, bw_idx))
 
             # for future in futures:
             #     print(f"Future {future} running? {future.running()}", flush=True)
-        
-        print(f"Done loading bigWigs' signal values into 2D list of NumPy arrays, {len(self.binned_vals)} rows", flush=True)
+        self.metrics.mark("binned")
+
+        # record missing bins ranges, all tracks in one pass
+        with self.metrics.time("nan_scan"):
+            self.missing_index = MissingIndex.from_matrix(self.binned_mat, self.chrom_sizes)
+        self.metrics.finish()
+        print(f"Done loading bigWigs' signal values into {self.binned_mat.shape} matrix", flush=True)
+        return self.binned_vals
+
+    def load_bin_all_bws_procs(self) -> list[list[np.ndarray]]:
+        """
+        Same as `load_bin_all_bws`, but schedules one task per
+        (bigWig, chromosome) on a process pool. Every worker opens its
+        own pyBigWig handles, at most `max_open`, and writes its bins directly into the
+        shared output: the memory-mapped matrix if there is an `out_dir`,
+        otherwise a shared memory block copied out at the end.
+        """
+        n_bws = len(self.bigwigs_tbl.index)
+        n_procs = (self.n_workers or os.cpu_count()) if self.parallel else 1
+        tasks = bin_tasks(self.chrom_sizes, n_bws)
+        print(f"Loading {n_bws} bigWigs' signal values as {len(tasks)} (bigWig, chromosome) tasks in {n_procs} processes", flush=True)
+        self.metrics.start("Binning bigWigs", len(tasks), n_procs)
+        self.track_summaries = [TrackSummary() for _ in range(n_bws)]
+
+        shm = None
+        if self.out_dir is not None:
+            out_mat = self.alloc_binned_mat()
+            out_ref = str(Path(self.out_dir).absolute() / VALUES_FILE)
+            out_shape = self.binned_mat.shape
+        else:
+            out_shape = (int(self.chrom_sizes["row_end"].iat[-1]) if len(self.chrom_sizes.index) else 0, n_bws)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, out_shape[0] * out_shape[1] * self.dtype.itemsize))
+            out_mat = np.ndarray(out_shape, dtype=self.dtype, buffer=shm.buf, order="F")
+            out_mat.fill(np.nan)
+            out_ref = shm.name
+
+        try:
+            if self.cache is not None:
+                # fill in the cached chromosomes here, only bin the rest
+                uncached_tasks = []
+                for bw_idx, chr_idx in tasks:
+                    cached = self.cache.get(self.cache_key(bw_idx, chr_idx))
+                    if cached is None:
+                        uncached_tasks.append((bw_idx, chr_idx))
+                    else:
+                        out_mat[self.chrom_sizes["row_start"].iat[chr_idx]:self.chrom_sizes["row_end"].iat[chr_idx], bw_idx] = cached
+                        self.track_summaries[bw_idx].update(cached)
+                        self.metrics.count("cache_hits", 1, Path(self.bigwigs_tbl["path"].iat[bw_idx]).stem)
+                        self.metrics.task_done()
+                print(f"{len(tasks) - len(uncached_tasks)} of {len(tasks)} tasks cached", flush=True)
+                tasks = uncached_tasks
+            if isinstance(out_mat, np.memmap):
+                out_mat.flush()
+
+            with ProcessPoolExecutor(max_workers=n_procs) as proc_pool:
+                futures = {
+                    proc_pool.submit(
+                        _bin_chrom_worker, self.bw_path_strs[bw_idx], bw_idx,
+                        str(self.chrom_sizes["name"].iat[chr_idx]), int(self.chrom_sizes["size"].iat[chr_idx]),
+                        int(self.chrom_sizes["n_bins"].iat[chr_idx]), self.bin_size, self.left_aligned,
+                        int(self.chrom_sizes["row_start"].iat[chr_idx]), out_ref, out_shape, self.dtype.str,
+                        self.metrics.enabled, self.max_open, self.window_bp
+                    ): bw_idx
+                    for bw_idx, chr_idx in tasks
+                }
+                for future in as_completed(futures):
+                    worker_metrics, summary = future.result()
+                    self.track_summaries[futures[future]].merge(summary)
+                    if worker_metrics is not None:
+                        self.metrics.merge(*worker_metrics)
+                    self.metrics.task_done()
+            self.metrics.mark("binned")
+
+            if self.cache is not None:
+                for bw_idx, chr_idx in tasks:
+                    self.cache.put(self.cache_key(bw_idx, chr_idx), out_mat[self.chrom_sizes["row_start"].iat[chr_idx]:self.chrom_sizes["row_end"].iat[chr_idx], bw_idx])
+
+            if shm is not None:
+                self.binned_mat = out_mat.copy(order="F")
+        finally:
+            if shm is not None:
+                del out_mat
+                shm.close()
+                shm.unlink()
+
+        self.binned_vals = self.binned_mat_views()
+        # record missing bins ranges, all tracks in one pass
+        with self.metrics.time("nan_scan"):
+            self.missing_index = MissingIndex.from_matrix(self.binned_mat, self.chrom_sizes)
+        self.metrics.finish()
+
+        print(f"Done loading bigWigs' signal values into {self.binned_mat.shape} matrix", flush=True)
         return self.binned_vals
     
-    def save(self, binned_vals: list[list[np.ndarray]], save_path: Path, missing_rngs_tbl_save_path: Path) -> None:
+    def block_regions(self, block_bins: int) -> list[tuple[int, int, int]]:
         """
-        Save the binned values to a NumPy array and
-        the ranges of "missing" values to a CSV
+        Split every chromosome, in order, into (chromosome index, start, end)
+        runs of `block_bins` bins, the last of each chromosome shorter
         """
-        pickle.dump(binned_vals, open(save_path, "wb"))
-        pd.DataFrame(self.missing_bins).to_csv(missing_rngs_tbl_save_path, index=False)
+        return [
+            (chr_idx, start, min(start + block_bins, int(chr_bins)))
+            for chr_idx, chr_bins in enumerate(self.chrom_sizes["n_bins"])
+            for start in range(0, int(chr_bins), block_bins)
+        ]
 
-def init_argparser(parser: argparse.ArgumentParser) -> argparse.Namespace:
-    """
-    - downloads dir
-    - dir for segway runs
-    - dir for final reports
-    """
-    parser.add_argument("data_dir", type=Path, help="Path to directory of data (contains subdirectories for cell types).")
+    def load_bin_block(self, chr_idx: int, start: int, end: int) -> BinnedBlock:
+        """
+        Bin bins [start, end) of the `chr_idx`th chromosome of every bigWig,
+        the same bins, and values, as `load_bin_bw` makes of the whole
+        chromosome (both through `bin_region`)
+        """
+        chr_name, row_start = self.chrom_sizes[["name", "row_start"]].iloc[chr_idx]
+        bp_edges = self.bin_edges(chr_idx)[start:end + 1]
+        values = np.empty((end - start, len(self.bigwigs_tbl.index)), dtype=self.dtype, order="F")
+        for bw_idx, bw_path in enumerate(self.bw_path_strs):
+            with self.handles.lease(bw_path) as bigwig:
+                values[:, bw_idx] = bin_region(bigwig, str(chr_name), bp_edges, self.metrics, Path(bw_path).stem, self.window_bp)
+        return BinnedBlock(str(chr_name), start, end, int(row_start) + start, bp_edges, values, np.isnan(values))
+
+    def iter_blocks(self, block_bins: int = 100_000, prefetch: int = 1) -> Iterator[BinnedBlock]:
+        """
+        Bin the genome a block of `block_bins` bins (per chromosome) at a time,
+        yielding `BinnedBlock`s in genome order, without ever building the
+        whole matrix. The next `prefetch` blocks are binned in a background
+        thread while the current one is being used, so at most
+        `prefetch` + 1 blocks are in memory at once.
+        """
+        regions = self.block_regions(block_bins)
+        with ThreadPoolExecutor(max_workers=1) as thr_pool:
+            pending = collections.deque()
+            for region in regions:
+                pending.append(thr_pool.submit(self.load_bin_block, *region))
+                if len(pending) > prefetch:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def load_bin_pyramid(self, resolutions: list[int]) -> BinPyramid:
+        """
+        Bin every bigWig at all of `resolutions` from a single read of its
+        intervals: only `bin_size`, the finest, is binned from the bigWigs,
+        keeping each bin's sum and covered base pairs, then every coarser
+        resolution (which must be a multiple of `bin_size`) is summed up
+        from those, so their means are exact coverage-weighted means.
+        Unlike `load_bin_all_bws`, bins are left-aligned (see `left_bin_edges`)
+        so that coarser ones are made of whole finer ones.
+        """
+        n_bws = len(self.bigwigs_tbl.index)
+        n_rows = int(self.chrom_sizes["row_end"].iat[-1]) if len(self.chrom_sizes.index) else 0
+        fine_sums = np.empty((n_rows, n_bws), dtype=np.float64, order="F")
+        fine_covered = np.empty((n_rows, n_bws), dtype=np.int64, order="F")
+
+        def load_sums_bw(bw_idx: int) -> None:
+            for chr_name, chr_size, row_start, row_end in self.chrom_sizes[["name", "size", "row_start", "row_end"]].itertuples(index=False, name=None):
+                bin_edges = left_bin_edges(int(chr_size), self.bin_size)
+                with self.handles.lease(self.bw_path_strs[bw_idx]) as bigwig:
+                    for lo, hi, intervals in fetch_windows(bigwig, str(chr_name), bin_edges, self.window_bp):
+                        rows = slice(row_start + lo, row_start + hi)
+                        fine_sums[rows, bw_idx], fine_covered[rows, bw_idx] = bin_interval_sums(*intervals, bin_edges[lo:hi + 1])
+
+        n_threads = min(n_bws, self.max_open) if self.parallel else 1
+        print(f"Loading {n_bws} bigWigs' sums at {self.bin_size} bp in {n_threads} threads, for resolutions {sorted(resolutions)}", flush=True)
+        with mp.pool.ThreadPool(processes=max(1, n_threads)) as thr_pool:
+            thr_pool.map(load_sums_bw, range(n_bws))
+
+        tracks = pd.DataFrame({
+            "name": list(self.bigwigs_tbl["name"]),
+            "path": [str(path) for path in self.bigwigs_tbl["path"]],
+        })
+        return BinPyramid.from_fine(fine_sums, fine_covered, self.chrom_sizes, tracks, self.bin_size, resolutions)
+
+    def load_bin_stats(self, stats: list[str] = ("mean", "max", "min", "covered", "sumsq")) -> dict[str, np.ndarray]:
+        """
+        Bin several statistics (of `BIN_STATS`, see `bin_interval_stats`)
+        at once: every chromosome of every bigWig's intervals are read once
+        and split at the bin boundaries, and all the statistics computed
+        from that. Returns a (genome bin x bigWig) matrix per statistic,
+        rows as `binned_mat`'s, in the bins `bin_edges` gives.
+        """
+        n_bws = len(self.bigwigs_tbl.index)
+        n_rows = int(self.chrom_sizes["row_end"].iat[-1]) if len(self.chrom_sizes.index) else 0
+        stat_mats = {
+            stat: np.empty((n_rows, n_bws), dtype=np.int64 if stat == "covered" else self.dtype, order="F")
+            for stat in stats
+        }
+
+        def load_stats_bw(bw_idx: int) -> None:
+            for chr_idx, (chr_name, row_start) in enumerate(self.chrom_sizes[["name", "row_start"]].itertuples(index=False, name=None)):
+                bin_edges = self.bin_edges(chr_idx)
+                with self.handles.lease(self.bw_path_strs[bw_idx]) as bigwig:
+                    for lo, hi, intervals in fetch_windows(bigwig, str(chr_name), bin_edges, self.window_bp):
+                        for stat, binneds in bin_interval_stats(*intervals, bin_edges[lo:hi + 1], stats).items():
+                            stat_mats[stat][row_start + lo:row_start + hi, bw_idx] = binneds
+
+        n_threads = min(n_bws, self.max_open) if self.parallel else 1
+        print(f"Loading {n_bws} bigWigs' {list(stats)} in {n_threads} threads", flush=True)
+        with mp.pool.ThreadPool(processes=max(1, n_threads)) as thr_pool:
+            thr_pool.map(load_stats_bw, range(n_bws))
+        return stat_mats
+
+    def load_bin_runs(self, max_ratio: float = 0.5) -> list[Union[RunLengthTrack, np.ndarray]]:
+        """
+        Bin every bigWig straight from its intervals into runs of bins of
+        equal mean (see `bin_interval_runs`), rows as `binned_mat`'s, in
+        the bins `bin_edges` gives, never building its dense column. Each
+        track is then kept as a `RunLengthTrack` if its runs take at most
+        `max_ratio` of its dense column's bytes, else densified into a
+        column of `dtype` values (see `choose_storage`), so mostly missing
+        or mostly zero tracks stay small and the others stay fast to read.
+        """
+        n_bws = len(self.bigwigs_tbl.index)
+        n_rows = int(self.chrom_sizes["row_end"].iat[-1]) if len(self.chrom_sizes.index) else 0
+        row_starts = [int(row_start) for row_start in self.chrom_sizes["row_start"]]
+
+        def load_runs_bw(bw_idx: int) -> Union[RunLengthTrack, np.ndarray]:
+            track = Path(self.bw_path_strs[bw_idx]).stem
+            chrom_runs, window_row_starts = [], []
+            for chr_idx, chr_name in enumerate(self.chrom_sizes["name"]):
+                bin_edges = self.bin_edges(chr_idx)
+                with self.handles.lease(self.bw_path_strs[bw_idx]) as bigwig:
+                    for lo, hi, intervals in fetch_windows(bigwig, str(chr_name), bin_edges, self.window_bp, self.metrics, track):
+                        with self.metrics.time("runs", track, chr_name):
+                            starts, lengths, values = bin_interval_runs(*intervals, bin_edges[lo:hi + 1])
+                        # runs of each window, from its first bin, joined across windows by `from_chrom_runs`
+                        chrom_runs.append((starts, lengths, values))
+                        window_row_starts.append(row_starts[chr_idx] + lo)
+            return choose_storage(RunLengthTrack.from_chrom_runs(chrom_runs, window_row_starts, n_rows, self.dtype), self.dtype, max_ratio)
+
+        n_threads = min(n_bws, self.max_open) if self.parallel else 1
+        print(f"Loading {n_bws} bigWigs' signal values as runs in {n_threads} threads", flush=True)
+        with mp.pool.ThreadPool(processes=max(1, n_threads)) as thr_pool:
+            binned_tracks = thr_pool.map(load_runs_bw, range(n_bws))
+        n_sparse = sum(isinstance(binned_track, RunLengthTrack) for binned_track in binned_tracks)
+        print(f"Kept {n_sparse} of {n_bws} bigWigs as runs, densified the rest", flush=True)
+        return binned_tracks
+
+    def save(self, out_dir: Path) -> None:
+        """
+        Save the binned values to `out_dir` as a memory-mappable
+        (genome bin x bigWig) `.npy` matrix with its chromosome offsets
+        and bigWigs tables (see `BinnedTracks.load`), the index
+        of "missing" values ranges and every bigWig's summary statistics
+        """
+        tracks = pd.DataFrame({
+            "name": list(self.bigwigs_tbl["name"]),
+            "path": [str(path) for path in self.bigwigs_tbl["path"]],
+        })
+        save_binned(out_dir, self.binned_mat, self.chrom_sizes, tracks, self.bin_size, self.left_aligned)
+        self.missing_index.save(Path(out_dir) / MISSING_FILE)
+        save_summaries(Path(out_dir) / SUMMARY_FILE, self.track_summaries)
+
+DESCRIPTION = "Bins bigWig files into NumPy arrays.\nSpecifically, one (genome bin x bigWig) matrix, saved as a memory-mappable `.npy` alongside a table of chromosomes information used, namely name, length (bp), number of bins under given bin size (i.e. resolution) and rows in the matrix."
+
+def add_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
     parser.add_argument("resolution", type=int, help="Requested resolution (i.e. bin size) in base pairs.")
-    parser.add_argument("--chrom-sizes", type=Path, help="Path to `.sizes` file to use. If not specified, will use `hg38.chrom.sizes` in `data_dir` directory")
-    args = parser.parse_args()
-    if args.chrom_sizes is None:
-        args.chrom_sizes = args.data_dir / "hg38.chrom.sizes"
-    return args
+    parser.add_argument("bigwigs", type=Path, nargs="*", help="bigWig files, or directories to collect all `.bw`/`.bigWig` files under, each track named by its file name's stem.")
+    parser.add_argument("--track", nargs=2, action="append", default=[], metavar=("TRACK_NAME", "TRACK_FILE"), help="Name and bigWig file of a track to bin, after the positional ones. Repeat for more tracks.")
+    parser.add_argument("--chrom-sizes", type=Path, required=True, help="Path to `.sizes` file of the bigWigs' assembly, all of whose chromosomes are binned.")
+    parser.add_argument("--chroms", nargs="+", help="Only bin these chromosomes of `--chrom-sizes`, in its order.")
+    parser.add_argument("--processes", action="store_true", help="Bin on a process pool, one task per (bigWig, chromosome), instead of one thread per bigWig.")
+    parser.add_argument("--n-workers", type=int, help="Number of worker processes for `--processes`. Defaults to the number of CPUs.")
+    parser.add_argument("--float32", action="store_true", help="Store binned values as 32-bit instead of 64-bit floats.")
+    parser.add_argument("--cache-dir", type=Path, help="Directory to cache binned chromosomes in, reused across runs with the same files and settings.")
+    parser.add_argument("--cache-max-gb", type=float, help="Size limit of `--cache-dir` in GB, evicting the least recently used chromosomes first. Unlimited if not specified.")
+    parser.add_argument("--left-aligned", action="store_true", help="Lay bins from the start of every chromosome, only the last one shorter, instead of pyBigWig's bins.")
+    parser.add_argument("--stats", nargs="+", choices=BIN_STATS, help="Also bin these statistics, all from one read of each bigWig's intervals. Saved as `bin_<stat>.npy` in the output directory.")
+    parser.add_argument("--runs", action="store_true", help="Also bin every bigWig into runs of bins of equal value, kept as runs only for tracks they make smaller. Saved as `runs.npz` in the output directory.")
+    parser.add_argument("--pyramid", type=int, nargs="+", help="Also bin at these coarser resolutions, all multiples of `resolution`, from one read of each bigWig. Saved together as `pyramid.npz` in the output directory.")
+    parser.add_argument("--out-dir", type=Path, default=Path("binned"), help="Directory to write the binned output to. Defaults to `binned` in the working directory.")
+    parser.add_argument("--metrics", type=Path, help="Record timings, counts and memory of the run, showing a live progress line, and write them as JSON to this file.")
+    parser.add_argument("--max-open", type=int, default=DEFAULT_MAX_OPEN, help="Most bigWigs kept open at once (per worker process with `--processes`), closing the least recently used ones, to stay under the open files limit with thousands of tracks.")
+    parser.add_argument("--no-validate", action="store_true", help="Skip checking every bigWig's chromosomes against the chromosome sizes before binning.")
+    return parser
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="Bins bigWig files into NumPy arrays.\nSpecifically, a 2D list of NumPy arrays, where each row is a bigWig and each column is a chromosome. Saves the 2D list as a pickle and a table of chromosomes information used, namely name, length (bp) and number of bins under given bin size (i.e. resolution)."
-    )
-    args = init_argparser(parser)
+def init_argparser(parser: argparse.ArgumentParser) -> argparse.Namespace:
+    return add_arguments(parser).parse_args()
 
-    bw_paths = collect_bigWig_paths(args.data_dir / "CD14-positive monocyte" / "H3K27ac")
+def main(args: argparse.Namespace) -> None:
+    track_names, bw_paths = named_bigWig_paths(args.bigwigs, args.track)
+    if not bw_paths:
+        raise ValueError("No bigWigs given nor found, pass bigWig files or directories, or `--track`s")
     print(f"Found {len(bw_paths)} bigWigs")
 
-    bw_binner = BigWigsBinner(bw_paths, parse_chromosome_sizes(args.chrom_sizes), args.resolution)
-    bw_binned_tracks = bw_binner.load_bin_all_bws()
+    cache = None
+    if args.cache_dir is not None:
+        cache = BinnedCache(args.cache_dir, None if args.cache_max_gb is None else int(args.cache_max_gb * 1e9))
+
+    metrics = Metrics() if args.metrics is not None else None
+    bw_binner = BigWigsBinner(bw_paths, parse_chromosome_sizes(args.chrom_sizes, args.chroms), args.resolution, processes=args.processes, n_workers=args.n_workers, dtype=np.float32 if args.float32 else np.float64, out_dir=args.out_dir, cache=cache, left_aligned=args.left_aligned, metrics=metrics, max_open=args.max_open, validate=not args.no_validate, track_names=track_names)
+    bw_binner.load_bin_all_bws()
+    if metrics is not None:
+        metrics.save(args.metrics)
+        print(f"Saved run metrics to {args.metrics}")
+    if cache is not None:
+        print(f"Cache: {cache.report()}")
 
-    print("Sum of binned values:")
-    for bw_idx in bw_binner.bigwigs_tbl.index:
-        print(f"\t{bw_paths[bw_idx]}: {sum([np.nansum(bw_binned_tracks[bw_idx][chr_idx]) for chr_idx in range(len(bw_binned_tracks[bw_idx]))])}")
+    print("Binned values summary:")
+    print(summaries_frame(bw_binner.track_summaries, track_names))
 
     print("Missing bins:")
-    missing_bins_tbl = pd.DataFrame(bw_binner.missing_bins)
-    print(missing_bins_tbl)
+    print(bw_binner.missing_bins)
+    print("Fraction of bins missing:")
+    for bw_idx, missing_frac in enumerate(bw_binner.missing_index.missing_fraction()):
+        print(f"\t{track_names[bw_idx]}: {missing_frac:.4f}")
 
-    bw_binner.save(bw_binned_tracks, args.data_dir / "binned_vals.npy", args.data_dir / "chrom_ranges.csv")
-    print(f"Saved binned values to {args.data_dir / 'binned_vals.npy'} and chromosome ranges to {args.data_dir / 'chrom_ranges.csv'}")
\ No newline at end of file
+    bw_binner.save(args.out_dir)
+    print(f"Saved binned values, chromosome ranges, missing bins and summaries to {args.out_dir}")
+
+    if args.stats:
+        for stat, stat_mat in bw_binner.load_bin_stats(args.stats).items():
+            np.save(args.out_dir / f"bin_{stat}.npy", stat_mat)
+        print(f"Saved binned {args.stats} to {args.out_dir}")
+
+    if args.runs:
+        binned_tracks = bw_binner.load_bin_runs()
+        save_tracks(args.out_dir / "runs.npz", binned_tracks)
+        print(f"Saved {sum(isinstance(binned_track, RunLengthTrack) for binned_track in binned_tracks)} tracks as runs, the rest dense, to {args.out_dir / 'runs.npz'}")
+
+    if args.pyramid:
+        pyramid = bw_binner.load_bin_pyramid([args.resolution] + args.pyramid)
+        pyramid.save(args.out_dir / "pyramid.npz")
+        print(f"Saved resolutions {pyramid.resolutions} to {args.out_dir / 'pyramid.npz'}")
+
+    bw_binner.close()
+
+if __name__ == "__main__":
+    main(init_argparser(argparse.ArgumentParser(description=DESCRIPTION)))
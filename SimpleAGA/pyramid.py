@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+from math import ceil
+from pathlib import Path
+from .binned import BinnedTracks, chrom_offsets
+from .missing import MissingIndex
+
+class BinPyramid:
+    """
+    The same tracks binned at several resolutions, each level kept as
+    (genome bin x track) matrices of per bin signal sums and covered base pairs,
+    so any level's means are exact coverage-weighted means.
+    All levels' bins are left-aligned on every chromosome.
+    """
+    def __init__(self, levels: dict[int, tuple[np.ndarray, np.ndarray]], chroms: pd.DataFrame, tracks: pd.DataFrame):
+        # resolution -> (sums, covered)
+        self.levels = levels
+        # name, size per chromosome
+        self.chroms = chroms[["name", "size"]].reset_index(drop=True)
+        self.tracks = tracks
+
+    @classmethod
+    def from_fine(cls, fine_sums: np.ndarray, fine_covered: np.ndarray, chroms: pd.DataFrame, tracks: pd.DataFrame, fine_res: int, resolutions: list[int]) -> "BinPyramid":
+        """
+        Build every level of `resolutions` from sums and covered base pairs
+        at `fine_res` (rows per `chroms`' row_start, row_end), by summing
+        whole groups of fine bins, one vectorized pass over all chromosomes
+        """
+        levels = {fine_res: (fine_sums, fine_covered)}
+        fine_starts = chroms["row_start"].to_numpy(dtype=np.int64)
+        fine_n_bins = chroms["n_bins"].to_numpy(dtype=np.int64)
+        for res in sorted(set(resolutions) - {fine_res}):
+            if res % fine_res != 0:
+                raise ValueError(f"Resolution {res} bp is not a multiple of the finest resolution, {fine_res} bp")
+            factor = res // fine_res
+            # first fine row of every coarse bin, chromosome by chromosome
+            group_starts = np.concatenate([
+                row_start + np.arange(0, n_bins, factor) for row_start, n_bins in zip(fine_starts, fine_n_bins)
+            ]) if len(fine_starts) else np.empty(0, dtype=np.int64)
+            if len(group_starts) == 0:
+                levels[res] = (fine_sums[:0], fine_covered[:0])
+                continue
+            levels[res] = (
+                np.asfortranarray(np.add.reduceat(fine_sums, group_starts, axis=0)),
+                np.asfortranarray(np.add.reduceat(fine_covered, group_starts, axis=0)),
+            )
+        return cls(levels, chroms, tracks)
+
+    @property
+    def resolutions(self) -> list[int]:
+        return sorted(self.levels)
+
+    def level_chroms(self, res: int) -> pd.DataFrame:
+        """
+        Chromosomes table with bins and rows at resolution `res`
+        """
+        chroms = self.chroms.copy()
+        chroms["n_bins"] = [ceil(size / res) for size in chroms["size"]]
+        return chrom_offsets(chroms)
+
+    def means(self, res: int) -> np.ndarray:
+        """
+        (genome bin x track) means at resolution `res`, NaN where no signal
+        """
+        sums, covered = self.levels[res]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(covered > 0, sums / covered, np.nan)
+
+    def as_binned(self, res: int, dtype=np.float64) -> BinnedTracks:
+        """
+        Resolution `res`'s means as `BinnedTracks`, with its missing index
+        """
+        values = np.asfortranarray(self.means(res), dtype=dtype)
+        chroms = self.level_chroms(res)
+        return BinnedTracks(values, chroms, self.tracks, res, MissingIndex.from_matrix(values, chroms))
+
+    def save(self, path: Path) -> None:
+        """
+        Save all levels together in one `.npz`
+        """
+        arrays = {}
+        for res, (sums, covered) in self.levels.items():
+            arrays[f"sums_{res}"] = sums
+            arrays[f"covered_{res}"] = covered
+        np.savez(
+            path, resolutions=np.array(self.resolutions, dtype=np.int64),
+            chrom_names=np.array(self.chroms["name"], dtype=str), chrom_sizes=self.chroms["size"].to_numpy(dtype=np.int64),
+            track_names=np.array(self.tracks["name"], dtype=str), track_paths=np.array(self.tracks["path"], dtype=str),
+            **arrays,
+        )
+
+    @classmethod
+    def load(cls, path: Path, resolutions: list[int] = None) -> "BinPyramid":
+        """
+        Load the levels of `resolutions` (default all) of a saved pyramid
+        """
+        with np.load(path) as saved:
+            chroms = pd.DataFrame({"name": saved["chrom_names"].astype(str), "size": saved["chrom_sizes"]})
+            tracks = pd.DataFrame({"name": saved["track_names"].astype(str), "path": saved["track_paths"].astype(str)})
+            if resolutions is None:
+                resolutions = list(saved["resolutions"])
+            levels = {int(res): (saved[f"sums_{res}"], saved[f"covered_{res}"]) for res in resolutions}
+        return cls(levels, chroms, tracks)
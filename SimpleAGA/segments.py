@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from .binned import BinnedTracks
+from .missing import MissingIndex
+
+class ObservedSegments:
+    """
+    Runs of consecutive observed bins of a binned (genome bin x track)
+    matrix, none crossing chromosomes, for models that can't take missing
+    values (see `doc/missing_data.md`). Columnar arrays, one entry per segment:
+        - `chrom`: index of the chromosome in `chroms`
+        - `start`, `end`: [start, end) bins within the chromosome
+        - `row_start`: row of the first bin in the genome-wide matrix
+    and `offsets`, where every segment starts in the compacted buffer of
+    all segments back to back (see `compact`), plus a last entry, the total.
+    """
+    def __init__(self, chrom: np.ndarray, start: np.ndarray, end: np.ndarray, chroms: pd.DataFrame):
+        self.chrom = np.asarray(chrom, dtype=np.int32)
+        self.start = np.asarray(start, dtype=np.int64)
+        self.end = np.asarray(end, dtype=np.int64)
+        self.chroms = chroms
+        self.row_start = chroms["row_start"].to_numpy(dtype=np.int64)[self.chrom] + self.start
+        self.offsets = np.concatenate(([0], np.cumsum(self.end - self.start))).astype(np.int64)
+
+    @classmethod
+    def from_missing(cls, missing: MissingIndex, chroms: pd.DataFrame, min_bins: int = 1, max_missing_frac: float = 0.0) -> "ObservedSegments":
+        """
+        Segments of bins missing at most `max_missing_frac` of the tracks
+        (by default none), at least `min_bins` long, found from the
+        missing runs index alone, without reading the matrix
+        """
+        n_missing = missing.missing_counts()
+        observed = n_missing <= max_missing_frac * missing.n_tracks
+        row_starts = chroms["row_start"].to_numpy(dtype=np.int64)
+        row_starts = row_starts[row_starts < len(observed)]
+
+        # observed bins whose previous/next bin isn't, or is in another chromosome
+        seg_starts = observed.copy()
+        seg_starts[1:] &= ~observed[:-1]
+        seg_starts[row_starts] = observed[row_starts]
+        seg_ends = observed.copy()
+        seg_ends[:-1] &= ~observed[1:]
+        seg_ends[row_starts[row_starts > 0] - 1] = observed[row_starts[row_starts > 0] - 1]
+        seg_starts = np.flatnonzero(seg_starts)
+        seg_ends = np.flatnonzero(seg_ends) + 1
+
+        long_enough = seg_ends - seg_starts >= min_bins
+        seg_starts, seg_ends = seg_starts[long_enough], seg_ends[long_enough]
+        chrom_idxs = np.searchsorted(row_starts, seg_starts, side="right") - 1
+        return cls(chrom_idxs, seg_starts - row_starts[chrom_idxs], seg_ends - row_starts[chrom_idxs], chroms)
+
+    @classmethod
+    def from_binned(cls, binned: BinnedTracks, min_bins: int = 1, max_missing_frac: float = 0.0) -> "ObservedSegments":
+        """
+        `from_missing` of a `BinnedTracks`, indexing its missing runs first if it has none
+        """
+        missing = binned.missing
+        if missing is None:
+            missing = MissingIndex.from_matrix(binned.values, binned.chroms)
+        return cls.from_missing(missing, binned.chroms, min_bins, max_missing_frac)
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return self.end - self.start
+
+    @property
+    def n_bins(self) -> int:
+        """
+        Total bins in all segments
+        """
+        return int(self.offsets[-1])
+
+    def slices(self, values: np.ndarray) -> list[np.ndarray]:
+        """
+        Every segment's (bin x track) rows of the genome-wide `values`,
+        as views, no copies (so still memory-mapped if `values` is)
+        """
+        return [values[row_start:row_start + length] for row_start, length in zip(self.row_start, self.lengths)]
+
+    def compact(self, values: np.ndarray, path: Path = None) -> np.ndarray:
+        """
+        All segments' rows of `values` back to back in one (bin x track)
+        buffer, segment i at rows [offsets[i], offsets[i+1]). Column-major
+        like the binned matrix, memory-mapped as a `.npy` at `path` if given.
+        """
+        shape = (self.n_bins, values.shape[1])
+        if path is None:
+            compacted = np.empty(shape, dtype=values.dtype, order="F")
+        else:
+            compacted = np.lib.format.open_memmap(path, mode="w+", dtype=values.dtype, shape=shape, fortran_order=True)
+        for offset, row_start, length in zip(self.offsets, self.row_start, self.lengths):
+            compacted[offset:offset + length] = values[row_start:row_start + length]
+        return compacted
+
+    def genome_rows(self) -> np.ndarray:
+        """
+        Row of the genome-wide matrix of every bin of the compacted buffer
+        """
+        return np.arange(self.n_bins, dtype=np.int64) + np.repeat(self.row_start - self.offsets[:-1], self.lengths)
+
+    def scatter(self, results, n_rows: int = None, fill=np.nan, out: np.ndarray = None, dtype=None) -> np.ndarray:
+        """
+        Put per bin results of the segments, e.g. posteriors or Viterbi
+        paths, back in genome-wide coordinates: `results` is either the
+        compacted (bin x ...) array or a list of one array per segment.
+        Bins in no segment are `fill`, or left as they are in `out`.
+        The output is `dtype` if given, else holds both `results` and
+        `fill`: a NaN `fill` keeps floating results' type and makes
+        integer ones float64, which holds every int32 (e.g. state) exactly.
+        """
+        if isinstance(results, (list, tuple)):
+            results = np.concatenate(results) if len(results) else np.empty(0)
+        results = np.asarray(results)
+        if out is None:
+            if n_rows is None:
+                n_rows = int(self.chroms["row_end"].iat[-1]) if len(self.chroms.index) else 0
+            if dtype is None:
+                if np.isnan(fill):
+                    # `np.min_scalar_type(nan)` is float16, too small for most integer results
+                    dtype = results.dtype if np.issubdtype(results.dtype, np.floating) else np.float64
+                else:
+                    dtype = np.result_type(results, np.min_scalar_type(fill))
+            out = np.full((n_rows,) + results.shape[1:], fill, dtype=dtype)
+        out[self.genome_rows()] = results
+        return out
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Table of the segments, one per row, with chromosome names
+        """
+        return pd.DataFrame({
+            "chrom": self.chroms["name"].to_numpy()[self.chrom] if len(self.chrom) else np.empty(0, dtype=object),
+            "start": self.start,
+            "end": self.end,
+            "row_start": self.row_start,
+            "offset": self.offsets[:-1],
+        })
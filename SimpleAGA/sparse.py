@@ -0,0 +1,210 @@
+import numpy as np
+from pathlib import Path
+from typing import Union
+from ._util import merge_runs
+
+# bytes a run takes beyond its value: its int64 start and length
+RUN_OVERHEAD_BYTES = 16
+
+class RunLengthTrack:
+    """
+    One track's binned values over `n_bins` genome-wide rows (those of the
+    binned matrix) as runs of equal values: sorted, non-overlapping
+    [start, start + length) rows, each with its value. Rows outside every
+    run are missing (NaN), so a mostly missing or mostly constant (e.g.
+    zero) track takes a few runs instead of a value per bin.
+    """
+    def __init__(self, starts: np.ndarray, lengths: np.ndarray, values: np.ndarray, n_bins: int):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.values = np.asarray(values)
+        self.n_bins = int(n_bins)
+
+    def __len__(self) -> int:
+        return self.n_bins
+
+    @property
+    def n_runs(self) -> int:
+        return len(self.starts)
+
+    @property
+    def ends(self) -> np.ndarray:
+        return self.starts + self.lengths
+
+    @property
+    def nbytes(self) -> int:
+        return self.n_runs * (RUN_OVERHEAD_BYTES + self.values.itemsize)
+
+    @property
+    def density(self) -> float:
+        """
+        Fraction of rows with a value
+        """
+        return float(self.lengths.sum()) / self.n_bins if self.n_bins else 0.0
+
+    @classmethod
+    def from_dense(cls, values: np.ndarray) -> "RunLengthTrack":
+        """
+        Runs of equal consecutive non-NaN `values`
+        """
+        values = np.asarray(values)
+        observed = ~np.isnan(values)
+        new_run = observed.copy()
+        new_run[1:] &= ~observed[:-1] | (values[1:] != values[:-1])
+        starts = np.flatnonzero(new_run)
+        # every run ends at the next run's start or the next NaN
+        boundaries = np.flatnonzero(new_run | ~observed)
+        ends = np.append(boundaries, len(values))[np.searchsorted(boundaries, starts, side="right")]
+        return cls(starts, ends - starts, values[starts], len(values))
+
+    @classmethod
+    def from_chrom_runs(cls, chrom_runs: list[tuple[np.ndarray, np.ndarray, np.ndarray]], row_starts: list[int], n_bins: int, dtype=np.float64) -> "RunLengthTrack":
+        """
+        Join the runs of every chromosome, within chromosome bins (see
+        `bin_interval_runs`), offset by the chromosomes' `row_starts`.
+        NaN runs are left out, as missing, the way `from_dense` does.
+        """
+        if not chrom_runs:
+            return cls(np.empty(0), np.empty(0), np.empty(0, dtype=dtype), n_bins)
+        starts = np.concatenate([starts + row_start for (starts, _, _), row_start in zip(chrom_runs, row_starts)])
+        lengths = np.concatenate([lengths for _, lengths, _ in chrom_runs])
+        values = np.concatenate([values for _, _, values in chrom_runs]).astype(dtype)
+        observed = ~np.isnan(values)
+        return cls(*merge_runs(starts[observed], lengths[observed], values[observed]), n_bins)
+
+    def region_runs(self, start: int = 0, end: int = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Starts, ends (exclusive) and values of the runs overlapping rows
+        [start, end), clipped to them and relative to `start`
+        """
+        end = self.n_bins if end is None else end
+        first = np.searchsorted(self.ends, start, side="right")
+        last = np.searchsorted(self.starts, end, side="left")
+        starts = np.maximum(self.starts[first:last], start) - start
+        ends = np.minimum(self.ends[first:last], end) - start
+        return starts, ends, self.values[first:last]
+
+    def densify(self, start: int = 0, end: int = None, dtype=None, out: np.ndarray = None) -> np.ndarray:
+        """
+        Values of rows [start, end), NaN where missing, into `out` if given
+        """
+        end = self.n_bins if end is None else end
+        if out is None:
+            out = np.empty(end - start, dtype=self.values.dtype if dtype is None else dtype)
+        out.fill(np.nan)
+        starts, ends, values = self.region_runs(start, end)
+        # mark each run's first row with its index + 1, spread down to the end of the run
+        run_ids = np.zeros(end - start + 1, dtype=np.int64)
+        run_ids[starts] = np.arange(1, len(starts) + 1)
+        run_ids[ends] -= np.arange(1, len(starts) + 1)
+        run_ids = np.cumsum(run_ids[:-1])
+        in_run = run_ids > 0
+        out[in_run] = values[run_ids[in_run] - 1]
+        return out
+
+    def missing_mask(self, start: int = 0, end: int = None) -> np.ndarray:
+        """
+        Whether each row of [start, end) is missing
+        """
+        end = self.n_bins if end is None else end
+        starts, ends, _ = self.region_runs(start, end)
+        covered = np.bincount(starts, minlength=end - start + 1) - np.bincount(ends, minlength=end - start + 1)
+        return np.cumsum(covered[:-1]) == 0
+
+    def save(self, path: Path) -> None:
+        np.savez(path, starts=self.starts, lengths=self.lengths, values=self.values, n_bins=self.n_bins)
+
+    @classmethod
+    def load(cls, path: Path) -> "RunLengthTrack":
+        with np.load(path) as saved:
+            return cls(saved["starts"], saved["lengths"], saved["values"], int(saved["n_bins"]))
+
+# a track as either runs or a dense column of values
+Track = Union[RunLengthTrack, np.ndarray]
+
+def choose_storage(track: RunLengthTrack, dtype=np.float64, max_ratio: float = 0.5) -> Track:
+    """
+    Keep `track` as runs if they take at most `max_ratio` of the bytes its
+    dense column of `dtype` values would, otherwise densify it
+    """
+    if track.nbytes <= max_ratio * track.n_bins * np.dtype(dtype).itemsize:
+        return track
+    return track.densify(dtype=dtype)
+
+def save_tracks(path: Path, tracks: list[Track]) -> None:
+    """
+    Save sparse and dense tracks alike, in order, to one `.npz`:
+    each track's runs, or its dense column
+    """
+    arrays = {}
+    for track_idx, track in enumerate(tracks):
+        if isinstance(track, RunLengthTrack):
+            arrays.update({f"{track_idx}_starts": track.starts, f"{track_idx}_lengths": track.lengths, f"{track_idx}_values": track.values})
+        else:
+            arrays[f"{track_idx}_dense"] = np.asarray(track)
+    n_bins = len(tracks[0]) if tracks else 0
+    np.savez(path, n_tracks=len(tracks), n_bins=n_bins, **arrays)
+
+def load_tracks(path: Path) -> list[Track]:
+    """
+    Tracks saved by `save_tracks`, runs as `RunLengthTrack`s
+    """
+    with np.load(path) as saved:
+        n_bins = int(saved["n_bins"])
+        return [
+            saved[f"{track_idx}_dense"] if f"{track_idx}_dense" in saved.files else
+            RunLengthTrack(saved[f"{track_idx}_starts"], saved[f"{track_idx}_lengths"], saved[f"{track_idx}_values"], n_bins)
+            for track_idx in range(int(saved["n_tracks"]))
+        ]
+
+def densify_tracks(tracks: list[Track], start: int = 0, end: int = None, dtype=np.float64) -> np.ndarray:
+    """
+    (row x track) matrix of rows [start, end) of sparse and dense tracks alike
+    """
+    end = len(tracks[0]) if end is None else end
+    out = np.empty((end - start, len(tracks)), dtype=dtype, order="F")
+    for col, track in enumerate(tracks):
+        if isinstance(track, RunLengthTrack):
+            track.densify(start, end, out=out[:, col])
+        else:
+            out[:, col] = track[start:end]
+    return out
+
+def missing_masks(tracks: list[Track], start: int = 0, end: int = None) -> np.ndarray:
+    """
+    (row x track) missing mask of rows [start, end), sparse tracks' from their runs
+    """
+    end = len(tracks[0]) if end is None else end
+    out = np.empty((end - start, len(tracks)), dtype=bool, order="F")
+    for col, track in enumerate(tracks):
+        out[:, col] = track.missing_mask(start, end) if isinstance(track, RunLengthTrack) else np.isnan(track[start:end])
+    return out
+
+def sum_tracks(tracks: list[Track], start: int = 0, end: int = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Sum over tracks of every row of [start, end), missing values left out,
+    and the number of tracks with a value in each row. Sparse tracks are
+    added run by run, as differences at run boundaries summed down the
+    rows once, so in time of their runs (plus the rows once for all).
+    """
+    end = len(tracks[0]) if end is None else end
+    n_rows = end - start
+    sums = np.zeros(n_rows)
+    counts = np.zeros(n_rows, dtype=np.int64)
+    run_diffs = np.zeros(n_rows + 1)
+    count_diffs = np.zeros(n_rows + 1, dtype=np.int64)
+    for track in tracks:
+        if isinstance(track, RunLengthTrack):
+            starts, ends, values = track.region_runs(start, end)
+            run_diffs += np.bincount(starts, weights=values, minlength=n_rows + 1) - np.bincount(ends, weights=values, minlength=n_rows + 1)
+            count_diffs += np.bincount(starts, minlength=n_rows + 1) - np.bincount(ends, minlength=n_rows + 1)
+        else:
+            values = np.asarray(track[start:end], dtype=np.float64)
+            observed = ~np.isnan(values)
+            sums += np.where(observed, values, 0.0)
+            counts += observed
+    sparse_counts = np.cumsum(count_diffs[:-1])
+    # rows no run covers get exactly 0, whatever the rounding of the running sum
+    sums += np.where(sparse_counts > 0, np.cumsum(run_diffs[:-1]), 0.0)
+    counts += sparse_counts
+    return sums, counts
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+import json
+from pathlib import Path
+
+class QuantileSketch:
+    """
+    Mergeable approximate quantiles of a stream of values: at most
+    `max_points` weighted points (value, number of values it stands for),
+    sorted by value. Whenever there are more, neighbouring points are
+    pooled into `max_points` groups of about equal weight, each
+    replaced by its weighted mean, so quantiles are off by about
+    1 / `max_points` in rank, whatever the order values come in.
+    """
+    def __init__(self, max_points: int = 2048):
+        self.max_points = max_points
+        self.values = np.empty(0)
+        self.weights = np.empty(0)
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def _add(self, values: np.ndarray, weights: np.ndarray) -> None:
+        values = np.concatenate((self.values, values))
+        weights = np.concatenate((self.weights, weights))
+        order = np.argsort(values, kind="stable")
+        values, weights = values[order], weights[order]
+        if len(values) > self.max_points:
+            # group of every point by the middle of its rank range
+            cum_weights = np.cumsum(weights)
+            groups = ((cum_weights - weights / 2) * self.max_points / cum_weights[-1]).astype(np.int64)
+            group_weights = np.bincount(groups, weights=weights, minlength=self.max_points)
+            group_sums = np.bincount(groups, weights=values * weights, minlength=self.max_points)
+            nonempty = group_weights > 0
+            values, weights = group_sums[nonempty] / group_weights[nonempty], group_weights[nonempty]
+        self.values, self.weights = values, weights
+
+    def update(self, values: np.ndarray) -> "QuantileSketch":
+        """
+        Add `values`, NaNs left out
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = np.sort(values[~np.isnan(values)])
+        if len(values) > self.max_points:
+            # pool sorted unit weight values straight into equal count groups
+            group_starts = np.unique(np.arange(self.max_points) * len(values) // self.max_points)
+            group_weights = np.diff(np.append(group_starts, len(values))).astype(np.float64)
+            self._add(np.add.reduceat(values, group_starts) / group_weights, group_weights)
+        elif len(values):
+            self._add(values, np.ones(len(values)))
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """
+        Add all of `other`'s values
+        """
+        if len(other.values):
+            self._add(other.values, other.weights)
+        return self
+
+    def quantile(self, qs) -> np.ndarray:
+        """
+        Approximate quantiles at levels `qs` (in [0, 1]), NaN if empty
+        """
+        qs = np.asarray(qs, dtype=np.float64)
+        if len(self.values) == 0:
+            return np.full(qs.shape, np.nan)
+        # every point sits at the middle of its rank range
+        cum_weights = np.cumsum(self.weights)
+        ranks = (cum_weights - self.weights / 2) / cum_weights[-1]
+        return np.interp(qs, ranks, self.values)
+
+    def to_dict(self) -> dict:
+        return {"max_points": self.max_points, "values": self.values.tolist(), "weights": self.weights.tolist()}
+
+    @classmethod
+    def from_dict(cls, saved: dict) -> "QuantileSketch":
+        sketch = cls(saved["max_points"])
+        sketch.values = np.asarray(saved["values"], dtype=np.float64)
+        sketch.weights = np.asarray(saved["weights"], dtype=np.float64)
+        return sketch
+
+class TrackSummary:
+    """
+    Summary statistics of one track's non-missing binned values,
+    accumulated chunk by chunk (e.g. chromosome by chromosome while
+    binning) and mergeable across workers: count, sum, sum of squares,
+    min, max and a `QuantileSketch`, plus the `normalizations` already
+    applied, in order, to the values summarized (see `normalize_binned`)
+    """
+    def __init__(self, max_points: int = 2048):
+        self.count = 0
+        self.total = 0.0
+        self.sumsq = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = QuantileSketch(max_points)
+        self.normalizations = []
+
+    def update(self, values: np.ndarray) -> "TrackSummary":
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.count += len(values)
+            self.total += float(values.sum())
+            self.sumsq += float(np.dot(values, values))
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+            self.sketch.update(values)
+        return self
+
+    def merge(self, other: "TrackSummary") -> "TrackSummary":
+        self.count += other.count
+        self.total += other.total
+        self.sumsq += other.sumsq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else np.nan
+
+    @property
+    def std(self) -> float:
+        """
+        Population standard deviation
+        """
+        if not self.count:
+            return np.nan
+        return float(np.sqrt(max(0.0, self.sumsq / self.count - self.mean ** 2)))
+
+    def quantile(self, qs) -> np.ndarray:
+        return self.sketch.quantile(qs)
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "sum": self.total, "sumsq": self.sumsq, "min": self.min, "max": self.max, "sketch": self.sketch.to_dict(), "normalizations": list(self.normalizations)}
+
+    @classmethod
+    def from_dict(cls, saved: dict) -> "TrackSummary":
+        summary = cls(saved["sketch"]["max_points"])
+        summary.count = int(saved["count"])
+        summary.total = float(saved["sum"])
+        summary.sumsq = float(saved["sumsq"])
+        summary.min = float(saved["min"])
+        summary.max = float(saved["max"])
+        summary.sketch = QuantileSketch.from_dict(saved["sketch"])
+        summary.normalizations = list(saved.get("normalizations", []))
+        return summary
+
+def summaries_frame(summaries: list[TrackSummary], names: list[str] = None) -> pd.DataFrame:
+    """
+    Table of count, mean, std, min, median, max per track
+    """
+    return pd.DataFrame({
+        "name": names if names is not None else list(range(len(summaries))),
+        "count": [summary.count for summary in summaries],
+        "mean": [summary.mean for summary in summaries],
+        "std": [summary.std for summary in summaries],
+        "min": [summary.min for summary in summaries],
+        "median": [float(summary.quantile(0.5)) for summary in summaries],
+        "max": [summary.max for summary in summaries],
+    })
+
+def save_summaries(path: Path, summaries: list[TrackSummary]) -> None:
+    """
+    Save per track summaries, in track order, as JSON
+    """
+    Path(path).write_text(json.dumps([summary.to_dict() for summary in summaries]))
+
+def load_summaries(path: Path) -> list[TrackSummary]:
+    return [TrackSummary.from_dict(saved) for saved in json.loads(Path(path).read_text())]
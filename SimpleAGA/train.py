@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from .binned import VALUES_FILE, BinnedTracks
+from .missing import MissingIndex
+from .segments import ObservedSegments
+from .hmm import GaussianHMM, HMMStats, merge_stats
+
+CHECKPOINT_MODEL_FILE = "model.npz"
+CHECKPOINT_HISTORY_FILE = "history.json"
+
+def observed_track_weights(missing: MissingIndex) -> np.ndarray:
+    """
+    Each track's weight N(i) / N*: its number of observed bins N(i) over
+    the most observed track's N* (see `doc/missing_data.md`), so tracks
+    with less data count for less in every bin's emission
+    """
+    n_observed = 1 - missing.missing_fraction()
+    return n_observed / n_observed.max() if len(n_observed) and n_observed.max() > 0 else np.ones_like(n_observed)
+
+def chrom_groups(chroms: pd.DataFrame, n_groups: int) -> list[list[int]]:
+    """
+    Split chromosomes into at most `n_groups` groups of about as many bins:
+    largest first, each into the group with the fewest bins so far
+    """
+    n_bins = chroms["n_bins"].to_numpy(dtype=np.int64)
+    groups = [[] for _ in range(max(1, min(n_groups, len(n_bins))))]
+    group_bins = np.zeros(len(groups), dtype=np.int64)
+    for chr_idx in np.argsort(-n_bins, kind="stable"):
+        group_idx = int(group_bins.argmin())
+        groups[group_idx].append(int(chr_idx))
+        group_bins[group_idx] += n_bins[chr_idx]
+    return [group for group in groups if group]
+
+# binned matrices memory-mapped by a process pool worker, one per path
+_worker_values = {}
+
+def _e_step_worker(values_path: str, row_ranges: list[tuple[int, int]], model: GaussianHMM, chunk_bins: int) -> HMMStats:
+    """
+    Process pool task: E step over some chromosomes' rows of the
+    memory-mapped binned matrix at `values_path`
+    """
+    values = _worker_values.get(values_path)
+    if values is None:
+        values = np.load(values_path, mmap_mode="r")
+        _worker_values[values_path] = values
+    return model.e_step([values[row_start:row_end] for row_start, row_end in row_ranges], chunk_bins)
+
+class EMTrainer:
+    def __init__(self, binned_dir: Path, n_states: int, parallel=True, n_workers: int = None, chunk_bins: int = 10_000, track_weighting=True, checkpoint_dir: Path = None, seed: int = None, max_missing_frac: float = None, min_segment_bins: int = 1):
+        """
+        Trains a `GaussianHMM` on a saved binned output directory (see
+        `BinnedTracks`) with EM, chromosomes split into groups over a pool
+        of `n_workers` processes (default one per CPU, or all in this
+        process if not `parallel`). Every worker memory-maps the matrix and
+        sends back just its chromosomes' sufficient statistics, which are
+        summed here to update the parameters.
+        `track_weighting` weights each track's emissions by its observed
+        fraction (see `observed_track_weights`).
+        With a `max_missing_frac`, trains only on the observed segments (see
+        `ObservedSegments`) of bins missing at most that fraction of the
+        tracks, at least `min_segment_bins` long, instead of whole chromosomes.
+        With a `checkpoint_dir`, the model and log likelihoods are saved
+        there after every iteration, and training resumes from them.
+        """
+        self.binned_dir = Path(binned_dir)
+        self.binned = BinnedTracks.load(self.binned_dir)
+        self.n_states = n_states
+        self.parallel = parallel
+        self.n_workers = n_workers or os.cpu_count()
+        self.chunk_bins = chunk_bins
+        self.checkpoint_dir = None if checkpoint_dir is None else Path(checkpoint_dir)
+        self.log_likelihoods = []
+
+        missing = self.binned.missing
+        if missing is None and (track_weighting or max_missing_frac is not None):
+            missing = MissingIndex.from_matrix(self.binned.values, self.binned.chroms)
+        if track_weighting:
+            self.track_weights = observed_track_weights(missing)
+        else:
+            self.track_weights = np.ones(self.binned.values.shape[1])
+
+        self.model = None
+        if self.checkpoint_dir is not None and (self.checkpoint_dir / CHECKPOINT_MODEL_FILE).exists():
+            self.model = GaussianHMM.load(self.checkpoint_dir / CHECKPOINT_MODEL_FILE)
+            self.log_likelihoods = json.loads((self.checkpoint_dir / CHECKPOINT_HISTORY_FILE).read_text())["log_likelihoods"]
+            print(f"Resuming from {self.checkpoint_dir}, after {len(self.log_likelihoods)} iterations", flush=True)
+        if self.model is None:
+            self.model = GaussianHMM.from_data(self.binned.values, n_states, seed=seed, track_weights=self.track_weights)
+
+        # every chromosome's row ranges, the whole chromosome or its observed segments
+        chroms = self.binned.chroms
+        self.segments = None
+        if max_missing_frac is None:
+            chrom_ranges = [[(int(row_start), int(row_end))] for row_start, row_end in zip(chroms["row_start"], chroms["row_end"])]
+        else:
+            self.segments = ObservedSegments.from_missing(missing, chroms, min_segment_bins, max_missing_frac)
+            chrom_ranges = [[] for _ in range(len(chroms.index))]
+            for chr_idx, row_start, length in zip(self.segments.chrom, self.segments.row_start, self.segments.lengths):
+                chrom_ranges[chr_idx].append((int(row_start), int(row_start + length)))
+            chroms = pd.DataFrame({"n_bins": np.bincount(self.segments.chrom, weights=self.segments.lengths, minlength=len(chroms.index))})
+        n_groups = self.n_workers if self.parallel else 1
+        self.row_groups = [
+            [row_range for chr_idx in group for row_range in chrom_ranges[chr_idx]]
+            for group in chrom_groups(chroms, n_groups)
+        ]
+        self.row_groups = [row_ranges for row_ranges in self.row_groups if row_ranges]
+
+    def e_step(self, proc_pool: ProcessPoolExecutor = None) -> HMMStats:
+        """
+        Sufficient statistics of the whole genome under the current model
+        """
+        if proc_pool is None:
+            return merge_stats([self.model.e_step([self.binned.values[row_start:row_end] for row_start, row_end in row_ranges], self.chunk_bins) for row_ranges in self.row_groups])
+        values_path = str((self.binned_dir / VALUES_FILE).absolute())
+        futures = [proc_pool.submit(_e_step_worker, values_path, row_ranges, self.model, self.chunk_bins) for row_ranges in self.row_groups]
+        return merge_stats([future.result() for future in futures])
+
+    def save_checkpoint(self) -> None:
+        """
+        Save the model and log likelihoods so far to `checkpoint_dir`,
+        each written to a temporary file first, so a checkpoint is never partial
+        """
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        model_tmp = self.checkpoint_dir / f".{CHECKPOINT_MODEL_FILE}.tmp"
+        with open(model_tmp, "wb") as f:
+            self.model.save(f)
+        history_tmp = self.checkpoint_dir / f".{CHECKPOINT_HISTORY_FILE}.tmp"
+        history_tmp.write_text(json.dumps({"log_likelihoods": self.log_likelihoods}))
+        os.replace(model_tmp, self.checkpoint_dir / CHECKPOINT_MODEL_FILE)
+        os.replace(history_tmp, self.checkpoint_dir / CHECKPOINT_HISTORY_FILE)
+
+    def fit(self, n_iters: int = 20, tol: float = 1e-4) -> GaussianHMM:
+        """
+        Run EM until `n_iters` iterations in total (counting resumed ones), or
+        the log likelihood improves by less than `tol` per bin
+        """
+        n_bins = sum(row_end - row_start for row_ranges in self.row_groups for row_start, row_end in row_ranges)
+        n_procs = len(self.row_groups)
+        print(f"Training a {self.n_states} state HMM on {n_bins} bins of {self.binned.values.shape[1]} tracks, {'in ' + str(n_procs) + ' processes' if self.parallel else 'in this process'}", flush=True)
+
+        proc_pool = ProcessPoolExecutor(max_workers=max(1, n_procs)) if self.parallel else None
+        try:
+            while len(self.log_likelihoods) < n_iters:
+                stats = self.e_step(proc_pool)
+                self.model.m_step(stats)
+                self.log_likelihoods.append(float(stats.log_likelihood))
+                print(f"EM iteration {len(self.log_likelihoods) - 1}: log likelihood {stats.log_likelihood:.6g}", flush=True)
+                if self.checkpoint_dir is not None:
+                    self.save_checkpoint()
+                if len(self.log_likelihoods) > 1 and self.log_likelihoods[-1] - self.log_likelihoods[-2] < tol * n_bins:
+                    break
+        finally:
+            if proc_pool is not None:
+                proc_pool.shutdown()
+        return self.model
+
+DESCRIPTION = "Trains a Gaussian HMM on a binned (genome bin x track) matrix with EM, chromosomes spread over a process pool."
+
+def add_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("binned_dir", type=Path, help="Binned output directory, as saved by the bigWig or bedGraph binners.")
+    parser.add_argument("n_states", type=int, help="Number of hidden states, i.e. chromatin states.")
+    parser.add_argument("--n-workers", type=int, help="Number of worker processes. Defaults to the number of CPUs.")
+    parser.add_argument("--iters", type=int, default=20, help="Maximum number of EM iterations.")
+    parser.add_argument("--tol", type=float, default=1e-4, help="Stop once the log likelihood improves by less than this per bin.")
+    parser.add_argument("--chunk-bins", type=int, default=10_000, help="Bins of each chromosome held in memory at once.")
+    parser.add_argument("--no-track-weights", action="store_true", help="Weight all tracks alike, instead of by their fraction of observed bins.")
+    parser.add_argument("--checkpoint-dir", type=Path, help="Directory to save the model to after every iteration, and resume from.")
+    parser.add_argument("--seed", type=int, help="Seed of the initial model.")
+    parser.add_argument("--max-missing-frac", type=float, help="Train only on segments of bins missing at most this fraction of the tracks. By default trains on whole chromosomes.")
+    parser.add_argument("--min-segment-bins", type=int, default=1, help="Shortest observed segment to train on, with `--max-missing-frac`.")
+    parser.add_argument("--out", type=Path, help="Path to save the trained model to. If not specified, will use `hmm.npz` in `binned_dir` directory")
+    return parser
+
+def init_argparser(parser: argparse.ArgumentParser) -> argparse.Namespace:
+    return add_arguments(parser).parse_args()
+
+def main(args: argparse.Namespace) -> None:
+    if args.out is None:
+        args.out = args.binned_dir / "hmm.npz"
+
+    trainer = EMTrainer(args.binned_dir, args.n_states, n_workers=args.n_workers, chunk_bins=args.chunk_bins, track_weighting=not args.no_track_weights, checkpoint_dir=args.checkpoint_dir, seed=args.seed, max_missing_frac=args.max_missing_frac, min_segment_bins=args.min_segment_bins)
+    model = trainer.fit(args.iters, args.tol)
+    model.save(args.out)
+    print(f"Saved trained model to {args.out}")
+
+if __name__ == "__main__":
+    main(init_argparser(argparse.ArgumentParser(description=DESCRIPTION)))
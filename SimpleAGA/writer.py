@@ -0,0 +1,246 @@
+import numpy as np
+import pandas as pd
+import pyBigWig
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from .binned import BinnedTracks, pybigwig_bin_edges, left_bin_edges
+from .hmm import GaussianHMM
+
+# UCSC browser itemRgb colors of states, cycled if there are more states
+STATE_COLORS = [
+    (31, 119, 180), (255, 127, 14), (44, 160, 44), (214, 39, 40), (148, 103, 189),
+    (140, 86, 75), (227, 119, 194), (127, 127, 127), (188, 189, 34), (23, 190, 207),
+    (174, 199, 232), (255, 187, 120), (152, 223, 138), (255, 152, 150), (197, 176, 213),
+    (196, 156, 148), (247, 182, 210), (199, 199, 199), (219, 219, 141), (158, 218, 229),
+]
+
+def state_colors(n_states: int) -> list[str]:
+    """
+    "r,g,b" itemRgb color of each of `n_states` states
+    """
+    return [",".join(str(c) for c in STATE_COLORS[state % len(STATE_COLORS)]) for state in range(n_states)]
+
+def value_runs(values: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Merge consecutive identical values (e.g. states) into runs, returned as
+    separate starts, ends (exclusive) and run values NumPy arrays.
+    NaN runs are merged too, then left out.
+    """
+    values = np.asarray(values)
+    if len(values) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), values[:0]
+    # where each value differs from the previous one
+    changes = values[1:] != values[:-1]
+    is_float = np.issubdtype(values.dtype, np.floating)
+    if is_float:
+        nans = np.isnan(values)
+        changes &= ~(nans[1:] & nans[:-1])
+    starts = np.concatenate(([0], np.flatnonzero(changes) + 1))
+    ends = np.append(starts[1:], len(values))
+    run_values = values[starts]
+    if is_float:
+        keep = ~nans[starts]
+        starts, ends, run_values = starts[keep], ends[keep], run_values[keep]
+    return starts, ends, run_values
+
+class SegmentationWriter:
+    def __init__(self, chroms: pd.DataFrame, bin_size: int, left_aligned=False):
+        """
+        Writes genome-wide per bin results, e.g. HMM states and posteriors,
+        rows laid out as a binned matrix's (chromosomes table of name, size,
+        n_bins, row_start, row_end, see `chrom_table`), as base pair
+        intervals: bins of `bigwig.stats` by default, or `bin_size` bins
+        from each chromosome's start if `left_aligned`, as `BigWigsBinner`
+        """
+        self.chroms = chroms
+        self.bin_size = bin_size
+        self.left_aligned = left_aligned
+
+    def bin_edges(self, chr_idx: int) -> np.ndarray:
+        """
+        Base pair boundaries of the `chr_idx`th chromosome's bins:
+        bin i is [edges[i], edges[i+1]), the last one maybe shorter
+        """
+        chr_size, chr_bins = self.chroms[["size", "n_bins"]].iloc[chr_idx]
+        if self.left_aligned:
+            return left_bin_edges(int(chr_size), self.bin_size)
+        return pybigwig_bin_edges(int(chr_size), int(chr_bins))
+
+    def chrom_runs(self, values: np.ndarray, chr_idx: int, start: int = 0, end: int = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Runs of identical values of the `chr_idx`th chromosome's bins
+        [start, end) (default all) of genome-wide `values`, as base pair
+        starts, ends (exclusive) and run values
+        """
+        row_start, chr_bins = int(self.chroms["row_start"].iat[chr_idx]), int(self.chroms["n_bins"].iat[chr_idx])
+        end = chr_bins if end is None else min(end, chr_bins)
+        starts, ends, run_values = value_runs(values[row_start + start:row_start + end])
+        bin_edges = self.bin_edges(chr_idx)
+        return bin_edges[starts + start], bin_edges[ends + start], run_values
+
+    def write_bed(self, path: Path, states: np.ndarray, state_names: list[str] = None, colors: list[str] = None, track_name: str = None, skip_state: int = None) -> None:
+        """
+        Write genome-wide `states`, one per bin, as BED9 of runs of the
+        same state, named by `state_names` (default the state numbers) and
+        colored by `colors` (default `state_colors`), streamed chromosome by
+        chromosome. Bins of `skip_state`, e.g. the fill of unobserved bins,
+        and NaN bins (e.g. scattered with the default fill) are left out.
+        """
+        observed = states[~np.isnan(states)] if np.issubdtype(states.dtype, np.floating) else states
+        n_states = int(observed.max()) + 1 if len(observed) else 0
+        if state_names is None:
+            state_names = [str(state) for state in range(n_states)]
+        if colors is None:
+            colors = state_colors(n_states)
+        state_names = np.asarray(state_names, dtype=object)
+        colors = np.asarray(colors, dtype=object)
+
+        with open(path, "w") as f:
+            if track_name is not None:
+                f.write(f'track name="{track_name}" itemRgb="On"\n')
+            for chr_idx, chr_name in enumerate(self.chroms["name"]):
+                starts, ends, run_states = self.chrom_runs(states, chr_idx)
+                if skip_state is not None:
+                    keep = run_states != skip_state
+                    starts, ends, run_states = starts[keep], ends[keep], run_states[keep]
+                run_states = run_states.astype(np.int64)
+                pd.DataFrame({
+                    "chrom": str(chr_name), "start": starts, "end": ends,
+                    "name": state_names[run_states], "score": 0, "strand": ".",
+                    "thick_start": starts, "thick_end": ends, "rgb": colors[run_states],
+                }).to_csv(f, sep="\t", header=False, index=False)
+
+    def write_bedGraph(self, path: Path, values: np.ndarray, track_name: str = None) -> None:
+        """
+        Write genome-wide `values`, one per bin, as bedGraph of runs of
+        the same value, NaN bins left out, streamed chromosome by chromosome
+        """
+        with open(path, "w") as f:
+            if track_name is not None:
+                f.write(f'track type=bedGraph name="{track_name}"\n')
+            for chr_idx, chr_name in enumerate(self.chroms["name"]):
+                starts, ends, run_values = self.chrom_runs(values, chr_idx)
+                pd.DataFrame({"chrom": str(chr_name), "start": starts, "end": ends, "value": run_values}).to_csv(f, sep="\t", header=False, index=False)
+
+    def write_bigWig(self, path: Path, values: np.ndarray, chunk_bins: int = 1_000_000) -> None:
+        """
+        Write genome-wide `values`, one per bin, as a bigWig of runs of the
+        same value (at bigWig's float32 precision), NaN bins left out,
+        `chunk_bins` bins at a time through batched `addEntries`
+        """
+        bw = pyBigWig.open(str(path), "w")
+        try:
+            bw.addHeader([(str(name), int(size)) for name, size in zip(self.chroms["name"], self.chroms["size"])])
+            for chr_idx, (chr_name, chr_bins) in enumerate(zip(self.chroms["name"], self.chroms["n_bins"])):
+                row_start = int(self.chroms["row_start"].iat[chr_idx])
+                bin_edges = self.bin_edges(chr_idx)
+                for start in range(0, int(chr_bins), chunk_bins):
+                    end = min(start + chunk_bins, int(chr_bins))
+                    chunk = np.asarray(values[row_start + start:row_start + end], dtype=np.float32)
+                    starts, ends, run_values = value_runs(chunk)
+                    if len(starts) == 0:
+                        continue
+                    bw.addEntries([str(chr_name)] * len(starts), bin_edges[starts + start], ends=bin_edges[ends + start], values=run_values.astype(np.float64))
+        finally:
+            bw.close()
+
+    def write_posterior_bigWigs(self, out_dir: Path, posteriors: np.ndarray, state_names: list[str] = None, parallel=True, n_workers: int = None, chunk_bins: int = 1_000_000) -> list[Path]:
+        """
+        Write each state's column of genome-wide (bin x state) `posteriors`
+        as its own bigWig in `out_dir`, named `posterior_<state name>.bw`.
+        If `parallel`, the states are written by a pool of `n_workers`
+        processes (default one per CPU), each memory-mapping `posteriors`
+        if it is a memory-mapped `.npy`, else sent its column.
+        Returns the bigWigs' paths, in state order.
+        """
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        n_states = posteriors.shape[1]
+        if state_names is None:
+            state_names = [str(state) for state in range(n_states)]
+        bw_paths = [out_dir / f"posterior_{name}.bw" for name in state_names]
+
+        if not parallel or n_states <= 1:
+            for state, bw_path in enumerate(bw_paths):
+                self.write_bigWig(bw_path, posteriors[:, state], chunk_bins)
+            return bw_paths
+
+        values_path = None
+        if isinstance(posteriors, np.memmap) and posteriors.filename is not None and str(posteriors.filename).endswith(".npy"):
+            if np.load(posteriors.filename, mmap_mode="r").shape == posteriors.shape:
+                values_path = str(posteriors.filename)
+        with ProcessPoolExecutor(max_workers=min(n_workers or os.cpu_count(), n_states)) as proc_pool:
+            futures = [
+                proc_pool.submit(_write_bigWig_worker, self, str(bw_path), values_path or np.ascontiguousarray(posteriors[:, state]), state if values_path else None, chunk_bins)
+                for state, bw_path in enumerate(bw_paths)
+            ]
+            for future in futures:
+                future.result()
+        return bw_paths
+
+def _write_bigWig_worker(writer: SegmentationWriter, bw_path: str, values_ref, column: int, chunk_bins: int) -> None:
+    """
+    Process pool task: write one bigWig of either a column of the
+    memory-mapped `.npy` at path `values_ref`, or the array `values_ref`
+    """
+    if isinstance(values_ref, str):
+        values_ref = np.load(values_ref, mmap_mode="r")[:, column]
+    writer.write_bigWig(bw_path, values_ref, chunk_bins)
+
+def decode(binned: BinnedTracks, model: GaussianHMM, posteriors_path: Path = None, chunk_bins: int = 10_000) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Viterbi states of every bin, chromosome by chromosome, and, if given a
+    `posteriors_path`, the (bin x state) posteriors memory-mapped there
+    """
+    chrom_values = [binned.values[row_start:row_end] for row_start, row_end in zip(binned.chroms["row_start"], binned.chroms["row_end"])]
+    paths, _ = model.viterbi(chrom_values, chunk_bins)
+    states = np.concatenate(paths) if paths else np.empty(0, dtype=np.uint8)
+    if posteriors_path is None:
+        return states, None
+
+    posteriors = np.lib.format.open_memmap(posteriors_path, mode="w+", dtype=np.float32, shape=(len(states), model.n_states), fortran_order=True)
+    row_starts = binned.chroms["row_start"].to_numpy(dtype=np.int64)
+    def fill(seq_idx: int, start: int, chunk_posteriors: np.ndarray) -> None:
+        row = row_starts[seq_idx] + start
+        posteriors[row:row + len(chunk_posteriors)] = chunk_posteriors
+    model.e_step(chrom_values, chunk_bins, fill)
+    posteriors.flush()
+    return states, posteriors
+
+DESCRIPTION = "Decodes a binned (genome bin x track) matrix with a trained HMM, writing the states as BED9 and optionally posteriors as bigWigs."
+
+def add_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("binned_dir", type=Path, help="Binned output directory, as saved by the bigWig or bedGraph binners.")
+    parser.add_argument("model", type=Path, help="Trained HMM, as saved by `train.py`.")
+    parser.add_argument("--out-dir", type=Path, help="Directory to write the segmentation to. If not specified, will use `binned_dir`")
+    parser.add_argument("--posteriors", action="store_true", help="Also write each state's posterior probabilities as a bigWig.")
+    parser.add_argument("--layout", choices=["saved", "pybigwig", "left"], default="saved", help="Base pair layout of the bins: the one saved in `binned_dir`, pyBigWig's, or laid from each chromosome's start (as binned with `--left-aligned`).")
+    parser.add_argument("--n-workers", type=int, help="Number of processes writing posterior bigWigs. Defaults to the number of CPUs.")
+    parser.add_argument("--chunk-bins", type=int, default=10_000, help="Bins of each chromosome held in memory at once while decoding.")
+    return parser
+
+def init_argparser(parser: argparse.ArgumentParser) -> argparse.Namespace:
+    return add_arguments(parser).parse_args()
+
+def main(args: argparse.Namespace) -> None:
+    if args.out_dir is None:
+        args.out_dir = args.binned_dir
+
+    binned = BinnedTracks.load(args.binned_dir)
+    left_aligned = binned.left_aligned if args.layout == "saved" else args.layout == "left"
+    if left_aligned != binned.left_aligned:
+        print(f"Writing {args.binned_dir}'s bins {'left-aligned' if left_aligned else 'as pyBigWig'}, not as they were saved", flush=True)
+    model = GaussianHMM.load(args.model)
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    states, posteriors = decode(binned, model, args.out_dir / "posteriors.npy" if args.posteriors else None, args.chunk_bins)
+    writer = SegmentationWriter(binned.chroms, binned.bin_size, left_aligned)
+    writer.write_bed(args.out_dir / "segmentation.bed", states, track_name=args.model.stem)
+    print(f"Saved segmentation to {args.out_dir / 'segmentation.bed'}", flush=True)
+    if posteriors is not None:
+        bw_paths = writer.write_posterior_bigWigs(args.out_dir, posteriors, n_workers=args.n_workers)
+        print(f"Saved posteriors to {', '.join(str(bw_path) for bw_path in bw_paths)}", flush=True)
+
+if __name__ == "__main__":
+    main(init_argparser(argparse.ArgumentParser(description=DESCRIPTION)))
@@ -0,0 +1,348 @@
+'''
+Binning benchmarks on synthetic genome-scale tracks.
+
+Generates synthetic bigWigs (with `write_test_bigWig`) and the same
+signal as bedGraphs (with `write_test_bedGraph`), at one of several
+genome scales up to all of hg38, with realistic interval lengths and
+gaps: short gaps between covered stretches, plus large unmapped
+telomere/centromere-like blocks. Then bins them with every requested
+mode of `BigWigsBinner` and `BedGraphsBinner`, each run in a fresh
+process, and records per run:
+    - wall time (s), from opening the tracks to the binned matrix
+    - throughput: bins/s (genome bins x tracks) and MB/s of input files
+    - peak RSS (MB) of the run's process (its own VmHWM, not inherited
+      from the generating process), and of its largest worker process
+      (which counts pages shared with the run's process at fork)
+Results are written as JSON, and compared against an earlier results
+file if given with `--baseline`.
+
+Usage, from the repository root:
+    python benchmarks/bench_binning.py --scale chr1 --n-tracks 4 --out results.json
+    python benchmarks/bench_binning.py --scale chr1 --baseline results.json
+'''
+
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterator
+
+REPO_ROOT = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+# hg38 primary chromosomes
+HG38_SIZES = {
+    "chr1": 248956422, "chr2": 242193529, "chr3": 198295559, "chr4": 190214555,
+    "chr5": 181538259, "chr6": 170805979, "chr7": 159345973, "chr8": 145138636,
+    "chr9": 138394717, "chr10": 133797422, "chr11": 135086622, "chr12": 133275309,
+    "chr13": 114364328, "chr14": 107043718, "chr15": 101991189, "chr16": 90338345,
+    "chr17": 83257441, "chr18": 80373285, "chr19": 58617616, "chr20": 64444167,
+    "chr21": 46709983, "chr22": 50818468, "chrX": 156040895, "chrY": 57227415,
+}
+
+# genome scale -> {chrom: size}
+SCALES = {
+    "small": {"chr21": 5_000_000, "chr22": 5_000_000},
+    "chr21-22": {chrom: HG38_SIZES[chrom] for chrom in ("chr21", "chr22")},
+    "chr1": {"chr1": HG38_SIZES["chr1"]},
+    "hg38": HG38_SIZES,
+}
+
+MODES = ["sequential", "threads", "processes", "processes-mmap", "left-aligned", "blocks", "bedgraph"]
+
+def synthetic_chrom(chr_name: str, chr_size: int, rng: np.random.Generator, mean_interval: int, mean_run: int, mean_gap: int, unmapped_frac: float, nan_frac: float) -> pd.DataFrame:
+    """
+    Synthetic signal values of one chromosome, as `write_test_bigWig`'s
+    `chrom_sig_vals` (columns chrom_name, start, stop, value):
+    back to back intervals of geometric lengths (mean `mean_interval` bp)
+    with log-normal values, in covered stretches (mean `mean_run` bp)
+    separated by gaps without intervals (mean `mean_gap` bp).
+    The first and last `unmapped_frac` / 4 and a block of `unmapped_frac` / 2
+    of the chromosome around its middle (telomeres, centromere) have no
+    intervals at all, and a `nan_frac` fraction of values are NaN.
+    """
+    def boundaries(mean_len: int) -> np.ndarray:
+        lengths = rng.geometric(1 / mean_len, size=int(chr_size / mean_len * 1.1) + 16)
+        bounds = np.cumsum(lengths)
+        while bounds[-1] < chr_size:
+            bounds = np.concatenate((bounds, bounds[-1] + np.cumsum(rng.geometric(1 / mean_len, size=len(bounds) // 10 + 16))))
+        return np.concatenate(([0], bounds[bounds < chr_size], [chr_size]))
+
+    bounds = boundaries(mean_interval)
+    starts, stops = bounds[:-1], bounds[1:]
+
+    # alternate covered stretches and gaps, keeping intervals starting in a covered one
+    stretch_bounds = np.cumsum(rng.geometric(np.array([1 / mean_run, 1 / mean_gap]), size=(int(chr_size / (mean_run + mean_gap)) + 16, 2)).ravel())
+    while stretch_bounds[-1] < chr_size:
+        stretch_bounds = np.concatenate((stretch_bounds, stretch_bounds[-1] + np.cumsum(rng.geometric(np.array([1 / mean_run, 1 / mean_gap]), size=(16, 2)).ravel())))
+    covered = np.searchsorted(stretch_bounds, starts, side="right") % 2 == 0
+
+    # unmapped telomeres and centromere
+    telomere = int(chr_size * unmapped_frac / 4)
+    centromere_start = int(chr_size * (0.5 - unmapped_frac / 4))
+    centromere_end = int(chr_size * (0.5 + unmapped_frac / 4))
+    covered &= (starts >= telomere) & (stops <= chr_size - telomere)
+    covered &= (stops <= centromere_start) | (starts >= centromere_end)
+
+    starts, stops = starts[covered], stops[covered]
+    values = rng.lognormal(mean=0.0, sigma=1.0, size=len(starts))
+    values[rng.random(len(starts)) < nan_frac] = np.nan
+    return pd.DataFrame({
+        "chrom_name": np.full(len(starts), chr_name, dtype=object),
+        "start": starts,
+        "stop": stops,
+        "value": values,
+    })
+
+def synthetic_chroms(chrom_sizes: pd.DataFrame, seed: int, **signal_params) -> Iterator[pd.DataFrame]:
+    """
+    `synthetic_chrom` of every chromosome in `chrom_sizes`, in order
+    """
+    rng = np.random.default_rng(seed)
+    for chr_name, chr_size in chrom_sizes.itertuples(index=False, name=None):
+        yield synthetic_chrom(chr_name, int(chr_size), rng, **signal_params)
+
+def generate_tracks(work_dir: Path, chrom_sizes: pd.DataFrame, n_tracks: int, seed: int, signal_params: dict, bedgraphs: bool) -> tuple[list[Path], list[Path]]:
+    """
+    Write `n_tracks` synthetic bigWigs (and bedGraphs of the same signal if
+    `bedgraphs`) to `work_dir`, reusing ones already there for the same
+    genome and parameters
+    """
+    from tests.helpers import write_test_bigWig, write_test_bedGraph
+
+    work_dir.mkdir(parents=True, exist_ok=True)
+    sizes_path = work_dir / "synthetic.chrom.sizes"
+    chrom_sizes.to_csv(sizes_path, sep="\t", header=False, index=False)
+
+    bw_paths, bg_paths = [], []
+    for track_idx in range(n_tracks):
+        track_seed = seed + track_idx
+        # anything changing the signal changes the file name
+        stem = f"synthetic_{len(chrom_sizes.index)}chroms_{int(chrom_sizes['size'].sum())}bp_" + "_".join(f"{val}" for val in signal_params.values()) + f"_{track_seed}"
+        bw_paths.append(work_dir / f"{stem}.bw")
+        if not bw_paths[-1].exists():
+            print(f"Generating {bw_paths[-1]}", flush=True)
+            tmp_path = bw_paths[-1].with_suffix(".bw.tmp")
+            write_test_bigWig(chrom_sizes, synthetic_chroms(chrom_sizes, track_seed, **signal_params), tmp_path, sizes_path)
+            os.replace(tmp_path, bw_paths[-1])
+        if bedgraphs:
+            bg_paths.append(work_dir / f"{stem}.bedGraph")
+            if not bg_paths[-1].exists():
+                print(f"Generating {bg_paths[-1]}", flush=True)
+                tmp_path = bg_paths[-1].with_suffix(".bedGraph.tmp")
+                write_test_bedGraph(synthetic_chroms(chrom_sizes, track_seed, **signal_params), tmp_path)
+                os.replace(tmp_path, bg_paths[-1])
+    return bw_paths, bg_paths
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident memory of this process, in MB. Linux' VmHWM starts over
+    at exec, while `ru_maxrss` keeps the high-water mark of the process
+    that forked it (here the one that generated the tracks), so the latter
+    is only used where there's no /proc
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_mode(config: dict) -> dict:
+    """
+    Bin the tracks of `config` with its mode, in this process,
+    and measure it
+    """
+    import SimpleAGA
+
+    chrom_sizes = pd.DataFrame(config["chrom_sizes"], columns=["name", "size"])
+    dtype = np.dtype(config["dtype"])
+    mode = config["mode"]
+    paths = [Path(path) for path in (config["bg_paths"] if mode == "bedgraph" else config["bw_paths"])]
+    rss_before_mb = peak_rss_mb()
+
+    with tempfile.TemporaryDirectory(dir=config["work_dir"]) as out_dir:
+        wall_start = time.perf_counter()
+        if mode == "bedgraph":
+            binner = SimpleAGA.BedGraphsBinner(paths, chrom_sizes, config["bin_size"], dtype=dtype)
+            binned_mat = binner.load_bin_all_bgs()
+        else:
+            binner = SimpleAGA.BigWigsBinner(
+                paths, chrom_sizes, config["bin_size"],
+                parallel=mode != "sequential",
+                processes=mode.startswith("processes"),
+                n_workers=config["n_workers"],
+                dtype=dtype,
+                out_dir=Path(out_dir) if mode == "processes-mmap" else None,
+                left_aligned=mode == "left-aligned",
+            )
+            if mode == "blocks":
+                for block in binner.iter_blocks(config["block_bins"]):
+                    pass
+                binned_mat = None
+            else:
+                binner.load_bin_all_bws()
+                binned_mat = binner.binned_mat
+        wall_s = time.perf_counter() - wall_start
+
+        n_bins = int(binner.chrom_sizes["n_bins"].sum())
+        missing_frac = None
+        if binned_mat is not None:
+            missing_frac = float(np.mean(binner.missing_index.missing_fraction()))
+        if mode != "bedgraph":
+            binner.close()
+        del binned_mat, binner
+
+    input_mb = sum(path.stat().st_size for path in paths) / 1e6
+    return {
+        "mode": mode,
+        "wall_s": wall_s,
+        "n_bins": n_bins,
+        "n_tracks": len(paths),
+        "bins_per_s": n_bins * len(paths) / wall_s,
+        "input_mb": input_mb,
+        "mb_per_s": input_mb / wall_s,
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_before_mb": rss_before_mb,
+        "peak_child_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        "missing_frac": missing_frac,
+    }
+
+def run_mode_subprocess(config: dict, verbose: bool) -> dict:
+    """
+    `run_mode` in a fresh Python process, so peak RSS (see `peak_rss_mb`)
+    is the run's own
+    """
+    with tempfile.TemporaryDirectory(dir=config["work_dir"]) as tmp_dir:
+        config_path = Path(tmp_dir) / "config.json"
+        result_path = Path(tmp_dir) / "result.json"
+        config_path.write_text(json.dumps(config))
+        subprocess.run(
+            [sys.executable, __file__, "--run-one", str(config_path), str(result_path)],
+            check=True, cwd=REPO_ROOT,
+            stdout=None if verbose else subprocess.DEVNULL,
+        )
+        return json.loads(result_path.read_text())
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: dict, baseline: dict) -> None:
+    """
+    Print each mode's speedup and memory change against a `baseline`
+    results file, matching runs on scale, bin size, number of tracks and mode
+    """
+    def run_key(params: dict, run: dict) -> tuple:
+        return (params["scale"], params["bin_size"], run["n_tracks"], run["mode"])
+
+    baseline_runs = {run_key(baseline["params"], run): run for run in baseline["runs"]}
+    print(f"Against baseline {baseline['commit']} ({baseline['date']}):")
+    for run in results["runs"]:
+        base_run = baseline_runs.get(run_key(results["params"], run))
+        if base_run is None:
+            print(f"\t{run['mode']:>15}: no baseline run")
+            continue
+        print(f"\t{run['mode']:>15}: {base_run['wall_s'] / run['wall_s']:.2f}x speed, peak RSS {base_run['peak_rss_mb']:.0f} -> {run['peak_rss_mb']:.0f} MB")
+
+def init_argparser(parser: argparse.ArgumentParser) -> argparse.Namespace:
+    parser.add_argument("--scale", choices=SCALES, default="small", help="Synthetic genome: a few Mb, hg38 chr21 and chr22, chr1 or all of hg38's primary chromosomes.")
+    parser.add_argument("--chrom-sizes", type=Path, help="`.sizes` file of the synthetic genome, instead of `--scale`.")
+    parser.add_argument("--n-tracks", type=int, default=4, help="Number of synthetic tracks.")
+    parser.add_argument("--bin-size", type=int, default=200, help="Bin size in base pairs.")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES, help="Binning modes to run.")
+    parser.add_argument("--n-workers", type=int, help="Number of worker processes of the process pool modes. Defaults to the number of CPUs.")
+    parser.add_argument("--float32", action="store_true", help="Bin into 32-bit instead of 64-bit floats.")
+    parser.add_argument("--block-bins", type=int, default=100_000, help="Bins per block in the `blocks` mode.")
+    parser.add_argument("--repeats", type=int, default=1, help="Runs of each mode.")
+    parser.add_argument("--mean-interval", type=int, default=50, help="Mean length of the bigWigs' intervals in bp.")
+    parser.add_argument("--mean-run", type=int, default=20_000, help="Mean length of covered stretches in bp.")
+    parser.add_argument("--mean-gap", type=int, default=2_000, help="Mean length of gaps between covered stretches in bp.")
+    parser.add_argument("--unmapped-frac", type=float, default=0.05, help="Fraction of every chromosome in unmapped telomeres and centromere.")
+    parser.add_argument("--nan-frac", type=float, default=0.0, help="Fraction of intervals with NaN values.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", type=Path, default=REPO_ROOT / "bench_data", help="Directory for the synthetic tracks, kept and reused across runs.")
+    parser.add_argument("--out", type=Path, help="JSON file to write the results to. If not specified, will use `results_<scale>_<time>.json` in `work_dir`")
+    parser.add_argument("--baseline", type=Path, help="Earlier results JSON file to compare against.")
+    parser.add_argument("--verbose", action="store_true", help="Show the binners' output.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--run-one":
+        # one measured run, in its own process
+        result = run_mode(json.loads(Path(sys.argv[2]).read_text()))
+        Path(sys.argv[3]).write_text(json.dumps(result))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Benchmarks binning synthetic genome-scale bigWigs and bedGraphs with every binning mode.")
+    args = init_argparser(parser)
+
+    if args.chrom_sizes is not None:
+        chrom_sizes = pd.read_csv(args.chrom_sizes, sep=r"\s+", header=None, names=["name", "size"], usecols=[0, 1])
+        scale = args.chrom_sizes.stem
+    else:
+        chrom_sizes = pd.DataFrame(SCALES[args.scale].items(), columns=["name", "size"])
+        scale = args.scale
+    signal_params = {
+        "mean_interval": args.mean_interval,
+        "mean_run": args.mean_run,
+        "mean_gap": args.mean_gap,
+        "unmapped_frac": args.unmapped_frac,
+        "nan_frac": args.nan_frac,
+    }
+    bw_paths, bg_paths = generate_tracks(args.work_dir, chrom_sizes, args.n_tracks, args.seed, signal_params, "bedgraph" in args.modes)
+
+    config = {
+        "chrom_sizes": list(chrom_sizes.itertuples(index=False, name=None)),
+        "bw_paths": [str(path) for path in bw_paths],
+        "bg_paths": [str(path) for path in bg_paths],
+        "bin_size": args.bin_size,
+        "n_workers": args.n_workers,
+        "dtype": "float32" if args.float32 else "float64",
+        "block_bins": args.block_bins,
+        "work_dir": str(args.work_dir),
+    }
+    runs = []
+    for mode in args.modes:
+        for repeat in range(args.repeats):
+            print(f"Running {mode} ({repeat + 1}/{args.repeats})...", flush=True)
+            run = run_mode_subprocess(dict(config, mode=mode), args.verbose)
+            run["repeat"] = repeat
+            runs.append(run)
+            workers_rss = f" (workers {run['peak_child_rss_mb']:.0f} MB)" if mode.startswith("processes") else ""
+            print(f"\t{run['wall_s']:.2f} s, {run['bins_per_s']:.3g} bins/s, {run['mb_per_s']:.1f} MB/s, peak RSS {run['peak_rss_mb']:.0f} MB{workers_rss}", flush=True)
+
+    results = {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpus": os.cpu_count(),
+        },
+        "params": dict(
+            signal_params, scale=scale, n_chroms=len(chrom_sizes.index), genome_bp=int(chrom_sizes["size"].sum()),
+            n_tracks=args.n_tracks, bin_size=args.bin_size, n_workers=args.n_workers, dtype=config["dtype"],
+            block_bins=args.block_bins, seed=args.seed,
+        ),
+        "runs": runs,
+    }
+    out_path = args.out if args.out is not None else args.work_dir / f"results_{scale}_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out_path.write_text(json.dumps(results, indent=2))
+    print(f"Wrote results to {out_path}")
+
+    if args.baseline is not None:
+        compare(results, json.loads(args.baseline.read_text()))
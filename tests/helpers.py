@@ -0,0 +1,116 @@
+'''
+Helpers shared by the test scripts
+'''
+
+import numpy as np
+import pandas as pd
+import pyBigWig
+import itertools
+from typing import Union, Iterable
+from pathlib import Path
+from .context import SimpleAGA
+
+def write_binned(binned_dir, seed: int = 0) -> SimpleAGA.BinnedTracks:
+    '''
+    Save a binned output directory of 3 chromosomes of 2 tracks from a 2
+    state model, the second track missing much more often than the first
+    '''
+    rng = np.random.default_rng(seed)
+    chroms = SimpleAGA.chrom_offsets(pd.DataFrame({"name": ["chr1", "chr2", "chr3"], "size": [1200, 700, 400], "n_bins": [1200, 700, 400]}))
+    states = np.repeat(rng.integers(0, 2, size=92), 25)
+    values = np.array([[0.0, 0.0], [4.0, -4.0]])[states] + rng.normal(size=(len(states), 2))
+    values[rng.random(len(states)) < 0.05, 0] = np.nan
+    values[rng.random(len(states)) < 0.5, 1] = np.nan
+
+    tracks = pd.DataFrame({"name": ["a", "b"], "path": ["a.bw", "b.bw"]})
+    SimpleAGA.save_binned(binned_dir, values, chroms, tracks, 1)
+    missing = SimpleAGA.MissingIndex.from_matrix(values, chroms)
+    missing.save(binned_dir / SimpleAGA.MISSING_FILE)
+    return SimpleAGA.BinnedTracks.load(binned_dir)
+
+def write_test_bigWig(chrom_sizes: pd.DataFrame, chrom_sig_vals: Union[pd.DataFrame, Iterable[pd.DataFrame]], bw_path: Path, chrom_sizes_path: Path, verbose=False) -> None:
+    '''
+    Writes a test bigWig file to bw_path, using
+        - the chromosome sizes in `chrom_sizes_path`, and
+        - the signal values in `chrom_sig_vals`.
+    Format of `chrom_sizes`:
+        columns: name <str>, size <int>, one row per chromosome
+    Format of `chrom_sig_vals`: each row represents a signal value,
+        which chromosome is included in a column
+        columns: chrom_name <str>, start <int>, stop <int>, value <float>
+    or an iterable of such DataFrames, one per chromosome in `chrom_sizes`
+    order, so only one chromosome's values are ever in memory (e.g. a
+    generator, as the benchmarks use for genome-sized bigWigs).
+    Prints each chromosome's values as it's written if `verbose`.
+    '''
+
+    # TODO: Support arbitrary intervals (i.e. start and stop positions)
+    # per value in chromosomes. Switch `chrom_sig_vals` to a single
+    # signal values DataFrame, with columns: chrom, start, stop, value
+
+    bw = pyBigWig.open(str(bw_path), "w")
+    row_tuples = chrom_sizes.itertuples(index=False, name=None)
+    bw.addHeader(list(row_tuples))
+
+    # TODO? count and report # unmapped bases for debugging
+
+    if isinstance(chrom_sig_vals, pd.DataFrame):
+        grouped_sigs = chrom_sig_vals.groupby("chrom_name")
+    else:
+        grouped_sigs = ((chr_group["chrom_name"].iat[0], chr_group) for chr_group in chrom_sig_vals if len(chr_group.index))
+    for chr_name, chr_group in grouped_sigs:
+        if verbose:
+            print(f"Writing {chr_name}...")
+            print(chr_group)
+
+        df_cols_dict = chr_group.to_dict(orient="list")
+        bw.addEntries((df_cols_dict["chrom_name"]), (df_cols_dict["start"]), ends=(df_cols_dict["stop"]), values=(df_cols_dict["value"]))
+    bw.close()
+
+    chrom_sizes.to_csv(chrom_sizes_path, sep='\t', index=False, header=False)
+
+def write_missing_tracks(data_dir: Path, n_tracks: int, prefix: str) -> tuple[pd.DataFrame, list[Path]]:
+    '''
+    Write `n_tracks` bigWigs to `data_dir`, track i being:
+    # `-` denotes missing
+    chr1: 0 - 0 1 2 3 - - 0 1
+    chr2: 0 1 2 3
+    chr3: - 0 - 0 1 2 -
+    plus i
+    '''
+    chrom_sizes = pd.DataFrame([
+        ("chr1", 10),
+        ("chr2", 4),
+        ("chr3", 7)], columns=["name", "size"])
+    chr_names = [[name] * size for name, size in chrom_sizes.itertuples(index=False, name=None)]
+    sig_vals = [
+        [0, np.nan, 0, 1, 2, 3, np.nan, np.nan, 0, 1],
+        [0, 1, 2, 3],
+        [np.nan, 0, np.nan, 0, 1, 2, np.nan]
+    ]
+    starts = [list(range(chr_size)) for chr_size in chrom_sizes["size"]]
+    ends = [list(range(1, chr_size+1)) for chr_size in chrom_sizes["size"]]
+    bw_paths = []
+    for track_idx in range(n_tracks):
+        chrom_sig_vals = pd.DataFrame({
+            "chrom_name": list(itertools.chain.from_iterable(chr_names)),
+            "start": list(itertools.chain.from_iterable(starts)),
+            "stop": list(itertools.chain.from_iterable(ends)),
+            "value": np.array(list(itertools.chain.from_iterable(sig_vals))) + track_idx
+        })
+        bw_paths.append(data_dir / f"{prefix}_{track_idx}.bw")
+        write_test_bigWig(chrom_sizes, chrom_sig_vals, bw_paths[-1], data_dir / f"{prefix}.chrom.sizes")
+    return chrom_sizes, bw_paths
+
+def write_test_bedGraph(chrom_sig_vals: Union[pd.DataFrame, Iterable[pd.DataFrame]], bg_path) -> None:
+    '''
+    Writes `chrom_sig_vals` (columns chrom_name, start, stop, value),
+    or an iterable of such DataFrames written one after another,
+    as a bedGraph with a track line
+    '''
+    if isinstance(chrom_sig_vals, pd.DataFrame):
+        chrom_sig_vals = [chrom_sig_vals]
+    with open(bg_path, "w") as f:
+        f.write("track type=bedGraph name=test\n")
+        for chr_sig_vals in chrom_sig_vals:
+            chr_sig_vals.to_csv(f, sep="\t", header=False, index=False)
@@ -0,0 +1,75 @@
+'''
+Binned chromosomes cache test script using pytest
+'''
+
+import numpy as np
+import os
+from .context import SimpleAGA
+from .helpers import write_missing_tracks
+import pytest
+
+class TestBinnedCache:
+    def test_put_get_evict(self, tmp_path):
+        track_path = tmp_path / "track.bw"
+        track_path.write_bytes(b"not really a bigWig")
+        cache = SimpleAGA.BinnedCache(tmp_path / "cache", max_bytes=2 * (128 + 8 * 100))
+
+        keys = [cache.key(track_path, 10, "mean", np.float64, chr_name, 1000) for chr_name in ["chr1", "chr2", "chr3"]]
+        assert(len(set(keys)) == 3)
+        assert(cache.get(keys[0]) is None)
+
+        cache.put(keys[0], np.arange(100, dtype=np.float64))
+        cache.put(keys[1], np.ones(100))
+        np.testing.assert_array_equal(cache.get(keys[0]), np.arange(100))
+        # chr2 is now the least recently used, evicted to make room
+        os.utime(cache.entry_path(keys[1]), ns=(0, 0))
+        cache.put(keys[2], np.zeros(100))
+        assert(cache.get(keys[1]) is None)
+        assert(cache.get(keys[0]) is not None and cache.get(keys[2]) is not None)
+
+        report = cache.report()
+        assert(report["entries"] == 2)
+        assert(report["hits"] == 3 and report["misses"] == 2)
+
+        # any change to the file is a different key
+        os.utime(track_path, ns=(10**9, 10**9))
+        assert(cache.key(track_path, 10, "mean", np.float64, "chr1", 1000) != keys[0])
+        assert(cache.key(track_path, 20, "mean", np.float64, "chr1", 1000) != keys[0])
+
+    def test_put_again(self, tmp_path):
+        track_path = tmp_path / "track.bw"
+        track_path.write_bytes(b"not really a bigWig")
+        cache = SimpleAGA.BinnedCache(tmp_path / "cache")
+        key = cache.key(track_path, 10, "mean", np.float64, "chr1", 1000)
+        cache.put(key, np.arange(100, dtype=np.float64))
+        n_bytes = cache.report()["bytes"]
+        assert(n_bytes == cache.entry_path(key).stat().st_size)
+
+        # overwriting an entry counts its bytes once
+        cache.put(key, np.ones(100))
+        cache.put(key, np.ones(50))
+        assert(cache.report()["entries"] == 1)
+        assert(cache.report()["bytes"] == cache.entry_path(key).stat().st_size == n_bytes - 8 * 50)
+
+    @pytest.mark.parametrize("processes", [False, True])
+    def test_binner_reuses_cache(self, tmp_path, processes):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 2, f"test_cache_{processes}")
+        cache = SimpleAGA.BinnedCache(tmp_path / "cache")
+
+        BIN_SIZE = 2
+        first = SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes.copy(), BIN_SIZE, processes=processes, n_workers=2, cache=cache)
+        first.load_bin_all_bws()
+        assert(cache.hits == 0 and cache.misses == 6)
+
+        second = SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes.copy(), BIN_SIZE, processes=processes, n_workers=2, cache=cache)
+        second.load_bin_all_bws()
+        assert(cache.hits == 6 and cache.misses == 6)
+        np.testing.assert_array_equal(second.binned_mat, first.binned_mat)
+        assert(second.missing_bins.equals(first.missing_bins))
+
+        # only the changed track is rebinned
+        os.utime(bw_paths[1])
+        third = SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes.copy(), BIN_SIZE, processes=processes, n_workers=2, cache=cache)
+        third.load_bin_all_bws()
+        assert(cache.hits == 9 and cache.misses == 9)
+        np.testing.assert_array_equal(third.binned_mat, first.binned_mat)
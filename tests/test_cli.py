@@ -0,0 +1,68 @@
+'''
+Command line entry point test script using pytest
+'''
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from .context import SimpleAGA
+from .helpers import write_binned
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ["torch", "pandas", "pyBigWig", "pyBedGraph"]
+
+def run_fresh(code: str, *args: str) -> subprocess.CompletedProcess:
+    '''
+    Run `code` in a new interpreter, so nothing is imported yet
+    '''
+    return subprocess.run([sys.executable, *args, "-c", code], cwd=REPO_DIR, capture_output=True, text=True, check=True, env={**os.environ, "PYTHONPATH": str(REPO_DIR)})
+
+class TestCLI:
+    def test_lazy_imports(self):
+        loaded = json.loads(run_fresh(
+            "import json, sys, SimpleAGA, SimpleAGA.cli\n"
+            "SimpleAGA.cli.build_parser()\n"
+            "help_modules = sorted(sys.modules)\n"
+            "SimpleAGA.cli.build_parser('bin')\n"
+            f"print(json.dumps({{'help': [m for m in {HEAVY_MODULES} if m in help_modules], 'bin': [m for m in {HEAVY_MODULES} if m in sys.modules]}}))"
+        ).stdout.splitlines()[-1])
+        # nothing heavy for `--help`, and only what binning bigWigs needs for `bin`
+        assert(loaded["help"] == [])
+        assert(loaded["bin"] == ["pandas", "pyBigWig"])
+
+    def test_import_cli(self):
+        loaded = run_fresh(f"import sys, SimpleAGA.cli; print([m for m in {HEAVY_MODULES} if m in sys.modules])").stdout.splitlines()[-1]
+        assert(loaded == "[]")
+
+    def test_list_tracks_imports(self, tmp_path):
+        # listing (or dropping) tracks never bins, so doesn't load pyBigWig
+        write_binned(tmp_path / "binned")
+        loaded = json.loads(run_fresh(
+            "import json, sys, SimpleAGA.cli\n"
+            f"SimpleAGA.cli.main(['tracks', {str(tmp_path / 'binned')!r}, 'list'])\n"
+            f"print(json.dumps([m for m in {HEAVY_MODULES} if m in sys.modules]))"
+        ).stdout.splitlines()[-1])
+        assert(loaded == ["pandas"])
+
+    def test_lazy_attributes(self):
+        assert(SimpleAGA.writer.decode is SimpleAGA.writer.decode)
+        assert(SimpleAGA.bin_chrom.__module__ == "SimpleAGA.proc_bigWigs")
+        assert("TrackManifest" in dir(SimpleAGA))
+        with pytest.raises(AttributeError):
+            SimpleAGA.not_a_name
+
+    def test_commands(self, tmp_path, capsys):
+        write_binned(tmp_path / "binned")
+        SimpleAGA.cli.main(["inspect", str(tmp_path / "binned"), "--chroms"])
+        out = capsys.readouterr().out
+        assert("2300 bins x 2 tracks" in out)
+        assert("chr3" in out and "missing" in out)
+
+        SimpleAGA.cli.main(["tracks", str(tmp_path / "binned"), "drop", "b"])
+        assert(list(SimpleAGA.BinnedTracks.load(tmp_path / "binned").tracks["name"]) == ["a"])
+
+        with pytest.raises(SystemExit):
+            SimpleAGA.cli.main(["bogus"])
@@ -0,0 +1,66 @@
+'''
+Binned windows Dataset test script using pytest
+'''
+
+import numpy as np
+import pandas as pd
+import torch
+from .context import SimpleAGA
+from .helpers import write_binned
+import pytest
+
+class TestBinnedWindows:
+    def test_window_rows(self):
+        chroms = SimpleAGA.chrom_offsets(pd.DataFrame({"name": ["chr1", "chr2", "chr3"], "size": [10, 3, 8], "n_bins": [10, 3, 8]}))
+        starts, chr_idxs, lengths = SimpleAGA.window_rows(chroms, 4, 3)
+        np.testing.assert_array_equal(starts, [0, 3, 6, 13, 16])
+        np.testing.assert_array_equal(chr_idxs, [0, 0, 0, 2, 2])
+        np.testing.assert_array_equal(lengths, 4)
+
+        starts, chr_idxs, lengths = SimpleAGA.window_rows(chroms, 4, 3, pad_last=True)
+        # chr1's windows already reach its end, chr2 is shorter than a window
+        np.testing.assert_array_equal(starts, [0, 3, 6, 10, 13, 16, 19])
+        np.testing.assert_array_equal(chr_idxs, [0, 0, 0, 1, 2, 2, 2])
+        np.testing.assert_array_equal(lengths, [4, 4, 4, 3, 4, 4, 2])
+
+    def test_getitem(self, tmp_path):
+        binned = write_binned(tmp_path / "binned")
+        dataset = SimpleAGA.BinnedWindows(tmp_path / "binned", 128, stride_bins=100, tracks=["b", "a"], pad_last=True, fill=-1.0)
+        windows = dataset.windows_frame()
+        assert(len(dataset) == len(windows.index))
+        # no window crosses a chromosome end
+        chr_sizes = dict(zip(binned.chroms["name"], binned.chroms["n_bins"]))
+        assert((windows["end"] <= windows["chrom"].map(chr_sizes)).all())
+        assert(set(windows["chrom"]) == set(chr_sizes))
+        for idx in [0, 5, len(dataset) - 1]:
+            window = dataset[idx]
+            row_start, length = window["row"], int(windows["end"].iat[idx] - windows["start"].iat[idx])
+            expected = np.asarray(binned.values[row_start:row_start + length][:, [1, 0]], dtype=np.float32)
+            assert(window["values"].shape == window["missing"].shape == (128, 2))
+            assert(window["values"].dtype == torch.float32)
+            np.testing.assert_array_equal(window["missing"][:length].numpy(), np.isnan(expected))
+            np.testing.assert_array_equal(window["values"][:length].numpy(), np.nan_to_num(expected, nan=-1.0))
+            # padding past the chromosome end is missing
+            assert(window["missing"][length:].all())
+        # the last window of chr3 is cut short at its end
+        assert(windows["end"].iat[-1] - windows["start"].iat[-1] < 128)
+
+        with pytest.raises(KeyError):
+            SimpleAGA.BinnedWindows(tmp_path / "binned", 128, tracks=["c"])
+
+    @pytest.mark.filterwarnings("ignore:This DataLoader will create")
+    @pytest.mark.parametrize("num_workers", [0, 2])
+    def test_loader(self, tmp_path, num_workers):
+        binned = write_binned(tmp_path / "binned")
+        dataset = SimpleAGA.BinnedWindows(tmp_path / "binned", 50)
+        # the memory map is opened lazily, and not sent along to workers
+        assert(dataset._values is None)
+        loader = SimpleAGA.windows_loader(dataset, batch_size=8, shuffle=True, num_workers=num_workers, seed=0)
+        rows = []
+        for batch in loader:
+            assert(batch["values"].shape[1:] == batch["missing"].shape[1:] == (50, 2))
+            for values, missing, row in zip(batch["values"], batch["missing"], batch["row"].tolist()):
+                np.testing.assert_array_equal(missing.numpy(), np.isnan(binned.values[row:row + 50]))
+                np.testing.assert_array_equal(values.numpy(), np.nan_to_num(binned.values[row:row + 50]).astype(np.float32))
+            rows.extend(batch["row"].tolist())
+        assert(sorted(rows) == list(range(0, binned.values.shape[0], 50)))
@@ -0,0 +1,88 @@
+'''
+Bounded bigWig handle pool test script using pytest
+'''
+
+import numpy as np
+import pandas as pd
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .context import SimpleAGA
+from .helpers import write_missing_tracks
+import pytest
+
+class TestBigWigPool:
+    def test_lru_cap(self, tmp_path):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 3, "test_handles")
+        metrics = SimpleAGA.Metrics(progress=False)
+        with SimpleAGA.BigWigPool(max_open=2, metrics=metrics) as pool:
+            for bw_path in bw_paths + bw_paths[:1]:
+                with pool.lease(bw_path) as bigwig:
+                    assert(bigwig.chroms() == dict(zip(chrom_sizes["name"], chrom_sizes["size"])))
+                assert(len(pool) <= 2)
+            # the first bigWig was closed to open the third, then reopened
+            assert(pool.n_opened == 4)
+            assert(list(pool.handles) == [str(bw_paths[2]), str(bw_paths[0])])
+            # reopening doesn't count a file's size again
+            assert(metrics.report()["counters"]["file_size_bytes"] == sum(bw_path.stat().st_size for bw_path in bw_paths))
+        assert(len(pool) == 0)
+
+        with pytest.raises(ValueError):
+            SimpleAGA.BigWigPool(max_open=0)
+
+    def test_exclusive_leases(self, tmp_path):
+        _, bw_paths = write_missing_tracks(tmp_path, 3, "test_handles")
+        pool = SimpleAGA.BigWigPool(max_open=1)
+        lock = threading.Lock()
+        using = set()
+        overlaps = []
+
+        def use(task_idx: int) -> None:
+            bw_path = bw_paths[task_idx % len(bw_paths)]
+            with pool.lease(bw_path) as bigwig:
+                with lock:
+                    overlaps.append(len(using))
+                    using.add(id(bigwig))
+                bigwig.intervals("chr1")
+                with lock:
+                    using.discard(id(bigwig))
+
+        with ThreadPoolExecutor(max_workers=4) as thr_pool:
+            list(thr_pool.map(use, range(24)))
+        # with one handle open at most, no two threads ever held one at once
+        assert(overlaps == [0] * 24)
+        assert(len(pool) == 1)
+        pool.close()
+
+    def test_validate_headers(self, tmp_path):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 2, "test_handles_validate")
+        chrom_table = SimpleAGA.chrom_table(chrom_sizes, 2)
+        SimpleAGA.validate_bigwig_headers(bw_paths, chrom_table, n_threads=2)
+
+        resized = chrom_table.copy()
+        resized.loc[0, "size"] += 1
+        with pytest.raises(ValueError, match="sizes of chr1"):
+            SimpleAGA.validate_bigwig_headers(bw_paths, resized)
+        extra = pd.concat([chrom_sizes[["name", "size"]], pd.DataFrame({"name": ["chrX"], "size": [10]})], ignore_index=True)
+        with pytest.raises(ValueError, match="2 of 2 bigWigs.*\n.*missing chrX"):
+            SimpleAGA.validate_bigwig_headers(bw_paths, extra)
+        with pytest.raises(ValueError):
+            SimpleAGA.BigWigsBinner(bw_paths, extra, 2)
+        # skipping validation defers the failure to binning
+        SimpleAGA.BigWigsBinner(bw_paths, extra, 2, validate=False).close()
+
+    @pytest.mark.parametrize("processes", [False, True])
+    def test_binner_max_open(self, tmp_path, processes):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 3, "test_handles_binner")
+        with SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes.copy(), 2) as binner:
+            binner.load_bin_all_bws()
+            expected = binner.binned_mat
+            assert(len(binner.handles) == 3)
+        assert(len(binner.handles) == 0)
+
+        with SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes.copy(), 2, processes=processes, n_workers=2, max_open=1) as binner:
+            binner.load_bin_all_bws()
+            np.testing.assert_array_equal(binner.binned_mat, expected)
+            assert(len(binner.handles) <= 1)
+            blocks = np.concatenate([block.values for block in binner.iter_blocks(5)])
+            np.testing.assert_array_equal(blocks, expected)
+            assert(len(binner.handles) == 1)
@@ -0,0 +1,119 @@
+'''
+HMM engine test script using pytest
+'''
+
+import numpy as np
+import itertools
+from .context import SimpleAGA
+import pytest
+
+def toy_model(track_weights=None) -> "SimpleAGA.GaussianHMM":
+    return SimpleAGA.GaussianHMM(
+        start_probs=[0.6, 0.3, 0.1],
+        trans_probs=[[0.8, 0.15, 0.05], [0.1, 0.7, 0.2], [0.25, 0.25, 0.5]],
+        means=[[0.0, 1.0], [2.0, -1.0], [4.0, 3.0]],
+        variances=[[1.0, 0.5], [0.5, 2.0], [1.5, 1.0]],
+        track_weights=track_weights,
+    )
+
+def brute_force(model, values: np.ndarray) -> tuple[float, np.ndarray, np.ndarray, float]:
+    '''
+    Log likelihood, posteriors, best path and its log probability,
+    by enumerating every state path
+    '''
+    log_b = np.zeros((len(values), model.n_states))
+    for t, k in itertools.product(range(len(values)), range(model.n_states)):
+        for d in range(model.n_tracks):
+            if not np.isnan(values[t, d]):
+                var = model.variances[k, d]
+                log_b[t, k] += model.track_weights[d] * (-0.5 * np.log(2 * np.pi * var) - (values[t, d] - model.means[k, d])**2 / (2 * var))
+
+    path_log_probs = {}
+    for path in itertools.product(range(model.n_states), repeat=len(values)):
+        log_prob = np.log(model.start_probs[path[0]]) + log_b[0, path[0]]
+        for t in range(1, len(values)):
+            log_prob += np.log(model.trans_probs[path[t - 1], path[t]]) + log_b[t, path[t]]
+        path_log_probs[path] = log_prob
+
+    log_likelihood = np.logaddexp.reduce(list(path_log_probs.values()))
+    posteriors = np.zeros((len(values), model.n_states))
+    for path, log_prob in path_log_probs.items():
+        posteriors[np.arange(len(values)), path] += np.exp(log_prob - log_likelihood)
+    best_path = max(path_log_probs, key=path_log_probs.get)
+    return log_likelihood, posteriors, np.array(best_path), path_log_probs[best_path]
+
+# bins missing one track, and one missing both
+TOY_VALUES = np.array([
+    [0.1, 0.9],
+    [2.2, np.nan],
+    [np.nan, np.nan],
+    [3.9, 2.5],
+    [np.nan, -1.2],
+    [0.3, 1.1],
+])
+
+class TestGaussianHMM:
+    @pytest.mark.parametrize("chunk_bins", [1, 2, 4, 100])
+    @pytest.mark.parametrize("track_weights", [None, [1.0, 0.5]])
+    def test_matches_brute_force(self, chunk_bins, track_weights):
+        model = toy_model(track_weights)
+        log_likelihood, posteriors, best_path, best_log_prob = brute_force(model, TOY_VALUES)
+
+        np.testing.assert_allclose(model.log_likelihood([TOY_VALUES], chunk_bins), log_likelihood)
+        np.testing.assert_allclose(model.posteriors(TOY_VALUES, chunk_bins), posteriors, atol=1e-12)
+        paths, log_probs = model.viterbi([TOY_VALUES], chunk_bins)
+        np.testing.assert_array_equal(paths[0], best_path)
+        np.testing.assert_allclose(log_probs[0], best_log_prob)
+
+    @pytest.mark.parametrize("chunk_bins", [2, 3, 100])
+    def test_batch_matches_separate(self, chunk_bins):
+        model = toy_model()
+        rng = np.random.default_rng(0)
+        seqs = [rng.normal(size=(n_bins, 2)) * 2 for n_bins in (5, 0, 11, 3)]
+        seqs[2][4:7, 0] = np.nan
+
+        batch_stats = model.e_step(seqs, chunk_bins)
+        separate_stats = SimpleAGA.merge_stats([model.e_step([seq], chunk_bins) for seq in seqs])
+        for batch_field, separate_field in zip(batch_stats, separate_stats):
+            np.testing.assert_allclose(batch_field, separate_field)
+
+        batch_paths, batch_log_probs = model.viterbi(seqs, chunk_bins)
+        for seq, batch_path, batch_log_prob in zip(seqs, batch_paths, batch_log_probs):
+            path, log_prob = model.viterbi([seq], chunk_bins)
+            np.testing.assert_array_equal(batch_path, path[0])
+            np.testing.assert_allclose(batch_log_prob, log_prob[0])
+
+    def test_e_step_stats(self):
+        model = toy_model()
+        _, posteriors, _, _ = brute_force(model, TOY_VALUES)
+        stats = model.e_step([TOY_VALUES], chunk_bins=4)
+
+        np.testing.assert_allclose(stats.start, posteriors[0])
+        # every transition's expected count sums to the number of transitions
+        np.testing.assert_allclose(stats.trans.sum(), len(TOY_VALUES) - 1)
+        np.testing.assert_allclose(stats.trans.sum(axis=1), posteriors[:-1].sum(axis=0))
+        observed = ~np.isnan(TOY_VALUES)
+        np.testing.assert_allclose(stats.weight, posteriors.T @ observed)
+        np.testing.assert_allclose(stats.value_sum, posteriors.T @ np.nan_to_num(TOY_VALUES))
+
+    def test_fit_recovers_states(self, tmp_path):
+        rng = np.random.default_rng(1)
+        true_means = np.array([[0.0, 0.0], [5.0, -5.0]])
+        states = np.repeat(rng.integers(0, 2, size=200), 25)
+        values = true_means[states] + rng.normal(size=(len(states), 2))
+        values[rng.random(values.shape) < 0.1] = np.nan
+        seqs = [values[:2000], values[2000:]]
+
+        model = SimpleAGA.GaussianHMM.from_data(values, 2, seed=0)
+        log_likelihoods = model.fit(seqs, n_iters=10, chunk_bins=500)
+        assert(all(np.diff(log_likelihoods) > -1e-6))
+        order = np.argsort(model.means[:, 0])
+        np.testing.assert_allclose(model.means[order], true_means, atol=0.1)
+
+        paths, _ = model.viterbi(seqs, chunk_bins=500)
+        assert(np.mean(np.argsort(order)[np.concatenate(paths)] == states) > 0.99)
+
+        model.save(tmp_path / "model.npz")
+        loaded = SimpleAGA.GaussianHMM.load(tmp_path / "model.npz")
+        np.testing.assert_array_equal(loaded.trans_probs, model.trans_probs)
+        np.testing.assert_array_equal(loaded.means, model.means)
@@ -0,0 +1,104 @@
+'''
+Incremental track manifest test script using pytest
+'''
+
+import numpy as np
+import pandas as pd
+import pyBigWig
+import runpy
+import sys
+from pathlib import Path
+from .context import SimpleAGA
+from .helpers import write_missing_tracks, write_test_bedGraph
+import pytest
+
+def assert_binned_equal(binned: SimpleAGA.BinnedTracks, expected: SimpleAGA.BinnedTracks) -> None:
+    np.testing.assert_array_equal(binned.values, expected.values)
+    assert(binned.values.flags.f_contiguous)
+    pd.testing.assert_frame_equal(binned.missing.to_frame(), expected.missing.to_frame())
+    assert(binned.missing.n_tracks == expected.missing.n_tracks)
+    for summary, expected_summary in zip(binned.summaries, expected.summaries, strict=True):
+        assert(summary.to_dict() == expected_summary.to_dict())
+
+class TestTrackManifest:
+    def test_npy_columns(self, tmp_path):
+        values = np.arange(24, dtype=np.float32).reshape(6, 4, order="F")
+        np.save(tmp_path / "values.npy", np.asfortranarray(values[:, :1]))
+        # past 9 and 99 columns, the header's shape grows a digit
+        for n_cols in range(2, 120):
+            assert(SimpleAGA.append_binned_columns(tmp_path / "values.npy", values[:, [(n_cols - 1) % 4]], chunk_bins=4) == (6, n_cols))
+        appended = np.load(tmp_path / "values.npy")
+        assert(appended.flags.f_contiguous)
+        np.testing.assert_array_equal(appended, values[:, np.arange(119) % 4])
+
+        assert(SimpleAGA.drop_binned_columns(tmp_path / "values.npy", [0, 5, 118], chunk_bins=4) == (6, 116))
+        np.testing.assert_array_equal(np.load(tmp_path / "values.npy"), values[:, np.delete(np.arange(119), [0, 5, 118]) % 4])
+        assert((tmp_path / "values.npy").stat().st_size == 128 + 6 * 116 * 4)
+
+        np.save(tmp_path / "c_order.npy", np.ascontiguousarray(values))
+        with pytest.raises(ValueError):
+            SimpleAGA.append_binned_columns(tmp_path / "c_order.npy", values)
+
+    @pytest.mark.parametrize("left_aligned", [False, True])
+    def test_append_replace_drop(self, tmp_path, left_aligned):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 4, f"test_manifest_{left_aligned}")
+        bg_path = tmp_path / "track_3.bedGraph"
+        bw = pyBigWig.open(str(bw_paths[3]))
+        write_test_bedGraph(pd.DataFrame([(chrom, start, end, value) for chrom in chrom_sizes["name"] for start, end, value in bw.intervals(chrom)], columns=["chrom_name", "start", "stop", "value"]), bg_path)
+        bw.close()
+
+        def bin_to(out_dir: Path, paths: list[Path]) -> SimpleAGA.BinnedTracks:
+            binner = SimpleAGA.BigWigsBinner(paths, chrom_sizes.copy(), 2, dtype=np.float32, out_dir=out_dir, left_aligned=left_aligned)
+            binner.load_bin_all_bws()
+            binner.save(out_dir)
+            del binner
+            return SimpleAGA.BinnedTracks.load(out_dir)
+        expected = bin_to(tmp_path / "all", bw_paths)
+        bin_to(tmp_path / "edited", [bw_paths[0], bw_paths[2]])
+        assert(SimpleAGA.BinnedTracks.load(tmp_path / "edited").left_aligned == left_aligned)
+
+        # appending a bigWig and a bedGraph of the same signal as the 4th bigWig
+        manifest = SimpleAGA.TrackManifest(tmp_path / "edited")
+        manifest.append(["track_1", "track_3"], [bw_paths[1], bg_path])
+        edited = SimpleAGA.BinnedTracks.load(tmp_path / "edited")
+        assert(list(edited.tracks["name"]) == [bw_paths[0].stem, bw_paths[2].stem, "track_1", "track_3"])
+        np.testing.assert_array_equal(edited.values, expected.values[:, [0, 2, 1, 3]])
+        pd.testing.assert_frame_equal(edited.missing.to_frame(), SimpleAGA.MissingIndex.from_matrix(edited.values, edited.chroms).to_frame())
+        with pytest.raises(ValueError):
+            manifest.append(["track_1"], [bw_paths[1]])
+
+        # dropping and replacing tracks gets back to binning them all at once
+        manifest.drop([bw_paths[2].stem, "track_3"])
+        manifest.replace(bw_paths[0].stem, bw_paths[3])
+        manifest.append(["track_2", "track_0"], [bw_paths[2], bw_paths[0]])
+        edited = SimpleAGA.BinnedTracks.load(tmp_path / "edited")
+        assert(list(edited.tracks["path"]) == [str(bw_paths[idx]) for idx in (3, 1, 2, 0)])
+        reordered = SimpleAGA.BinnedTracks(
+            np.asfortranarray(expected.values[:, [3, 1, 2, 0]]), expected.chroms, expected.tracks, expected.bin_size,
+            expected.missing.drop_tracks([0, 2]).append_tracks(expected.missing.drop_tracks([0, 1, 3])).append_tracks(expected.missing.drop_tracks([1, 2, 3])).replace_track(0, expected.missing.drop_tracks([0, 1, 2])),
+            [expected.summaries[idx] for idx in (3, 1, 2, 0)],
+        )
+        assert_binned_equal(edited, reordered)
+        with pytest.raises(KeyError):
+            manifest.drop(["track_3"])
+
+    @pytest.mark.filterwarnings("ignore:.*found in sys.modules")
+    def test_cli(self, tmp_path, monkeypatch, capsys):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 2, "test_manifest_cli")
+        binner = SimpleAGA.BigWigsBinner(bw_paths[:1], chrom_sizes.copy(), 2)
+        binner.load_bin_all_bws()
+        binner.save(tmp_path)
+        del binner
+
+        def run(*args) -> str:
+            monkeypatch.setattr(sys, "argv", ["manifest.py", str(tmp_path), *args])
+            capsys.readouterr()
+            runpy.run_module("SimpleAGA.manifest", run_name="__main__")
+            return capsys.readouterr().out
+        run("append", "--track", "second", str(bw_paths[1].absolute()))
+        assert("second" in run("list"))
+        run("drop", bw_paths[0].stem)
+        binned = SimpleAGA.BinnedTracks.load(tmp_path)
+        assert(list(binned.tracks["name"]) == ["second"])
+        assert(binned.values.shape == (11, 1))
+        np.testing.assert_array_equal(binned.chrom_values("chr2")[:, 0], [1.5, 3.5])
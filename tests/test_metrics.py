@@ -0,0 +1,63 @@
+'''
+Binning run instrumentation test script using pytest
+'''
+
+import numpy as np
+import json
+from .context import SimpleAGA
+from .helpers import write_missing_tracks
+import pytest
+
+class TestMetrics:
+    @pytest.mark.parametrize("processes,left_aligned", [(False, False), (True, False), (False, True)])
+    def test_binner_metrics(self, tmp_path, processes, left_aligned):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 2, f"test_metrics_{processes}_{left_aligned}")
+        metrics = SimpleAGA.Metrics(progress=False)
+
+        BIN_SIZE = 2
+        bw_binner = SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes.copy(), BIN_SIZE, processes=processes, n_workers=2, left_aligned=left_aligned, metrics=metrics)
+        bw_binner.load_bin_all_bws()
+        report = metrics.report()
+
+        # one task per (bigWig, chromosome), each timed with its phases
+        assert(report["tasks"] == {"done": 6, "total": 6})
+        assert(report["phases"]["task"]["n"] == 6)
+        assert(report["phases"]["stats"]["n"] == 6 and report["phases"]["write"]["n"] == 6)
+        assert(report["phases"]["nan_scan"]["n"] == 1)
+        assert(report["phases"]["open"]["n"] >= 2)
+        assert(set(report["chrom_s"]) == {"chr1", "chr2", "chr3"})
+        assert(set(report["track_s"]) == {path.stem for path in bw_paths})
+        assert(report["counters"]["bins"] == 2 * int(bw_binner.chrom_sizes["n_bins"].sum()))
+        if left_aligned:
+            # one interval per base pair, NaN valued ones included
+            assert(report["counters"]["intervals"] == 2 * int(chrom_sizes["size"].sum()))
+        assert(0 < report["workers"]["utilization"])
+        assert(report["memory"]["peak_rss_mb"] > 0)
+
+        metrics_path = tmp_path / "metrics.json"
+        metrics.save(metrics_path)
+        saved = json.loads(metrics_path.read_text())
+        assert(len(saved["records"]) == len(metrics.records))
+        assert(saved["counters"] == report["counters"])
+
+    def test_bedGraph_metrics(self, tmp_path):
+        chrom_sizes = {"chr1": 10, "chr2": 4}
+        bg_path = tmp_path / "test_metrics.bedGraph"
+        bg_path.write_text("track type=bedGraph\nchr1\t0\t5\t1.0\nchr1\t5\t10\t2.0\nchr2\t0\t4\t3.0\n")
+        metrics = SimpleAGA.Metrics(progress=False)
+
+        bg_binner = SimpleAGA.BedGraphsBinner([bg_path], chrom_sizes, 5, chunk_lines=2, metrics=metrics)
+        bg_binner.load_bin_all_bgs()
+        report = metrics.report()
+        assert(report["tasks"] == {"done": 1, "total": 1})
+        # 2 chunks, plus the read finding there are no more
+        assert(report["phases"]["read"]["n"] == 3)
+        assert(report["counters"]["intervals"] == 3)
+        assert(report["counters"]["file_size_bytes"] == bg_path.stat().st_size)
+
+    def test_disabled_records_nothing(self, tmp_path):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 1, "test_metrics_disabled")
+        bw_binner = SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes.copy(), 2)
+        bw_binner.load_bin_all_bws()
+        assert(bw_binner.metrics is SimpleAGA.NULL_METRICS)
+        assert(not SimpleAGA.NULL_METRICS.records and not SimpleAGA.NULL_METRICS.counters)
@@ -0,0 +1,78 @@
+'''
+Missing bins index test script using pytest
+'''
+
+import numpy as np
+import pandas as pd
+from .context import SimpleAGA
+from SimpleAGA.missing import MissingIndex
+from SimpleAGA.binned import chrom_offsets
+
+def make_chroms() -> pd.DataFrame:
+    return chrom_offsets(pd.DataFrame({
+        "name": ["chr1", "chr2", "chr3"],
+        "size": [10, 4, 7],
+        "n_bins": [5, 2, 4],
+    }))
+
+def make_values() -> np.ndarray:
+    '''
+    # `-` denotes missing
+    track 0:
+    chr1: - 0.5 2.5 - 0.5
+    chr2: 0.5 2.5
+    chr3: - - 0.5 -
+    track 1:
+    chr1: 1 1 1 1 -
+    chr2: - -
+    chr3: 1 1 1 1
+    '''
+    nan = np.nan
+    return np.asfortranarray([
+        [nan, 1], [0.5, 1], [2.5, 1], [nan, 1], [0.5, nan],
+        [0.5, nan], [2.5, nan],
+        [nan, 1], [nan, 1], [0.5, 1], [nan, 1],
+    ])
+
+class TestMissingIndex:
+    def test_find_nan_runs_2d(self):
+        values = make_values()
+        cols, starts, ends = SimpleAGA.find_nan_runs(values, breaks=make_chroms()["row_start"])
+        # track 1's run over the end of chr1 into chr2 is split in two
+        assert(list(cols) == [0, 0, 0, 0, 1, 1])
+        assert(list(starts) == [0, 3, 7, 10, 4, 5])
+        assert(list(ends) == [0, 3, 8, 10, 4, 6])
+
+        # columns one by one match the 1D version
+        starts_1d, ends_1d = SimpleAGA.find_nan_runs(values[:, 0])
+        assert(list(starts_1d) == [0, 3, 7, 10] and list(ends_1d) == [0, 3, 8, 10])
+
+    def test_from_matrix(self):
+        missing = MissingIndex.from_matrix(make_values(), make_chroms(), block_tracks=1)
+        assert(missing.track.dtype == np.int32 and missing.start.dtype == np.int32)
+        missings_tbl = missing.to_frame()
+        assert(list(missings_tbl["bigwig"]) == [0, 0, 0, 0, 1, 1])
+        assert(list(missings_tbl["chrom"]) == ["chr1", "chr1", "chr3", "chr3", "chr1", "chr2"])
+        assert(list(missings_tbl["start"]) == [0, 3, 0, 3, 4, 0])
+        assert(list(missings_tbl["end"]) == [0, 3, 1, 3, 4, 1])
+
+    def test_queries(self):
+        missing = MissingIndex.from_matrix(make_values(), make_chroms())
+
+        assert(missing.is_observed("chr1", 1, 2))
+        assert(not missing.is_observed("chr1", 1, 3))
+        assert(list(missing.is_observed("chr1", [0, 1, 2, 4], [0, 2, 2, 4])) == [False, True, True, False])
+        assert(missing.is_observed("chr2", 0, 1, tracks=[0]))
+        assert(not missing.is_observed("chr2", 0, 1))
+
+        np.testing.assert_allclose(missing.missing_fraction(), [5 / 11, 3 / 11])
+        np.testing.assert_array_equal(missing.missing_mask("chr1"), np.isnan(make_values()[0:5]))
+        np.testing.assert_array_equal(missing.missing_mask("chr3", 1, 3), np.isnan(make_values()[8:10]))
+
+    def test_save_load(self, tmp_path):
+        missing = MissingIndex.from_matrix(make_values(), make_chroms())
+        missing.save(tmp_path / "missing.npz")
+        loaded = MissingIndex.load(tmp_path / "missing.npz")
+        pd.testing.assert_frame_equal(loaded.to_frame(), missing.to_frame())
+        assert(loaded.chrom_names == ["chr1", "chr2", "chr3"])
+        assert(loaded.n_tracks == 2)
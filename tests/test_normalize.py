@@ -0,0 +1,108 @@
+'''
+Track summaries and normalization test script using pytest
+'''
+
+import numpy as np
+import pandas as pd
+from .context import SimpleAGA
+from .helpers import write_binned, write_missing_tracks
+import pytest
+
+class TestNormalize:
+    def test_quantile_sketch(self):
+        rng = np.random.default_rng(0)
+        chunks = [rng.lognormal(size=rng.integers(1, 20_000)) for _ in range(30)]
+        sketches = [SimpleAGA.QuantileSketch(512).update(chunk) for chunk in chunks]
+        streamed = SimpleAGA.QuantileSketch(512)
+        for chunk in chunks:
+            streamed.update(np.append(chunk, np.nan))
+        merged = SimpleAGA.QuantileSketch(512)
+        for sketch in sketches:
+            merged.merge(sketch)
+
+        all_values = np.concatenate(chunks)
+        levels = np.linspace(0.01, 0.99, 21)
+        for sketch in (streamed, merged):
+            assert(len(sketch.values) <= 512 and sketch.count == len(all_values))
+            # off by under ~1% in rank
+            ranks = np.searchsorted(np.sort(all_values), sketch.quantile(levels)) / len(all_values)
+            np.testing.assert_allclose(ranks, levels, atol=0.01)
+
+    def test_track_summary(self):
+        rng = np.random.default_rng(1)
+        values = rng.normal(3, 2, size=10_000)
+        values[rng.random(len(values)) < 0.1] = np.nan
+        summary = SimpleAGA.TrackSummary().update(values[:4000]).merge(SimpleAGA.TrackSummary().update(values[4000:]))
+        observed = values[~np.isnan(values)]
+        assert(summary.count == len(observed))
+        np.testing.assert_allclose([summary.mean, summary.std, summary.min, summary.max], [observed.mean(), observed.std(), observed.min(), observed.max()])
+        np.testing.assert_allclose(summary.quantile(0.5), np.median(observed), atol=0.05)
+        assert(SimpleAGA.TrackSummary.from_dict(summary.to_dict()).to_dict() == summary.to_dict())
+
+    @pytest.mark.parametrize("processes", [False, True])
+    def test_binner_summaries(self, tmp_path, processes):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 2, f"test_summaries_{processes}")
+        out_dir = tmp_path / "binned"
+        bw_binner = SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes, 2, processes=processes, n_workers=2, out_dir=out_dir)
+        bw_binner.load_bin_all_bws()
+        bw_binner.save(out_dir)
+
+        binned = SimpleAGA.BinnedTracks.load(out_dir)
+        for bw_idx, summary in enumerate(binned.summaries):
+            observed = binned.values[~np.isnan(binned.values[:, bw_idx]), bw_idx]
+            assert(summary.count == len(observed))
+            np.testing.assert_allclose([summary.total, summary.sumsq, summary.min, summary.max], [observed.sum(), (observed ** 2).sum(), observed.min(), observed.max()])
+
+    def test_normalize_in_place(self, tmp_path):
+        rng = np.random.default_rng(2)
+        values = np.lib.format.open_memmap(tmp_path / "values.npy", mode="w+", dtype=np.float64, shape=(5000, 3), fortran_order=True)
+        values[:, 0] = rng.gamma(2, 1, size=5000)
+        values[:, 1] = 10 * rng.gamma(2, 1, size=5000)
+        values[:, 2] = rng.normal(size=5000)
+        values[::7, 1] = np.nan
+        missing = np.isnan(values)
+        raw = np.array(values)
+        summaries = SimpleAGA.summarize_values(values, chunk_bins=777)
+
+        # quantile normalizing the first two tracks, chunk by chunk, leaves the third alone
+        new_summaries = SimpleAGA.normalize_binned(values, summaries, "quantile", tracks=[0, 1], chunk_bins=777)
+        np.testing.assert_array_equal(np.isnan(values), missing)
+        np.testing.assert_array_equal(values[:, 2], raw[:, 2])
+        assert(new_summaries[2] is summaries[2])
+        levels = np.linspace(0.05, 0.95, 10)
+        np.testing.assert_allclose(np.nanquantile(values[:, 0], levels), np.nanquantile(values[:, 1], levels), rtol=0.05)
+        # the ranks within each track don't change
+        np.testing.assert_array_equal(np.argsort(values[:, 0]), np.argsort(raw[:, 0]))
+
+        assert(new_summaries[0].normalizations == ["quantile"] and new_summaries[2].normalizations == [])
+        # normalizing again has to be forced, and is recorded after the first
+        with pytest.raises(ValueError):
+            SimpleAGA.normalize_binned(values, new_summaries, "zscore", chunk_bins=777)
+        np.testing.assert_array_equal(values[:, 2], raw[:, 2])
+        new_summaries = SimpleAGA.normalize_binned(values, new_summaries, "zscore", chunk_bins=777, force=True)
+        assert([summary.normalizations for summary in new_summaries] == [["quantile", "zscore"]] * 2 + [["zscore"]])
+        reloaded = np.load(tmp_path / "values.npy")
+        np.testing.assert_allclose(np.nanmean(reloaded, axis=0), 0, atol=1e-9)
+        np.testing.assert_allclose(np.nanstd(reloaded, axis=0), 1)
+        np.testing.assert_allclose([summary.mean for summary in new_summaries], 0, atol=1e-9)
+
+        SimpleAGA.normalize_binned(values, new_summaries, "asinh", tracks=[2], force=True)
+        np.testing.assert_allclose(values[:, 2], np.arcsinh(reloaded[:, 2]))
+        with pytest.raises(ValueError):
+            SimpleAGA.normalize_binned(values, new_summaries, "log")
+
+    def test_cli_records(self, tmp_path):
+        binned = write_binned(tmp_path / "binned")
+        SimpleAGA.save_summaries(tmp_path / "binned" / SimpleAGA.SUMMARY_FILE, SimpleAGA.summarize_values(binned.values))
+        raw = np.array(binned.values)
+        SimpleAGA.cli.main(["normalize", str(tmp_path / "binned"), "asinh", "--tracks", "a"])
+        summaries = SimpleAGA.BinnedTracks.load(tmp_path / "binned").summaries
+        assert([summary.normalizations for summary in summaries] == [["asinh"], []])
+
+        # the saved record stops it being applied twice
+        with pytest.raises(ValueError):
+            SimpleAGA.cli.main(["normalize", str(tmp_path / "binned"), "asinh"])
+        np.testing.assert_allclose(SimpleAGA.BinnedTracks.load(tmp_path / "binned").values, np.arcsinh(raw) * [1, 0] + raw * [0, 1])
+        SimpleAGA.cli.main(["normalize", str(tmp_path / "binned"), "asinh", "--force"])
+        summaries = SimpleAGA.BinnedTracks.load(tmp_path / "binned").summaries
+        assert([summary.normalizations for summary in summaries] == [["asinh", "asinh"], ["asinh"]])
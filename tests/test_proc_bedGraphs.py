@@ -0,0 +1,101 @@
+'''
+bedGraph binning test script using pytest
+'''
+
+import numpy as np
+import pandas as pd
+from .context import SimpleAGA
+from .helpers import write_test_bigWig, write_test_bedGraph
+import pytest
+
+class TestBedGraphsBinner:
+    @pytest.mark.parametrize("chunk_lines", [3, 1000])
+    def test_matches_bigWig(self, tmp_path, chunk_lines):
+        chrom_sizes = pd.DataFrame([
+            ("chr1", 10),
+            ("chr2", 4),
+            ("chr3", 7)], columns=["name", "size"])
+        '''
+        # `-` denotes missing, `.` no interval
+        chr1: 0 - 0 1 2 3 . . 0 1   as one interval per base, and [5, 6) run as [4, 6)
+        chr2: 5 5 5 5               as one interval
+        chr3: . 0 - 0 1 2 .
+        '''
+        chrom_sig_vals = pd.DataFrame({
+            "chrom_name": ["chr1"] * 7 + ["chr2"] + ["chr3"] * 5,
+            "start": [0, 1, 2, 3, 4, 8, 9, 0, 1, 2, 3, 4, 5],
+            "stop": [1, 2, 3, 4, 6, 9, 10, 4, 2, 3, 4, 5, 6],
+            "value": [0, np.nan, 0, 1, 2, 0, 1, 5, 0, np.nan, 0, 1, 2],
+        })
+        bw_path = tmp_path / "test.bw"
+        write_test_bigWig(chrom_sizes, chrom_sig_vals, bw_path, tmp_path / "test.chrom.sizes")
+        bg_path = tmp_path / "test.bedGraph"
+        # plus a chromosome that is not binned
+        write_test_bedGraph(pd.concat([chrom_sig_vals, pd.DataFrame({"chrom_name": ["chrUn"], "start": [0], "stop": [5], "value": [1.0]})]), bg_path)
+
+        BIN_SIZE = 2
+        bw_binner = SimpleAGA.BigWigsBinner([bw_path], chrom_sizes.copy(), BIN_SIZE)
+        bw_binner.load_bin_all_bws()
+        bg_binner = SimpleAGA.BedGraphsBinner([bg_path, bg_path], chrom_sizes.copy(), BIN_SIZE, chunk_lines=chunk_lines)
+        binned_mat = bg_binner.load_bin_all_bgs()
+
+        assert(binned_mat.shape == (11, 2))
+        np.testing.assert_allclose(binned_mat[:, 0], bw_binner.binned_mat[:, 0])
+        np.testing.assert_array_equal(binned_mat[:, 1], binned_mat[:, 0])
+        assert(list(bg_binner.missing_bins["start"]) == list(bw_binner.missing_bins["start"]) * 2)
+
+    def test_save_load(self, tmp_path):
+        chrom_sizes = {"chr1": 10, "chr2": 4}
+        chrom_sig_vals = pd.DataFrame({
+            "chrom_name": ["chr1", "chr2"],
+            "start": [2, 0],
+            "stop": [7, 4],
+            "value": [1.5, 2.0],
+        })
+        bg_path = tmp_path / "test_save.bedGraph"
+        write_test_bedGraph(chrom_sig_vals, bg_path)
+
+        out_dir = tmp_path / "binned"
+        bg_binner = SimpleAGA.BedGraphsBinner([bg_path, bg_path, bg_path], chrom_sizes, 5, n_workers=2, dtype=np.float32, out_dir=out_dir)
+        bg_binner.load_bin_all_bgs()
+        bg_binner.save(out_dir)
+
+        binned = SimpleAGA.BinnedTracks.load(out_dir)
+        assert(binned.values.dtype == np.float32)
+        np.testing.assert_array_equal(binned.chrom_values("chr1")[:, 0], [1.5, 1.5])
+        np.testing.assert_array_equal(binned.chrom_values("chr2")[:, 0], [2.0])
+        assert(list(binned.tracks["name"]) == ["test_save"] * 3)
+        assert(len(binned.missing) == 0)
+        # summaries saved alongside, as the bigWig binner's
+        assert(len(binned.summaries) == 3)
+        assert(binned.summaries[0].count == 3 and binned.summaries[0].max == 2.0)
+
+    @pytest.mark.parametrize("raises_empty", [False, True])
+    def test_empty(self, tmp_path, monkeypatch, raises_empty):
+        if raises_empty:
+            # pandas versions that raise on files without data lines, rather than reading no rows
+            read_csv = pd.read_csv
+            def read_csv_raising(path, *args, **kwargs):
+                if not read_csv(path, *args, **{**kwargs, "chunksize": None}).size:
+                    raise pd.errors.EmptyDataError("No columns to parse from file")
+                return read_csv(path, *args, **kwargs)
+            monkeypatch.setattr(pd, "read_csv", read_csv_raising)
+        chrom_sizes = {"chr1": 10, "chr2": 4}
+        bg_path = tmp_path / "test_empty.bedGraph"
+        write_test_bedGraph(pd.DataFrame({"chrom_name": ["chr1"], "start": [0], "stop": [10], "value": [1.0]}), bg_path)
+        # a header-only and an empty bedGraph bin to missing columns
+        header_path = tmp_path / "test_header_only.bedGraph"
+        write_test_bedGraph(pd.DataFrame(columns=["chrom_name", "start", "stop", "value"]), header_path)
+        empty_path = tmp_path / "test_no_lines.bedGraph"
+        empty_path.touch()
+
+        out_dir = tmp_path / "binned"
+        bg_binner = SimpleAGA.BedGraphsBinner([bg_path, header_path, empty_path], chrom_sizes, 5, out_dir=out_dir)
+        binned_mat = bg_binner.load_bin_all_bgs()
+        np.testing.assert_array_equal(binned_mat[:, 0], [1.0, 1.0, np.nan])
+        assert(np.isnan(binned_mat[:, 1:]).all())
+        bg_binner.save(out_dir)
+
+        binned = SimpleAGA.BinnedTracks.load(out_dir)
+        np.testing.assert_array_equal(binned.missing.missing_fraction(), [1 / 3, 1, 1])
+        assert([summary.count for summary in binned.summaries] == [2, 0, 0])
@@ -12,50 +12,14 @@ import threading
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import itertools
 import sys
+from typing import Union, Iterable
 from pathlib import Path
 from .context import SimpleAGA
+from .helpers import write_test_bigWig, write_missing_tracks
 import pytest
 
-def write_test_bigWig(chrom_sizes: pd.DataFrame, chrom_sig_vals: pd.DataFrame, bw_path: Path, chrom_sizes_path: Path) -> None:
-    '''
-    Writes a test bigWig file to bw_path, using
-        - the chromosome sizes in `chrom_sizes_path`, and
-        - the signal values in `chrom_sig_vals`.
-    Format of `chrom_sizes`:
-        columns: name <str>, size <int>, one row per chromosome
-    Format of `chrom_sig_vals`: each row represents a signal value,
-        which chromosome is included in a column
-        columns: chrom_name <str>, start <int>, stop <int>, value <float>
-    '''
-
-    # TODO: Support arbitrary intervals (i.e. start and stop positions)
-    # per value in chromosomes. Switch `chrom_sig_vals` to a single
-    # signal values DataFrame, with columns: chrom, start, stop, value
-
-    bw = pyBigWig.open(str(bw_path), "w")
-    row_tuples = chrom_sizes.itertuples(index=False, name=None)
-    bw.addHeader(list(row_tuples))
-
-    # TODO? count and report # unmapped bases for debugging
-
-    grouped_sigs = chrom_sig_vals.groupby("chrom_name")
-    for chr_name, chr_group in grouped_sigs:
-        print(f"Writing {chr_name}...")
-        print(chr_group)
-
-        df_cols_dict = chr_group.to_dict(orient="list")
-        bw.addEntries((df_cols_dict["chrom_name"]), (df_cols_dict["start"]), ends=(df_cols_dict["stop"]), values=(df_cols_dict["value"]))
-    bw.close()
-
-    chrom_sizes.to_csv(chrom_sizes_path, sep='\t', index=False, header=False)
-
 class TestBinner:
-    TEST_DATA_DIR = Path(".") / "test_data"
-
-    def test_setup(self):
-        self.TEST_DATA_DIR.mkdir(exist_ok=True)
-
-    def test_mono_alt0_1(self):
+    def test_mono_alt0_1(self, tmp_path):
         chrom_sizes = pd.DataFrame([
             ("chr1", 10),
             ("chr2", 4),
@@ -80,7 +44,7 @@ class TestBinner:
             "value": list(itertools.chain.from_iterable(sig_vals))
         })
 
-        write_test_bigWig(chrom_sizes, chrom_sig_vals, self.TEST_DATA_DIR / "test_mono_alt0_1.bw", self.TEST_DATA_DIR / "test_mono_alt0_1.chrom.sizes")
+        write_test_bigWig(chrom_sizes, chrom_sig_vals, tmp_path / "test_mono_alt0_1.bw", tmp_path / "test_mono_alt0_1.chrom.sizes")
 
         BIN_SIZE = 2 
         '''
@@ -91,7 +55,7 @@ class TestBinner:
         # leaving remainders at __beginning__
         chr3: 0 0.5 0.5 0.5
         '''
-        bw_binner = SimpleAGA.BigWigsBinner([self.TEST_DATA_DIR / "test1.bw"], chrom_sizes, BIN_SIZE)
+        bw_binner = SimpleAGA.BigWigsBinner([tmp_path / "test_mono_alt0_1.bw"], chrom_sizes, BIN_SIZE)
         binned_vals = bw_binner.load_bin_all_bws()
 
         assert(len(binned_vals) == 1)
@@ -107,7 +71,7 @@ class TestBinner:
         assert((binned_vals[0][2][1:] == 0.5).all() == True)
         assert(binned_vals[0][2][0] == 0)
 
-    def test_sequential_missing(self):
+    def test_sequential_missing(self, tmp_path):
         chrom_sizes = pd.DataFrame([
             ("chr1", 10),
             ("chr2", 4),
@@ -133,7 +97,7 @@ class TestBinner:
             "value": list(itertools.chain.from_iterable(sig_vals))
         })
 
-        write_test_bigWig(chrom_sizes, chrom_sig_vals, self.TEST_DATA_DIR / "test_sequential_missing.bw", self.TEST_DATA_DIR / "test_sequential_missing.chrom.sizes")
+        write_test_bigWig(chrom_sizes, chrom_sig_vals, tmp_path / "test_sequential_missing.bw", tmp_path / "test_sequential_missing.chrom.sizes")
 
         BIN_SIZE = 2 
         '''
@@ -144,7 +108,7 @@ class TestBinner:
         # leaving remainders at __beginning__
         chr3: - - 0.5 -
         '''
-        bw_binner = SimpleAGA.BigWigsBinner([self.TEST_DATA_DIR / "test_sequential_missing.bw"], chrom_sizes, BIN_SIZE)
+        bw_binner = SimpleAGA.BigWigsBinner([tmp_path / "test_sequential_missing.bw"], chrom_sizes, BIN_SIZE)
         binned_vals = bw_binner.load_bin_all_bws()
 
         assert(len(binned_vals) == 1)
@@ -166,6 +130,229 @@ class TestBinner:
         print("Missing singal values:")
         print(missings_tbl)
 
+    def test_processes_match_threads(self, tmp_path):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 2, "test_processes")
+
+        BIN_SIZE = 2
+        thr_binner = SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes.copy(), BIN_SIZE)
+        thr_binned = thr_binner.load_bin_all_bws()
+        proc_binner = SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes.copy(), BIN_SIZE, processes=True, n_workers=2)
+        proc_binned = proc_binner.load_bin_all_bws()
+
+        assert(len(proc_binned) == 2)
+        for bw_idx in range(2):
+            assert(len(proc_binned[bw_idx]) == 3)
+            for chr_idx in range(3):
+                np.testing.assert_array_equal(proc_binned[bw_idx][chr_idx], thr_binned[bw_idx][chr_idx])
+
+        thr_missings = pd.DataFrame(thr_binner.missing_bins).sort_values(["bigwig", "chrom", "start"], ignore_index=True)
+        proc_missings = pd.DataFrame(proc_binner.missing_bins).sort_values(["bigwig", "chrom", "start"], ignore_index=True)
+        pd.testing.assert_frame_equal(proc_missings, thr_missings)
+
+    @pytest.mark.parametrize("processes", [False, True])
+    def test_save_load_matrix(self, tmp_path, processes):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 2, "test_matrix")
+
+        BIN_SIZE = 2
+        out_dir = tmp_path / "binned"
+        bw_binner = SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes, BIN_SIZE, processes=processes, n_workers=2, dtype=np.float32, out_dir=out_dir)
+        binned_vals = bw_binner.load_bin_all_bws()
+        bw_binner.save(out_dir)
+
+        binned = SimpleAGA.BinnedTracks.load(out_dir)
+        assert(isinstance(binned.values, np.memmap))
+        assert(binned.values.shape == (5 + 2 + 4, 2))
+        assert(binned.values.dtype == np.float32)
+        assert(binned.bin_size == BIN_SIZE)
+        assert(list(binned.chroms["row_start"]) == [0, 5, 7])
+        assert(list(binned.chroms["row_end"]) == [5, 7, 11])
+        assert(list(binned.tracks["name"]) == ["test_matrix_0", "test_matrix_1"])
+        for bw_idx in range(2):
+            for chr_idx, chr_name in enumerate(binned.chroms["name"]):
+                np.testing.assert_array_equal(binned.chrom_values(chr_name)[:, bw_idx], binned_vals[bw_idx][chr_idx])
+        # chr2: 0.5 2.5, plus 1 in the 2nd track
+        np.testing.assert_array_equal(binned.chrom_values("chr2"), [[0.5, 1.5], [2.5, 3.5]])
+
+        pd.testing.assert_frame_equal(binned.missing.to_frame(), bw_binner.missing_bins)
+
+        binned_tensor = binned.as_tensor()
+        assert(binned_tensor.shape == (11, 2))
+        assert(binned_tensor.data_ptr() == binned.values.ctypes.data)
+
+    @pytest.mark.parametrize("prefetch", [0, 2])
+    def test_iter_blocks(self, tmp_path, prefetch):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 2, "test_blocks")
+
+        BIN_SIZE = 2
+        bw_binner = SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes, BIN_SIZE)
+        blocks = list(bw_binner.iter_blocks(block_bins=3, prefetch=prefetch))
+        # chr1: 3 + 2 bins, chr2: 2 bins, chr3: 3 + 1 bins
+        assert([(block.chrom, block.start, block.end) for block in blocks] == [
+            ("chr1", 0, 3), ("chr1", 3, 5), ("chr2", 0, 2), ("chr3", 0, 3), ("chr3", 3, 4)
+        ])
+        assert([block.row_start for block in blocks] == [0, 3, 5, 7, 10])
+        # pyBigWig's bins of chr3: [0, 1), [1, 3), [3, 5), [5, 7)
+        np.testing.assert_array_equal(blocks[3].bp_edges, [0, 1, 3, 5])
+        np.testing.assert_array_equal(blocks[4].bp_edges, [5, 7])
+
+        # same bins as binning everything at once
+        bw_binner.load_bin_all_bws()
+        streamed = np.concatenate([block.values for block in blocks])
+        np.testing.assert_allclose(streamed, bw_binner.binned_mat)
+        np.testing.assert_array_equal(np.concatenate([block.missing for block in blocks]), np.isnan(bw_binner.binned_mat))
+
+    def test_blocks_match_zoomed(self, tmp_path):
+        # enough intervals for pyBigWig to write zoom levels, which `bigwig.stats` may answer from
+        rng = np.random.default_rng(0)
+        chrom_sizes = pd.DataFrame([("chr1", 2_000_003), ("chr2", 1_000_001)], columns=["name", "size"])
+        chrom_sig_vals = []
+        for chr_name, chr_size in chrom_sizes.itertuples(index=False, name=None):
+            bounds = np.unique(rng.integers(0, chr_size, 60_000))
+            starts, stops = bounds[:-1], bounds[1:]
+            keep = rng.random(len(starts)) < 0.8
+            chrom_sig_vals.append(pd.DataFrame({
+                "chrom_name": chr_name,
+                "start": starts[keep], "stop": stops[keep],
+                "value": rng.gamma(2.0, 1.5, keep.sum()),
+            }))
+        bw_path = tmp_path / "zoomed.bw"
+        write_test_bigWig(chrom_sizes, pd.concat(chrom_sig_vals, ignore_index=True), bw_path, tmp_path / "zoomed.chrom.sizes")
+        with open(bw_path, "rb") as bw_file:
+            n_zooms = int.from_bytes(bw_file.read(8)[6:8], "little")
+        assert(n_zooms > 0)
+
+        BIN_SIZE = 1000
+        with SimpleAGA.BigWigsBinner([bw_path], chrom_sizes, BIN_SIZE) as bw_binner:
+            bw_binner.load_bin_all_bws()
+            streamed = np.concatenate([block.values for block in bw_binner.iter_blocks(block_bins=700)])
+            np.testing.assert_array_equal(streamed, bw_binner.binned_mat)
+
+            # both the exact coverage weighted means, however the file is zoomed
+            for chr_idx, chr_vals in enumerate(chrom_sig_vals):
+                bp_vals = np.full(int(chrom_sizes["size"].iat[chr_idx]), np.nan)
+                for start, stop, value in chr_vals[["start", "stop", "value"]].itertuples(index=False, name=None):
+                    bp_vals[start:stop] = value
+                bp_edges = bw_binner.bin_edges(chr_idx)
+                covered = np.add.reduceat(~np.isnan(bp_vals), bp_edges[:-1])
+                sums = np.add.reduceat(np.nan_to_num(bp_vals), bp_edges[:-1])
+                with np.errstate(invalid="ignore"):
+                    expected = np.where(covered > 0, sums / covered, np.nan)
+                row_start, row_end = bw_binner.chrom_sizes[["row_start", "row_end"]].iloc[chr_idx]
+                np.testing.assert_allclose(bw_binner.binned_mat[row_start:row_end, 0], expected, rtol=1e-5)
+
+    @pytest.mark.parametrize("left_aligned", [False, True])
+    def test_fetch_windows(self, tmp_path, left_aligned):
+        windows = SimpleAGA.edge_windows(SimpleAGA.pybigwig_bin_edges(7, 4), 3)
+        # pyBigWig's bins of 7 bp: [0, 1), [1, 3), [3, 5), [5, 7), cut at the bins holding bp 3 and 6
+        assert(windows == [(0, 2), (2, 3), (3, 4)])
+        assert(SimpleAGA.edge_windows(SimpleAGA.left_bin_edges(10, 2), 100) == [(0, 5)])
+
+        # whatever the windows, the same as reading whole chromosomes
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 2, "test_windows")
+        binneds = {}
+        for window_bp in (3, 1, SimpleAGA.FETCH_WINDOW_BP):
+            for processes in (False, True):
+                with SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes.copy(), 2, processes=processes, n_workers=2, left_aligned=left_aligned, window_bp=window_bp) as bw_binner:
+                    bw_binner.load_bin_all_bws()
+                    binneds[window_bp, processes] = {
+                        "means": bw_binner.binned_mat,
+                        "blocks": np.concatenate([block.values for block in bw_binner.iter_blocks(block_bins=3)]),
+                        "runs": SimpleAGA.densify_tracks(bw_binner.load_bin_runs(np.inf)),
+                        **bw_binner.load_bin_stats(["mean", "max", "covered"]),
+                        "pyramid": bw_binner.load_bin_pyramid([2, 4]).means(4),
+                    }
+        expected = binneds[SimpleAGA.FETCH_WINDOW_BP, False]
+        for binned in binneds.values():
+            for name, values in binned.items():
+                np.testing.assert_array_equal(values, expected[name])
+        np.testing.assert_array_equal(expected["runs"], expected["means"])
+
+    @pytest.mark.parametrize("processes", [False, True])
+    def test_left_aligned(self, tmp_path, processes):
+        chrom_sizes = pd.DataFrame([
+            ("chr1", 10),
+            ("chr3", 7)], columns=["name", "size"])
+        '''
+        chr1: 0 1 0 1 0 1 0 1 0 1
+        chr3: 0 1 0 1 0 1 4
+        '''
+        chrom_sig_vals = pd.DataFrame({
+            "chrom_name": ["chr1"] * 10 + ["chr3"] * 7,
+            "start": list(range(10)) + list(range(7)),
+            "stop": list(range(1, 11)) + list(range(1, 8)),
+            "value": [0.0, 1.0] * 5 + [0.0, 1.0, 0.0, 1.0, 0.0, 1.0, 4.0],
+        })
+        write_test_bigWig(chrom_sizes, chrom_sig_vals, tmp_path / "test_left_aligned.bw", tmp_path / "test_left_aligned.chrom.sizes")
+
+        BIN_SIZE = 2
+        bw_binner = SimpleAGA.BigWigsBinner([tmp_path / "test_left_aligned.bw"], chrom_sizes, BIN_SIZE, processes=processes, n_workers=2, left_aligned=True)
+        binned_vals = bw_binner.load_bin_all_bws()
+        '''
+        binned vals, remainder bin at the end:
+        chr1: 0.5 0.5 0.5 0.5 0.5
+        chr3: 0.5 0.5 0.5 4
+        '''
+        np.testing.assert_array_equal(binned_vals[0][0], [0.5] * 5)
+        np.testing.assert_array_equal(binned_vals[0][1], [0.5, 0.5, 0.5, 4])
+        np.testing.assert_array_equal(bw_binner.bin_edges(1), [0, 2, 4, 6, 7])
+
+        blocks = list(bw_binner.iter_blocks(block_bins=3))
+        np.testing.assert_array_equal(np.concatenate([block.values for block in blocks]), bw_binner.binned_mat)
+
+    def test_load_bin_stats(self, tmp_path):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 1, "test_stats")
+        chrom_sizes = chrom_sizes.iloc[[1]].reset_index(drop=True)
+        '''
+        chr2: 0 1 2 3
+        '''
+        bw_binner = SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes, 2, left_aligned=True)
+        stat_mats = bw_binner.load_bin_stats(["mean", "max", "min", "covered", "sumsq", "std"])
+        np.testing.assert_array_equal(stat_mats["mean"][:, 0], [0.5, 2.5])
+        np.testing.assert_array_equal(stat_mats["max"][:, 0], [1, 3])
+        np.testing.assert_array_equal(stat_mats["min"][:, 0], [0, 2])
+        np.testing.assert_array_equal(stat_mats["covered"][:, 0], [2, 2])
+        np.testing.assert_array_equal(stat_mats["sumsq"][:, 0], [1, 13])
+        np.testing.assert_array_equal(stat_mats["std"][:, 0], [0.5, 0.5])
+
+        # the same means as binning them alone
+        bw_binner.load_bin_all_bws()
+        np.testing.assert_array_equal(stat_mats["mean"], bw_binner.binned_mat)
+
+    def test_bin_tasks_largest_first(self):
+        chrom_sizes = pd.DataFrame([
+            ("chr1", 10),
+            ("chr2", 4),
+            ("chr3", 7)], columns=["name", "size"])
+        tasks = SimpleAGA.proc_bigWigs.bin_tasks(chrom_sizes, 2)
+        assert(tasks == [(0, 0), (1, 0), (0, 2), (1, 2), (0, 1), (1, 1)])
+
+    def test_cli_tracks(self, tmp_path):
+        bw_dir = tmp_path / "bigwigs"
+        (bw_dir / "nested").mkdir(parents=True)
+        chrom_sizes, bw_paths = write_missing_tracks(bw_dir / "nested", 3, "test_cli")
+        bw_paths[1].rename(bw_dir / "test_cli_1.bigWig")
+        named_path = bw_dir / "test_cli_2.bw"
+        bw_paths[2].rename(named_path)
+        sizes_path = bw_dir / "nested" / "test_cli.chrom.sizes"
+        # every line of the sizes file is read, `--chroms` keeps them in its order
+        assert(SimpleAGA.parse_chromosome_sizes(sizes_path) == dict(chrom_sizes.itertuples(index=False, name=None)))
+        assert(list(SimpleAGA.parse_chromosome_sizes(sizes_path, ["chr3", "chr1"])) == ["chr1", "chr3"])
+        with pytest.raises(ValueError):
+            SimpleAGA.parse_chromosome_sizes(sizes_path, ["chrX"])
+
+        # a directory's bigWigs of any suffix, plus a named track
+        named_path.rename(tmp_path / "named.bw")
+        SimpleAGA.cli.main(["bin", "2", str(bw_dir), "--track", "H3K27ac", str(tmp_path / "named.bw"), "--chrom-sizes", str(sizes_path), "--chroms", "chr1", "chr3", "--out-dir", str(tmp_path / "binned")])
+        binned = SimpleAGA.BinnedTracks.load(tmp_path / "binned")
+        assert(list(binned.tracks["name"]) == ["test_cli_0", "test_cli_1", "H3K27ac"])
+        assert(list(binned.chroms["name"]) == ["chr1", "chr3"])
+        with SimpleAGA.BigWigsBinner([bw_dir / "nested" / "test_cli_0.bw", bw_dir / "test_cli_1.bigWig", tmp_path / "named.bw"], chrom_sizes.iloc[[0, 2]].copy(), 2) as bw_binner:
+            bw_binner.load_bin_all_bws()
+            np.testing.assert_array_equal(binned.values, bw_binner.binned_mat)
+
+        with pytest.raises(ValueError):
+            SimpleAGA.cli.main(["bin", "2", str(bw_dir), "--track", "test_cli_0", str(tmp_path / "named.bw"), "--chrom-sizes", str(sizes_path)])
+
 '''
 if __name__ == "__main__":
     DATA_DIR = Path().resolve().parent.parent / "data"
@@ -0,0 +1,64 @@
+'''
+Multi-resolution binning test script using pytest
+'''
+
+import numpy as np
+import pandas as pd
+from .context import SimpleAGA
+from .helpers import write_test_bigWig
+
+class TestBinPyramid:
+    def write_intervals_bigWig(self, tmp_path) -> tuple[pd.DataFrame, list, dict]:
+        '''
+        Intervals crossing bin boundaries, with gaps:
+        chr1 (25 bp): [0, 7) = 1, [7, 8) = 3, [12, 25) = 2
+        chr2 (9 bp):  [3, 6) = 4
+        '''
+        chrom_sizes = pd.DataFrame([("chr1", 25), ("chr2", 9)], columns=["name", "size"])
+        chrom_sig_vals = pd.DataFrame({
+            "chrom_name": ["chr1", "chr1", "chr1", "chr2"],
+            "start": [0, 7, 12, 3],
+            "stop": [7, 8, 25, 6],
+            "value": [1.0, 3.0, 2.0, 4.0],
+        })
+        bw_path = tmp_path / "test_pyramid.bw"
+        write_test_bigWig(chrom_sizes, chrom_sig_vals, bw_path, tmp_path / "test_pyramid.chrom.sizes")
+        # per base pair values, NaN where no interval
+        base_vals = {
+            "chr1": np.concatenate([np.full(7, 1.0), [3.0], np.full(4, np.nan), np.full(13, 2.0)]),
+            "chr2": np.concatenate([np.full(3, np.nan), np.full(3, 4.0), np.full(3, np.nan)]),
+        }
+        return chrom_sizes, [bw_path], base_vals
+
+    def test_levels_exact(self, tmp_path):
+        chrom_sizes, bw_paths, base_vals = self.write_intervals_bigWig(tmp_path)
+        bw_binner = SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes, 2)
+        pyramid = bw_binner.load_bin_pyramid([2, 4, 10])
+        assert(pyramid.resolutions == [2, 4, 10])
+
+        for res in pyramid.resolutions:
+            binned = pyramid.as_binned(res)
+            for chr_name, chr_vals in base_vals.items():
+                expected = []
+                for start in range(0, len(chr_vals), res):
+                    bin_vals = chr_vals[start:start + res]
+                    expected.append(np.nanmean(bin_vals) if (~np.isnan(bin_vals)).any() else np.nan)
+                np.testing.assert_allclose(binned.chrom_values(chr_name)[:, 0], expected)
+
+        # chr1 at 10 bp: [0, 10) has 7 bp of 1 and 1 bp of 3, [20, 25) is the short last bin
+        sums, covered = pyramid.levels[10]
+        assert(list(covered[:3, 0]) == [8, 8, 5])
+        np.testing.assert_allclose(sums[:3, 0], [10, 16, 10])
+        assert(pyramid.as_binned(10).missing.to_frame().empty)
+        assert(len(pyramid.as_binned(2).missing) == 3)
+
+    def test_save_load(self, tmp_path):
+        chrom_sizes, bw_paths, _ = self.write_intervals_bigWig(tmp_path)
+        pyramid = SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes, 2).load_bin_pyramid([4, 6])
+        pyramid.save(tmp_path / "pyramid.npz")
+
+        loaded = SimpleAGA.BinPyramid.load(tmp_path / "pyramid.npz", [6])
+        assert(loaded.resolutions == [6])
+        np.testing.assert_array_equal(loaded.means(6), pyramid.means(6))
+        assert(list(loaded.level_chroms(6)["n_bins"]) == [5, 2])
+        assert(list(loaded.tracks["name"]) == ["test_pyramid"])
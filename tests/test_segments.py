@@ -0,0 +1,89 @@
+'''
+Observed segments test script using pytest
+'''
+
+import numpy as np
+import pandas as pd
+from .context import SimpleAGA
+from .helpers import write_binned
+import pytest
+
+def brute_force_segments(values: np.ndarray, chroms: pd.DataFrame, min_bins: int, max_missing_frac: float) -> list[tuple[int, int, int]]:
+    '''
+    (chromosome, start, end) of every observed segment, bin by bin
+    '''
+    segments = []
+    for chr_idx, (row_start, row_end) in enumerate(zip(chroms["row_start"], chroms["row_end"])):
+        observed = np.isnan(values[row_start:row_end]).mean(axis=1) <= max_missing_frac
+        start = None
+        for bin_idx, is_observed in enumerate(list(observed) + [False]):
+            if is_observed and start is None:
+                start = bin_idx
+            elif not is_observed and start is not None:
+                if bin_idx - start >= min_bins:
+                    segments.append((chr_idx, start, bin_idx))
+                start = None
+    return segments
+
+class TestObservedSegments:
+    @pytest.mark.parametrize("min_bins,max_missing_frac", [(1, 0.0), (3, 0.0), (1, 0.5), (4, 0.5), (1, 1.0)])
+    def test_segments(self, tmp_path, min_bins, max_missing_frac):
+        binned = write_binned(tmp_path / "binned")
+        segments = SimpleAGA.ObservedSegments.from_binned(binned, min_bins, max_missing_frac)
+        expected = brute_force_segments(binned.values, binned.chroms, min_bins, max_missing_frac)
+        assert(list(zip(segments.chrom, segments.start, segments.end)) == expected)
+        assert(segments.n_bins == sum(end - start for _, start, end in expected))
+
+        # views of the matrix, and the compacted buffer, have the same rows
+        slices = segments.slices(binned.values)
+        assert(all(np.shares_memory(segment, binned.values) for segment in slices))
+        compacted = segments.compact(binned.values, tmp_path / "compacted.npy")
+        assert(compacted.flags.f_contiguous)
+        np.testing.assert_array_equal(np.concatenate(slices), compacted)
+        if max_missing_frac == 0.0:
+            assert(not np.isnan(compacted).any())
+
+    def test_missing_counts(self, tmp_path):
+        binned = write_binned(tmp_path / "binned")
+        np.testing.assert_array_equal(binned.missing.missing_counts(), np.isnan(binned.values).sum(axis=1))
+
+    def test_scatter(self, tmp_path):
+        binned = write_binned(tmp_path / "binned")
+        segments = SimpleAGA.ObservedSegments.from_binned(binned, min_bins=2)
+        n_rows = binned.values.shape[0]
+        in_segment = np.zeros(n_rows, dtype=bool)
+        in_segment[segments.genome_rows()] = True
+
+        # the compacted rows go back where they came from, and the rest stay missing
+        scattered = segments.scatter(segments.compact(binned.values))
+        np.testing.assert_array_equal(scattered[in_segment], binned.values[in_segment])
+        assert(np.isnan(scattered[~in_segment]).all())
+
+        # per segment results, e.g. Viterbi paths
+        paths = [np.full(length, seg_idx % 3, dtype=np.uint8) for seg_idx, length in enumerate(segments.lengths)]
+        scattered = segments.scatter(paths, n_rows, fill=255)
+        assert(scattered.dtype == np.uint8)
+        np.testing.assert_array_equal(scattered[in_segment], np.concatenate(paths))
+        assert((scattered[~in_segment] == 255).all())
+        # missing as NaN: integers go to float64, not float16, and stay exact
+        scattered = segments.scatter(paths, n_rows)
+        assert(scattered.dtype == np.float64)
+        np.testing.assert_array_equal(scattered[in_segment], np.concatenate(paths))
+        assert(np.isnan(scattered[~in_segment]).all())
+        seg_ids = [np.full(length, 70_000 + seg_idx, dtype=np.int32) for seg_idx, length in enumerate(segments.lengths)]
+        np.testing.assert_array_equal(segments.scatter(seg_ids, n_rows)[in_segment], np.concatenate(seg_ids))
+        assert(segments.scatter(segments.compact(binned.values).astype(np.float32)).dtype == np.float32)
+        assert(segments.scatter(paths, n_rows, fill=-1, dtype=np.int16).dtype == np.int16)
+
+        frame = segments.to_frame()
+        assert(list(frame["chrom"].unique()) == list(binned.chroms["name"]))
+
+    def test_train_on_segments(self, tmp_path):
+        write_binned(tmp_path / "binned")
+        trainer = SimpleAGA.EMTrainer(tmp_path / "binned", 2, parallel=False, seed=0, max_missing_frac=0.0, min_segment_bins=2)
+        model = trainer.fit(n_iters=3, tol=0)
+        values = trainer.segments.compact(trainer.binned.values)
+        assert(not np.isnan(values).any())
+        assert(len(trainer.log_likelihoods) == 3)
+        assert(trainer.log_likelihoods[-1] > trainer.log_likelihoods[0])
+        assert(model.means.shape == (2, 2))
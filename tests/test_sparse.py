@@ -0,0 +1,98 @@
+'''
+Run-length sparse tracks test script using pytest
+'''
+
+import numpy as np
+from .context import SimpleAGA
+from .helpers import write_missing_tracks
+import pytest
+
+def random_track(rng: np.random.Generator, n_bins: int, missing_frac: float) -> np.ndarray:
+    values = np.repeat(rng.integers(0, 3, size=n_bins).astype(np.float64), rng.integers(1, 6, size=n_bins))[:n_bins]
+    values[np.repeat(rng.random(n_bins) < missing_frac, 4)[:n_bins]] = np.nan
+    return values
+
+class TestRunLengthTrack:
+    def test_bin_interval_runs(self):
+        rng = np.random.default_rng(0)
+        for _ in range(200):
+            size = int(rng.integers(1, 300))
+            bp = np.unique(rng.integers(0, size + 1, size=int(rng.integers(2, 40))))
+            keep = rng.random(len(bp) - 1) < 0.6
+            starts, ends = bp[:-1][keep], bp[1:][keep]
+            values = rng.integers(0, 3, size=len(starts)).astype(np.float64)
+            values[rng.random(len(starts)) < 0.15] = np.nan
+            for bin_edges in (SimpleAGA.left_bin_edges(size, int(rng.integers(1, 20))), SimpleAGA.pybigwig_bin_edges(size, int(rng.integers(1, size + 1)))):
+                run_starts, run_lengths, run_values = SimpleAGA.bin_interval_runs(starts, ends, values, bin_edges)
+                track = SimpleAGA.RunLengthTrack(run_starts, run_lengths, run_values, len(bin_edges) - 1)
+                means = SimpleAGA.bin_interval_means(starts, ends, values, bin_edges)
+                np.testing.assert_allclose(track.densify(), means)
+                # bins with a NaN interval are missing, not NaN runs
+                assert(not np.isnan(run_values).any())
+                np.testing.assert_array_equal(track.missing_mask(), np.isnan(means))
+                # runs are as few as can be
+                assert(not ((run_starts[:-1] + run_lengths[:-1] == run_starts[1:]) & (run_values[:-1] == run_values[1:])).any())
+
+    def test_dense_round_trip(self, tmp_path):
+        rng = np.random.default_rng(1)
+        values = random_track(rng, 1000, 0.3)
+        track = SimpleAGA.RunLengthTrack.from_dense(values)
+        assert(track.n_runs < 1000)
+        assert(track.density == pytest.approx(np.mean(~np.isnan(values))))
+        np.testing.assert_array_equal(track.densify(), values)
+        for start, end in [(0, 1), (17, 350), (999, 1000), (400, 400)]:
+            np.testing.assert_array_equal(track.densify(start, end), values[start:end])
+            np.testing.assert_array_equal(track.missing_mask(start, end), np.isnan(values[start:end]))
+
+        track.save(tmp_path / "track.npz")
+        loaded = SimpleAGA.RunLengthTrack.load(tmp_path / "track.npz")
+        np.testing.assert_array_equal(loaded.densify(), values)
+
+    def test_tracks_ops(self):
+        rng = np.random.default_rng(2)
+        dense = np.stack([random_track(rng, 500, missing_frac) for missing_frac in (0.0, 0.5, 0.9)], axis=1)
+        tracks = [SimpleAGA.RunLengthTrack.from_dense(dense[:, 0]), dense[:, 1], SimpleAGA.RunLengthTrack.from_dense(dense[:, 2])]
+        np.testing.assert_array_equal(SimpleAGA.densify_tracks(tracks, 20, 480), dense[20:480])
+        np.testing.assert_array_equal(SimpleAGA.missing_masks(tracks), np.isnan(dense))
+        sums, counts = SimpleAGA.sum_tracks(tracks, 5, 495)
+        np.testing.assert_allclose(sums, np.nansum(dense[5:495], axis=1))
+        np.testing.assert_array_equal(counts, (~np.isnan(dense[5:495])).sum(axis=1))
+
+        # mostly missing tracks stay runs, varying ones get densified
+        assert(isinstance(SimpleAGA.choose_storage(tracks[2]), SimpleAGA.RunLengthTrack))
+        varying = SimpleAGA.RunLengthTrack.from_dense(rng.random(500))
+        densified = SimpleAGA.choose_storage(varying, np.float32)
+        assert(isinstance(densified, np.ndarray) and densified.dtype == np.float32)
+
+    @pytest.mark.parametrize("left_aligned", [False, True])
+    def test_load_bin_runs(self, tmp_path, left_aligned):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 2, f"test_runs_{left_aligned}")
+        with SimpleAGA.BigWigsBinner(bw_paths, chrom_sizes.copy(), 2, left_aligned=left_aligned) as bw_binner:
+            bw_binner.load_bin_all_bws()
+            for max_ratio in (0.0, np.inf):
+                binned_tracks = bw_binner.load_bin_runs(max_ratio)
+                assert(all(isinstance(binned_track, SimpleAGA.RunLengthTrack) == (max_ratio == np.inf) for binned_track in binned_tracks))
+                np.testing.assert_allclose(SimpleAGA.densify_tracks(binned_tracks), bw_binner.binned_mat, rtol=1e-6)
+                # the fixture's NaN intervals make missing bins, in every track op
+                np.testing.assert_array_equal(SimpleAGA.missing_masks(binned_tracks), np.isnan(bw_binner.binned_mat))
+                for binned_track, col in zip(binned_tracks, bw_binner.binned_mat.T):
+                    if isinstance(binned_track, SimpleAGA.RunLengthTrack):
+                        np.testing.assert_array_equal(binned_track.missing_mask(), np.isnan(col))
+                sums, counts = SimpleAGA.sum_tracks(binned_tracks)
+                np.testing.assert_allclose(sums, np.nansum(bw_binner.binned_mat, axis=1))
+                np.testing.assert_array_equal(counts, (~np.isnan(bw_binner.binned_mat)).sum(axis=1))
+
+                # saved and loaded back as they were, runs and dense columns alike
+                SimpleAGA.save_tracks(tmp_path / "runs.npz", binned_tracks)
+                loaded = SimpleAGA.load_tracks(tmp_path / "runs.npz")
+                assert([type(track) for track in loaded] == [type(track) for track in binned_tracks])
+                np.testing.assert_array_equal(SimpleAGA.densify_tracks(loaded), SimpleAGA.densify_tracks(binned_tracks))
+
+    def test_cli_runs(self, tmp_path):
+        chrom_sizes, bw_paths = write_missing_tracks(tmp_path, 2, "test_cli_runs")
+        SimpleAGA.cli.main(["bin", "2", *map(str, bw_paths), "--chrom-sizes", str(tmp_path / "test_cli_runs.chrom.sizes"), "--runs", "--out-dir", str(tmp_path / "binned")])
+        binned = SimpleAGA.BinnedTracks.load(tmp_path / "binned")
+        loaded = SimpleAGA.load_tracks(tmp_path / "binned" / "runs.npz")
+        # tracks in the order of the binned matrix' columns
+        assert(len(loaded) == len(binned.tracks.index) == 2)
+        np.testing.assert_array_equal(SimpleAGA.densify_tracks(loaded), binned.values)
@@ -0,0 +1,57 @@
+'''
+Parallel EM training test script using pytest
+'''
+
+import numpy as np
+import pandas as pd
+from .context import SimpleAGA
+from .helpers import write_binned
+import pytest
+
+class TestEMTrainer:
+    def test_chrom_groups(self):
+        chroms = pd.DataFrame({"n_bins": [100, 10, 60, 50, 5]})
+        groups = SimpleAGA.chrom_groups(chroms, 2)
+        assert(groups == [[0, 1, 4], [2, 3]])
+        assert(SimpleAGA.chrom_groups(chroms, 10) == [[0], [2], [3], [1], [4]])
+
+    def test_track_weights(self, tmp_path):
+        binned = write_binned(tmp_path / "binned")
+        weights = SimpleAGA.observed_track_weights(binned.missing)
+        n_observed = (~np.isnan(binned.values)).sum(axis=0)
+        np.testing.assert_allclose(weights, n_observed / n_observed.max())
+        assert(weights[0] == 1.0 and weights[1] < 0.6)
+
+    def test_parallel_matches_sequential(self, tmp_path):
+        binned = write_binned(tmp_path / "binned")
+
+        par_trainer = SimpleAGA.EMTrainer(tmp_path / "binned", 2, n_workers=2, chunk_bins=300, seed=0)
+        assert(len(par_trainer.row_groups) == 2)
+        par_model = par_trainer.fit(n_iters=4, tol=0)
+        seq_trainer = SimpleAGA.EMTrainer(tmp_path / "binned", 2, parallel=False, chunk_bins=300, seed=0)
+        seq_model = seq_trainer.fit(n_iters=4, tol=0)
+        np.testing.assert_allclose(par_trainer.log_likelihoods, seq_trainer.log_likelihoods)
+        np.testing.assert_allclose(par_model.means, seq_model.means)
+        np.testing.assert_allclose(par_model.trans_probs, seq_model.trans_probs)
+
+        # the same as EM on the chromosomes in this process
+        model = SimpleAGA.GaussianHMM.from_data(binned.values, 2, seed=0, track_weights=par_trainer.track_weights)
+        log_likelihoods = model.fit([binned.chrom_values(chrom) for chrom in binned.chroms["name"]], n_iters=4, tol=-np.inf, chunk_bins=300)
+        np.testing.assert_allclose(par_trainer.log_likelihoods, log_likelihoods)
+        np.testing.assert_allclose(par_model.variances, model.variances)
+
+    def test_resume_from_checkpoint(self, tmp_path):
+        write_binned(tmp_path / "binned")
+        checkpoint_dir = tmp_path / "checkpoint"
+
+        first = SimpleAGA.EMTrainer(tmp_path / "binned", 2, parallel=False, checkpoint_dir=checkpoint_dir, seed=0)
+        first.fit(n_iters=2, tol=0)
+        assert((checkpoint_dir / "model.npz").exists())
+        resumed = SimpleAGA.EMTrainer(tmp_path / "binned", 2, parallel=False, checkpoint_dir=checkpoint_dir, seed=1)
+        resumed_model = resumed.fit(n_iters=4, tol=0)
+        assert(len(resumed.log_likelihoods) == 4)
+
+        straight = SimpleAGA.EMTrainer(tmp_path / "binned", 2, parallel=False, seed=0)
+        straight_model = straight.fit(n_iters=4, tol=0)
+        np.testing.assert_allclose(resumed.log_likelihoods, straight.log_likelihoods)
+        np.testing.assert_allclose(resumed_model.means, straight_model.means)
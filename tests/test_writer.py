@@ -0,0 +1,109 @@
+'''
+Segmentation writer test script using pytest
+'''
+
+import numpy as np
+import pandas as pd
+import pyBigWig
+from .context import SimpleAGA
+from .helpers import write_binned
+import pytest
+
+class TestSegmentationWriter:
+    CHROMS = SimpleAGA.chrom_table({"chr1": 1050, "chr2": 430}, 100)
+
+    def test_value_runs(self):
+        starts, ends, run_values = SimpleAGA.value_runs(np.array([2, 2, 0, 0, 0, 1, 2, 2], dtype=np.uint8))
+        np.testing.assert_array_equal(starts, [0, 2, 5, 6])
+        np.testing.assert_array_equal(ends, [2, 5, 6, 8])
+        np.testing.assert_array_equal(run_values, [2, 0, 1, 2])
+
+        starts, ends, run_values = SimpleAGA.value_runs(np.array([np.nan, np.nan, 0.5, 0.5, np.nan, 0.25]))
+        np.testing.assert_array_equal(starts, [2, 5])
+        np.testing.assert_array_equal(ends, [4, 6])
+        np.testing.assert_array_equal(run_values, [0.5, 0.25])
+
+    @pytest.mark.parametrize("left_aligned", [False, True])
+    def test_bed(self, tmp_path, left_aligned):
+        rng = np.random.default_rng(0)
+        states = np.repeat(rng.integers(0, 3, size=16), 1 + rng.integers(0, 3, size=16)).astype(np.uint8)
+        states = np.resize(states, self.CHROMS["n_bins"].sum())
+        states[3] = 255
+        writer = SimpleAGA.SegmentationWriter(self.CHROMS, 100, left_aligned)
+        writer.write_bed(tmp_path / "states.bed", states, state_names=["E1", "E2", "E3"], track_name="test", skip_state=255)
+
+        bed = pd.read_csv(tmp_path / "states.bed", sep="\t", header=None, skiprows=1, names=["chrom", "start", "end", "name", "score", "strand", "thick_start", "thick_end", "rgb"])
+        # no two adjacent runs of the same state
+        same_chrom = bed["chrom"].shift() == bed["chrom"]
+        assert(not (same_chrom & (bed["end"].shift() == bed["start"]) & (bed["name"].shift() == bed["name"])).any())
+        assert(set(bed["rgb"]) <= set(SimpleAGA.state_colors(3)))
+        # expanding the runs back to bins gives the states
+        for chr_idx, (chr_name, row_start, row_end) in enumerate(self.CHROMS[["name", "row_start", "row_end"]].itertuples(index=False, name=None)):
+            chr_bed = bed[bed["chrom"] == chr_name]
+            bin_edges = writer.bin_edges(chr_idx)
+            expanded = np.full(row_end - row_start, 255)
+            for start, end, name in chr_bed[["start", "end", "name"]].itertuples(index=False, name=None):
+                expanded[np.searchsorted(bin_edges, start):np.searchsorted(bin_edges, end)] = int(name[1:]) - 1
+            np.testing.assert_array_equal(expanded, states[row_start:row_end])
+            # the last bin is cut short at the chromosome end
+            assert(chr_bed["end"].iat[-1] == bin_edges[-1] == self.CHROMS["size"].iat[chr_idx])
+
+    @pytest.mark.parametrize("parallel", [False, True])
+    def test_posterior_bigWigs(self, tmp_path, parallel):
+        rng = np.random.default_rng(1)
+        n_bins = int(self.CHROMS["n_bins"].sum())
+        posteriors = np.lib.format.open_memmap(tmp_path / "posteriors.npy", mode="w+", dtype=np.float32, shape=(n_bins, 2), fortran_order=True)
+        posteriors[:, 0] = np.round(rng.random(n_bins), 1)
+        posteriors[:, 1] = 1 - posteriors[:, 0]
+        posteriors[5:8] = np.nan
+
+        writer = SimpleAGA.SegmentationWriter(self.CHROMS, 100, left_aligned=True)
+        bw_paths = writer.write_posterior_bigWigs(tmp_path / "out", posteriors, parallel=parallel, n_workers=2, chunk_bins=4)
+        assert([bw_path.name for bw_path in bw_paths] == ["posterior_0.bw", "posterior_1.bw"])
+        for state, bw_path in enumerate(bw_paths):
+            bw = pyBigWig.open(str(bw_path))
+            assert(bw.chroms() == dict(zip(self.CHROMS["name"], self.CHROMS["size"])))
+            for chr_idx, (chr_name, row_start, row_end) in enumerate(self.CHROMS[["name", "row_start", "row_end"]].itertuples(index=False, name=None)):
+                binned = SimpleAGA.bin_chrom(bw, chr_name, int(self.CHROMS["size"].iat[chr_idx]), row_end - row_start, 100, left_aligned=True)
+                np.testing.assert_allclose(binned, posteriors[row_start:row_end, state], rtol=1e-6)
+            bw.close()
+
+    def test_decode(self, tmp_path):
+        binned = write_binned(tmp_path / "binned")
+        model = SimpleAGA.GaussianHMM.from_data(binned.values, 2, seed=0)
+        states, posteriors = SimpleAGA.writer.decode(binned, model, tmp_path / "posteriors.npy", chunk_bins=300)
+        assert(len(states) == len(posteriors) == binned.values.shape[0])
+        np.testing.assert_allclose(posteriors.sum(axis=1), 1, rtol=1e-5)
+        chr2_values = binned.chrom_values("chr2")
+        row_start, row_end = binned.chrom_rows("chr2")
+        np.testing.assert_allclose(posteriors[row_start:row_end], model.posteriors(chr2_values), rtol=1e-4, atol=1e-6)
+        np.testing.assert_array_equal(states[row_start:row_end], model.viterbi([chr2_values])[0][0])
+
+    def test_bed_scattered(self, tmp_path):
+        # states scattered back without a fill are float64, NaN where unobserved
+        binned = write_binned(tmp_path / "binned")
+        segments = SimpleAGA.ObservedSegments.from_binned(binned, min_bins=2)
+        paths = [np.full(length, seg_idx % 3, dtype=np.uint8) for seg_idx, length in enumerate(segments.lengths)]
+        states = segments.scatter(paths, binned.values.shape[0])
+        assert(np.isnan(states).any())
+        writer = SimpleAGA.SegmentationWriter(binned.chroms, binned.bin_size)
+        writer.write_bed(tmp_path / "states.bed", states)
+        bed = pd.read_csv(tmp_path / "states.bed", sep="\t", header=None, names=["chrom", "start", "end", "name", "score", "strand", "thick_start", "thick_end", "rgb"], dtype={"name": str})
+        assert(set(bed["name"]) == {"0", "1", "2"})
+        assert((bed["end"] - bed["start"]).sum() == (~np.isnan(states)).sum())
+
+    @pytest.mark.parametrize("left_aligned", [False, True])
+    def test_segment_layout(self, tmp_path, left_aligned):
+        rng = np.random.default_rng(0)
+        values = rng.normal(size=(int(self.CHROMS["n_bins"].sum()), 2))
+        tracks = pd.DataFrame({"name": ["a", "b"], "path": ["a.bw", "b.bw"]})
+        SimpleAGA.save_binned(tmp_path / "binned", values, self.CHROMS, tracks, 100, left_aligned)
+        SimpleAGA.GaussianHMM.from_data(values, 2, seed=0).save(tmp_path / "model.npz")
+        # the layout saved with the bins by default, either one if asked for
+        for layout, layout_left in [("saved", left_aligned), ("pybigwig", False), ("left", True)]:
+            SimpleAGA.cli.main(["segment", str(tmp_path / "binned"), str(tmp_path / "model.npz"), "--out-dir", str(tmp_path / layout), "--layout", layout])
+            bed = pd.read_csv(tmp_path / layout / "segmentation.bed", sep="\t", header=None, skiprows=1, usecols=[0, 1, 2], names=["chrom", "start", "end"])
+            bin_edges = SimpleAGA.SegmentationWriter(self.CHROMS, 100, layout_left).bin_edges(0)
+            chr1_bed = bed[bed["chrom"] == "chr1"]
+            assert(np.isin(chr1_bed[["start", "end"]].to_numpy(), bin_edges).all())
+        assert((tmp_path / "pybigwig" / "segmentation.bed").read_text() != (tmp_path / "left" / "segmentation.bed").read_text())